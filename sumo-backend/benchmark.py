@@ -0,0 +1,418 @@
+"""
+Benchmarks do backend.
+
+Uso (dentro do container):
+    python benchmark.py snapshot [--scenario /app/scenarios/<job_id>] --steps 2000
+    python benchmark.py netparse --sizes 30,60,120,250 [--net /app/scenarios/simulacao.net.xml]
+    python benchmark.py ai [--scenario ...] --duration 3600 [--strategies max_pressure,webster]
+    python benchmark.py backend [--scenario ...] --steps 2000 [--ai max_pressure]
+    python benchmark.py viewport [--scenario ...] --warmup 1200 --frames 100 --area 0.05
+    python benchmark.py demand --sizes 30,60 --vehicles 1000,10000 [--net ...] [--random-trips]
+
+Sem --scenario, snapshot/ai/backend/viewport rodam numa grade sintética
+(--grid NxN com --grid-vehicles veículos), como netparse e demand.
+"""
+import gc
+import os
+import json
+import math
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+import xml.etree.ElementTree as ET
+import numpy as np
+import traci
+
+import sim_backend
+from headless import SUMO_ARGS, scenario_cmd, scenario_net, grid_net, grid_scenario
+from snapshot import SimulationSnapshot
+from projection import NetProjection
+from net_stream import iter_net
+from dynamic_controller import TrafficAI
+from signal_control import STRATEGIES
+from protocol import JsonEncoder, DeltaEncoder
+from spatial import GridIndex, density, load_tls_positions
+
+def legacy_frame():
+    """Caminho antigo do /ws: ~5 chamadas TraCI por veículo por passo."""
+    vehicles = []
+    for veh_id in traci.vehicle.getIDList():
+        x, y = traci.vehicle.getPosition(veh_id)
+        lon, lat = traci.simulation.convertGeo(x, y)
+        vehicles.append({
+            "id": veh_id,
+            "lat": lat,
+            "lon": lon,
+            "angle": traci.vehicle.getAngle(veh_id),
+            "speed": traci.vehicle.getSpeed(veh_id),
+            "distance": traci.vehicle.getDistance(veh_id)
+        })
+    tls_states = {tls: traci.trafficlight.getRedYellowGreenState(tls) for tls in traci.trafficlight.getIDList()}
+    return {"time": traci.simulation.getTime(), "vehicles": vehicles, "traffic_lights": tls_states}
+
+
+def _run_legacy(steps):
+    n = 0
+    while n < steps and traci.simulation.getMinExpectedNumber() > 0:
+        traci.simulationStep()
+        legacy_frame()
+        n += 1
+    return n
+
+
+def _run_snapshot(steps, geo=None):
+    snap = SimulationSnapshot(traci, geo=geo)
+    snap.start()
+    n = 0
+    while n < steps and snap.running():
+        snap.step().to_json()
+        n += 1
+    return n
+
+
+def bench_snapshot(scenario_dir, steps):
+    cmd = scenario_cmd(scenario_dir)
+    geo = NetProjection.from_net_file(scenario_net(scenario_dir))
+    runners = (
+        ("per-call", _run_legacy),
+        ("subscription", _run_snapshot),
+        ("subscr+proj", lambda n: _run_snapshot(n, geo=geo)),
+    )
+    results = {}
+    for name, runner in runners:
+        traci.start(cmd)
+        try:
+            t0 = time.perf_counter()
+            n = runner(steps)
+            elapsed = time.perf_counter() - t0
+        finally:
+            traci.close()
+        results[name] = n / elapsed if elapsed else 0.0
+        print(f"{name:>14}: {n} passos em {elapsed:.2f}s -> {results[name]:.1f} passos/s")
+    if results.get("per-call"):
+        for name in ("subscription", "subscr+proj"):
+            print(f"{'speedup':>14}: {name} {results[name] / results['per-call']:.2f}x")
+    return results
+
+
+class LegacyAI:
+    """TrafficAI antigo: por faixa, a cada passo, e setPhaseDuration(60) sempre que a fila passa de 10."""
+
+    def __init__(self, conn=traci):
+        self.conn = conn
+        self.writes = 0
+
+    def step(self, now=None):
+        conn, logs = self.conn, []
+        for tls_id in conn.trafficlight.getIDList():
+            controlled_lanes = conn.trafficlight.getControlledLanes(tls_id)
+            max_queue, total_wait = 0, 0
+            for lane in controlled_lanes:
+                max_queue = max(max_queue, conn.lane.getLastStepHaltingNumber(lane))
+                total_wait += conn.lane.getWaitingTime(lane)
+            conn.trafficlight.getPhase(tls_id)
+            logs.append({"traffic_light_id": tls_id, "queue_length": max_queue,
+                         "avg_wait_time": total_wait / (len(controlled_lanes) or 1), "is_ai_active": True})
+            if max_queue > 10:
+                conn.trafficlight.setPhaseDuration(tls_id, 60)
+                self.writes += 1
+        return logs
+
+
+def _tripinfo_wait(path):
+    """(espera média por viagem em s, viagens concluídas) do tripinfo-output."""
+    waits = [float(e.get("waitingTime")) for _, e in ET.iterparse(path) if e.tag == "tripinfo"]
+    return (sum(waits) / len(waits) if waits else 0.0), len(waits)
+
+
+def _run_controller(cmd, duration, controller):
+    """Roda até duration segundos simulados; (segundos gastos no controlador, tempo simulado, espera, viagens)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        tripinfo = os.path.join(tmp, "tripinfo.xml")
+        traci.start(cmd + ["--tripinfo-output", tripinfo])
+        try:
+            spent, now = 0.0, 0.0
+            while now < duration and traci.simulation.getMinExpectedNumber() > 0:
+                traci.simulationStep()
+                now = traci.simulation.getTime()
+                if controller is None: continue
+                t0 = time.perf_counter()
+                controller.step(now)
+                spent += time.perf_counter() - t0
+        finally:
+            traci.close()
+        return (spent, now) + _tripinfo_wait(tripinfo)
+
+
+def bench_ai(scenario_dir, duration, strategies):
+    """Tempo fixo vs IA antiga vs estratégias: espera média, escritas TraCI por hora e custo por passo."""
+    cmd = scenario_cmd(scenario_dir)
+    step_length = float(SUMO_ARGS[SUMO_ARGS.index("--step-length") + 1])
+    runs = [("tempo fixo", None), ("ia antiga", LegacyAI())]
+    runs += [(name, TrafficAI(ai_enabled=True, strategy=name)) for name in strategies]
+    results = {}
+    print(f"{'controle':>14} {'espera média':>13} {'viagens':>8} {'escritas/h':>11} {'ms/passo':>9}")
+    for name, controller in runs:
+        spent, sim_s, wait, trips = _run_controller(cmd, duration, controller)
+        writes = controller.writes * 3600 / sim_s if controller and sim_s else 0.0
+        ms = spent * 1000 / (sim_s / step_length) if sim_s else 0.0
+        results[name] = {"wait_s": wait, "trips": trips, "writes_per_h": writes, "ms_per_step": ms}
+        print(f"{name:>14} {wait:12.1f}s {trips:8d} {writes:11.0f} {ms:9.3f}")
+    return results
+
+
+def bench_backend(scenario_dir, steps, ai=None):
+    """Loop do /ws (snapshot + projeção + IA opcional) em TraCI e em libsumo: passos/s."""
+    cmd = scenario_cmd(scenario_dir)
+    geo = NetProjection.from_net_file(scenario_net(scenario_dir))
+    results = {}
+    for backend in ("traci", "libsumo"):
+        if backend == "libsumo" and not sim_backend.HAS_LIBSUMO:
+            print(f"{backend:>10}: não instalado")
+            continue
+        conn = sim_backend.start(cmd, f"bench-{backend}", backend)
+        try:
+            snap = SimulationSnapshot(conn, geo=geo)
+            snap.start()
+            controller = TrafficAI(ai_enabled=True, conn=conn, strategy=ai) if ai else None
+            if controller: controller.start()
+            n, t0 = 0, time.perf_counter()
+            while n < steps and snap.running():
+                frame = snap.step()
+                if controller: controller.step(frame.time)
+                n += 1
+            elapsed = time.perf_counter() - t0
+        finally:
+            conn.close()
+        results[backend] = n / elapsed if elapsed else 0.0
+        print(f"{backend:>10}: {n} passos em {elapsed:.2f}s -> {results[backend]:.1f} passos/s")
+    if len(results) == 2 and results["traci"]:
+        print(f"{'speedup':>10}: {results['libsumo'] / results['traci']:.2f}x")
+    return results
+
+
+def readnet_extract(net_file):
+    """Caminho anterior do gerador: readNet + lista de ruas + lista de semáforos."""
+    import sumolib
+    from net_stream import road_record
+    net = sumolib.net.readNet(net_file)
+    proj = NetProjection.from_net_file(net_file)
+    edges = [e for e in net.getEdges() if e.getFunction() != "internal"]
+    shapes = [e.getShape() for e in edges]
+    lonlat = proj.to_lonlat([p for shape in shapes for p in shape]).tolist()
+    roads, i = [], 0
+    for edge, shape in zip(edges, shapes):
+        roads.append(road_record(edge.getID(), edge.getName(), edge.getSpeed(),
+                                 [[lat, lon] for lon, lat in lonlat[i:i + len(shape)]]))
+        i += len(shape)
+    sites = []
+    for tls in net.getTrafficLights():
+        conns = tls.getConnections()
+        if not conns: continue
+        lon, lat = net.convertXY2LonLat(*conns[0][0].getShape()[-1])
+        sites.append({"id": tls.getID(), "latitude": lat, "longitude": lon})
+    return len(roads), len(sites)
+
+
+def stream_extract(net_file):
+    """Caminho novo: lotes descartados logo após o uso (como no upsert)."""
+    counts = {"road": 0, "tls": 0}
+    for kind, batch in iter_net(net_file):
+        counts[kind] += len(batch)
+    return counts["road"], counts["tls"]
+
+
+def _measure(fn, net_file):
+    """(segundos, pico MB do Python, resultado). Tempo medido sem o tracemalloc ligado."""
+    gc.collect()
+    t0 = time.perf_counter()
+    result = fn(net_file)
+    elapsed = time.perf_counter() - t0
+    gc.collect()
+    tracemalloc.start()
+    fn(net_file)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2**20, result
+
+
+def bench_netparse(nets=(), sizes=(), work_dir=None):
+    work_dir = work_dir or tempfile.mkdtemp(prefix="netparse-")
+    nets = list(nets) + [grid_net(size, work_dir) for size in sizes]
+    print(f"{'net':>22} {'MB':>7} {'ruas':>7} {'tls':>6} | {'readNet s':>9} {'pico MB':>8} | {'stream s':>8} {'pico MB':>8}")
+    for net_file in nets:
+        size_mb = os.path.getsize(net_file) / 2**20
+        t_old, m_old, (roads, tls) = _measure(readnet_extract, net_file)
+        t_new, m_new, counts = _measure(stream_extract, net_file)
+        if counts != (roads, tls): print(f"  AVISO: contagens diferentes {counts} != {(roads, tls)}")
+        print(f"{os.path.basename(net_file):>22} {size_mb:7.1f} {roads:7d} {tls:6d} | "
+              f"{t_old:9.2f} {m_old:8.1f} | {t_new:8.2f} {m_new:8.1f}")
+
+
+def _random_trips(net_file, out, vehicles, duration):
+    trips = out + ".trips.xml"
+    script = os.path.join(os.environ.get("SUMO_HOME", "/usr/share/sumo"), "tools", "randomTrips.py")
+    try:
+        subprocess.run([sys.executable, script, "-n", net_file, "-r", out, "-o", trips, "-e", str(duration),
+                        "-p", str(duration / vehicles), "--validate"], check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    finally:
+        if os.path.exists(trips): os.remove(trips)
+
+
+def bench_demand(nets=(), sizes=(), vehicles=(1000, 10000), duration=3600, random_trips=False, work_dir=None):
+    """Tempo e tamanho da demanda por modo do demand.py (rede já carregada = gerações seguintes)."""
+    from demand import MODES, generate_demand, load_net
+    work_dir = work_dir or tempfile.mkdtemp(prefix="demand-")
+    nets = list(nets) + [grid_net(size, work_dir) for size in sizes]
+    out = os.path.join(work_dir, "bench.rou.xml")
+    print(f"{'net':>22} {'veíc':>6} {'modo':>12} {'s':>7} {'KB':>8} {'linhas':>7}")
+    for net_file in nets:
+        name = os.path.basename(net_file)
+        t0 = time.perf_counter()
+        load_net(net_file)
+        print(f"{name:>22} {'':>6} {'(leitura)':>12} {time.perf_counter() - t0:7.2f}")
+        for n in vehicles:
+            for mode in MODES:
+                stats = generate_demand(net_file, out, n, duration, mode=mode)
+                print(f"{name:>22} {n:6d} {mode:>12} {stats['elapsed_s']:7.2f} {stats['bytes'] / 1024:8.0f} {stats['lines']:7d}")
+            if random_trips:
+                t0 = time.perf_counter()
+                _random_trips(net_file, out, n, duration)
+                print(f"{name:>22} {n:6d} {'randomTrips':>12} {time.perf_counter() - t0:7.2f} "
+                      f"{os.path.getsize(out) / 1024:8.0f}")
+
+
+def _collect_frames(scenario_dir, warmup, count):
+    traci.start(scenario_cmd(scenario_dir))
+    try:
+        snap = SimulationSnapshot(traci, geo=NetProjection.from_net_file(scenario_net(scenario_dir)))
+        snap.start()
+        frames = []
+        for n in range(warmup + count):
+            if not snap.running(): break
+            frame = snap.step()
+            if n >= warmup: frames.append(frame)
+        return frames
+    finally:
+        traci.close()
+
+
+def _encode_stream(frames, encode):
+    """(ms por frame, bytes por frame) codificando a sequência inteira."""
+    t0 = time.perf_counter()
+    size = sum(len(encode(frame)) for frame in frames)
+    return (time.perf_counter() - t0) * 1000 / len(frames), size / len(frames)
+
+
+def bench_viewport(scenario_dir, warmup, count, area, zoom_low):
+    frames = _collect_frames(scenario_dir, warmup, count)
+    if not frames: raise RuntimeError("Nenhum frame coletado (warmup maior que a simulação?)")
+    lonlat = np.concatenate([f.lonlat for f in frames if len(f)])
+    (w, s), (e, n) = lonlat.min(axis=0), lonlat.max(axis=0)
+    # Viewport centrado cobrindo 'area' da extensão ocupada pelos veículos
+    half = math.sqrt(area) / 2
+    cy, cx, dy, dx = (s + n) / 2, (w + e) / 2, (n - s) * half, (e - w) * half
+    bbox = (cy - dy, cx - dx, cy + dy, cx + dx)
+
+    # Semáforos recortados como no FrameBroadcaster (índice fixo da sessão)
+    tls_ids, tls_lonlat = load_tls_positions(scenario_net(scenario_dir))
+    visible = {tls_ids[i] for i in GridIndex(tls_lonlat).query(bbox).tolist()}
+
+    def view(frame):
+        tls = {k: v for k, v in frame.tls.items() if k in visible}
+        return frame.subset(GridIndex(frame.lonlat).query(bbox), tls)
+
+    json_enc, delta_full, delta_view = JsonEncoder(), DeltaEncoder(), DeltaEncoder()
+    rows = [
+        ("json rede inteira", lambda f: json_enc.encode(f)),
+        ("json viewport", lambda f: json_enc.encode(view(f))),
+        ("delta rede inteira", lambda f: delta_full.encode(f)),
+        ("delta viewport", lambda f: delta_view.encode(view(f))),
+        (f"densidade z{zoom_low}", lambda f: json.dumps(density(f.lonlat[GridIndex(f.lonlat).query(bbox)], zoom_low))),
+    ]
+    avg = sum(len(f) for f in frames) / len(frames)
+    in_view = sum(len(view(f)) for f in frames) / len(frames)
+    print(f"{len(frames)} frames, {avg:.0f} veículos/frame, {in_view:.0f} no viewport ({area:.0%} da área)")
+    results = {}
+    for name, encode in rows:
+        ms, size = _encode_stream(frames, encode)
+        results[name] = (ms, size)
+        print(f"{name:>20}: {ms:7.3f} ms/frame {size / 1024:9.1f} KB/frame")
+    return results
+
+
+def add_scenario_args(p):
+    p.add_argument("--scenario", help="pasta do cenário (padrão: grade sintética)")
+    p.add_argument("--grid", type=int, default=20, help="tamanho NxN da grade sem --scenario")
+    p.add_argument("--grid-vehicles", type=int, default=2000)
+    p.add_argument("--work-dir")
+
+
+def resolve_scenario(args, duration=3600):
+    if args.scenario: return args.scenario
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="bench-")
+    return grid_scenario(args.grid, args.grid_vehicles, duration, work_dir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do sumo-backend")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("snapshot", help="per-call TraCI vs subscriptions no loop do /ws")
+    add_scenario_args(p)
+    p.add_argument("--steps", type=int, default=2000)
+
+    p = sub.add_parser("netparse", help="readNet vs iterparse em streaming (tempo e pico de memória)")
+    p.add_argument("--net", action="append", default=[], help="net.xml real (pode repetir)")
+    p.add_argument("--sizes", default="30,60,120", help="grades sintéticas NxN (250 ~ região metropolitana)")
+    p.add_argument("--work-dir")
+
+    p = sub.add_parser("ai", help="controle semafórico: espera média, escritas TraCI/h e custo por estratégia")
+    add_scenario_args(p)
+    p.add_argument("--duration", type=float, default=3600, help="segundos simulados")
+    p.add_argument("--strategies", default=",".join(STRATEGIES))
+
+    p = sub.add_parser("backend", help="passos/s do loop da sessão em TraCI vs libsumo")
+    add_scenario_args(p)
+    p.add_argument("--steps", type=int, default=2000)
+    p.add_argument("--ai", choices=tuple(STRATEGIES), help="liga a IA com esta estratégia")
+
+    p = sub.add_parser("viewport", help="custo por cliente: rede inteira vs recorte pelo viewport")
+    add_scenario_args(p)
+    p.add_argument("--warmup", type=int, default=1200)
+    p.add_argument("--frames", type=int, default=100)
+    p.add_argument("--area", type=float, default=0.05, help="fração da área ocupada coberta pelo viewport")
+    p.add_argument("--zoom-low", type=int, default=12)
+
+    p = sub.add_parser("demand", help="demand.py (trips/routes/flows) vs randomTrips.py: tempo e tamanho")
+    p.add_argument("--net", action="append", default=[], help="net.xml real (pode repetir)")
+    p.add_argument("--sizes", default="30,60", help="grades sintéticas NxN")
+    p.add_argument("--vehicles", default="1000,10000")
+    p.add_argument("--duration", type=float, default=3600)
+    p.add_argument("--random-trips", action="store_true", help="mede também o randomTrips.py --validate")
+    p.add_argument("--work-dir")
+
+    args = parser.parse_args(argv)
+    if args.bench == "snapshot":
+        bench_snapshot(resolve_scenario(args), args.steps)
+    elif args.bench == "netparse":
+        sizes = [int(v) for v in args.sizes.split(",") if v]
+        bench_netparse(args.net, sizes, args.work_dir)
+    elif args.bench == "ai":
+        bench_ai(resolve_scenario(args, args.duration), args.duration, [v for v in args.strategies.split(",") if v])
+    elif args.bench == "backend":
+        bench_backend(resolve_scenario(args), args.steps, args.ai)
+    elif args.bench == "viewport":
+        bench_viewport(resolve_scenario(args), args.warmup, args.frames, args.area, args.zoom_low)
+    elif args.bench == "demand":
+        sizes = [int(v) for v in args.sizes.split(",") if v]
+        vehicles = [int(v) for v in args.vehicles.split(",") if v]
+        bench_demand(args.net, sizes, vehicles, args.duration, args.random_trips, args.work_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+import json
+import asyncio
+
+from protocol import make_encoder, hello, send_payload
+from spatial import GridIndex, density, visible_zoom, parse_bbox, parse_zoom
+
+
+class Subscriber:
+    """
+    Cliente inscrito numa sessão. Guarda só o payload mais novo: se o anterior
+    ainda não saiu, ele é descartado (cliente lento pula frames, não segura os outros).
+    """
+
+    def __init__(self, websocket, protocol, owner=False, metrics=None):
+        self.websocket = websocket
+        self.metrics = metrics
+        self.protocol = protocol
+        self.owner = owner
+        self.pending = None
+        self.needs_keyframe = True
+        # Recorte: bbox (s, w, n, e) e zoom do mapa do cliente; None = rede inteira
+        self.viewport = None
+        self.zoom = None
+        self.encoder = None  # encoder próprio (o conjunto de veículos é só deste cliente)
+        self.sent = 0
+        self.skipped = 0
+        self.closed = False
+        self._ready = asyncio.Event()
+
+    def offer(self, payload):
+        if self.pending is not None:
+            self.skipped += 1
+            if self.metrics: self.metrics.skipped.inc()
+        self.pending = payload
+        self._ready.set()
+
+    def set_viewport(self, bbox, zoom=None):
+        self.viewport = bbox
+        self.zoom = parse_zoom(zoom)
+        self.encoder = make_encoder(self.protocol) if bbox else None
+        self.needs_keyframe = True
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    async def read_viewport(self, on_message=None):
+        """
+        Lê mensagens do cliente: {"viewport": [s, w, n, e] | null, "zoom": z}; as demais
+        (objetos JSON) vão para on_message. Termina (e fecha o inscrito) quando o cliente desconecta.
+        """
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect": break
+                try: msg = json.loads(message.get("text") or "null")
+                except ValueError: continue
+                if not isinstance(msg, dict): continue
+                if "viewport" in msg: self.set_viewport(parse_bbox(msg["viewport"]), msg.get("zoom"))
+                elif on_message:
+                    try: on_message(msg)
+                    except (TypeError, ValueError): pass
+        except Exception: pass
+        finally:
+            self.close()
+
+    async def run(self):
+        """Envia até a sessão terminar. Erros de envio (cliente saiu) sobem para o chamador."""
+        greeting = hello(self.protocol)
+        if greeting: await self.websocket.send_json(greeting)
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            payload, self.pending = self.pending, None
+            if payload is not None:
+                t0 = self.metrics.now() if self.metrics else 0.0
+                await send_payload(self.websocket, payload)
+                if t0:
+                    self.metrics.send.since(t0)
+                    self.metrics.frame_bytes(self.protocol).observe(len(payload))
+                self.sent += 1
+            if self.closed and self.pending is None: return
+
+
+class FrameBroadcaster:
+    """
+    Publica os frames de uma sessão para N WebSockets. Cada frame é codificado uma
+    vez por protocolo e o mesmo payload vai para todos os inscritos. No protocolo
+    delta o encoder é compartilhado; quem entra ou perdeu um frame recebe o
+    keyframe do passo (também gerado uma única vez).
+    """
+
+    def __init__(self, worker, fps, tls_positions=None):
+        self.worker = worker
+        self.metrics = getattr(worker, "metrics", None)
+        self.interval = 1.0 / max(fps, 0.1)
+        # (ids, lonlat) dos semáforos: com viewport, só os visíveis vão no frame
+        self.tls_ids, self.tls_index = None, None
+        if tls_positions and len(tls_positions[0]):
+            self.tls_ids = tls_positions[0]
+            self.tls_index = GridIndex(tls_positions[1])
+        self.subscribers: list[Subscriber] = []
+        self.encoders = {}
+        self.published = 0
+
+    def subscribe(self, websocket, protocol, owner=False):
+        sub = Subscriber(websocket, protocol, owner, self.metrics)
+        self.subscribers.append(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        if sub in self.subscribers: self.subscribers.remove(sub)
+
+    def publish(self, frame):
+        t0 = self.metrics.now() if self.metrics else 0.0
+        cache, views = {}, {}
+        for sub in self.subscribers:
+            if sub.viewport is None:
+                # Delta depende do frame anterior: se ele não foi entregue, manda keyframe
+                keyframe = sub.protocol == "delta" and (sub.needs_keyframe or sub.pending is not None)
+                key = (sub.protocol, keyframe)
+                if key not in cache:
+                    cache[key] = self._encode(sub.protocol, frame, cache, keyframe)
+                sub.needs_keyframe = False
+                sub.offer(cache[key])
+            else:
+                sub.offer(self._encode_view(sub, frame, views))
+        self.published += 1
+        if self.metrics:
+            self.metrics.phase["encode"].since(t0)
+            self.metrics.published.inc()
+
+    def _encode(self, protocol, frame, cache, keyframe):
+        encoder = self.encoders.setdefault(protocol, make_encoder(protocol))
+        if (protocol, False) not in cache and (protocol, True) not in cache:
+            cache[(protocol, False)] = encoder.encode(frame)
+        return encoder.keyframe() if keyframe else cache[(protocol, False)]
+
+    def _encode_view(self, sub, frame, views):
+        """
+        Só o que está no viewport do cliente. O índice dos veículos é montado uma vez
+        por passo (e só se alguém tem viewport); viewports iguais reusam o payload JSON.
+        """
+        bbox = sub.viewport
+        if "index" not in views: views["index"] = GridIndex(frame.lonlat)
+        index = views["index"]
+        tls_key = ("tls", bbox)
+        if tls_key not in views: views[tls_key] = self._visible_tls(frame, bbox)
+        if not visible_zoom(sub.zoom):
+            # Zoom baixo: células de densidade; ao voltar para veículos começa com keyframe
+            sub.needs_keyframe = True
+            key = ("density", bbox, sub.zoom)
+            if key not in views:
+                views[key] = json.dumps({"time": frame.time, "status": "running",
+                                         "density": density(frame.lonlat[index.query(bbox)], sub.zoom),
+                                         "traffic_lights": views[tls_key]}, separators=(",", ":"))
+            return views[key]
+        subset_key = ("subset", bbox)
+        if subset_key not in views: views[subset_key] = frame.subset(index.query(bbox), views[tls_key])
+        if sub.protocol == "delta":
+            keyframe = sub.needs_keyframe or sub.pending is not None
+            sub.needs_keyframe = False
+            return sub.encoder.encode(views[subset_key], keyframe=keyframe)
+        key = ("json", bbox)
+        if key not in views: views[key] = sub.encoder.encode(views[subset_key])
+        return views[key]
+
+    def _visible_tls(self, frame, bbox):
+        if self.tls_index is None: return frame.tls
+        return {tls_id: frame.tls[tls_id] for tls_id in
+                (self.tls_ids[i] for i in self.tls_index.query(bbox).tolist()) if tls_id in frame.tls}
+
+    async def run(self):
+        """Lê o frame mais recente do worker no ritmo alvo e publica até a sessão acabar."""
+        loop = asyncio.get_running_loop()
+        last_seq = -1
+        next_send = loop.time()
+        try:
+            while True:
+                seq, frame = self.worker.buffer.latest()
+                if seq != last_seq:
+                    self.publish(frame)
+                    last_seq = seq
+                elif not self.worker.is_alive():
+                    break
+                next_send = max(next_send + self.interval, loop.time())
+                await asyncio.sleep(max(0.0, next_send - loop.time()))
+            if self.worker.stop_requested:
+                for sub in self.subscribers: sub.offer('{"status":"stopped"}')
+        finally:
+            for sub in self.subscribers: sub.close()
@@ -0,0 +1,197 @@
+"""
+Modelo de capacidade para o /generate: admite, reduz ou recusa um cenário
+antes de gerar, com o tempo estimado de simulação.
+
+Custo de um passo da sessão (SUMO + leitura dos veículos + projeção, o mesmo
+que o loop do /ws faz) num núcleo:
+
+    s/passo = a + b * veículos ativos + c * arestas
+
+Os coeficientes vêm da calibração (python capacity.py calibrate, ou POST
+/capacity/calibrate), que roda grades sintéticas com demanda crescente e
+ajusta por mínimos quadrados; sem calibração vale DEFAULT_MODEL. Antes do
+download não se sabe o tamanho da rede: as arestas são estimadas pela área
+(EDGES_PER_KM2) e os veículos ativos pela fração da duração que uma viagem
+ocupa (raio / velocidade média).
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from simulation_worker import STEP_LENGTH, DEFAULT_SPEED, parse_speed
+
+CAPACITY_FILE = Path(os.getenv("CAPACITY_FILE", "/app/scenarios/capacity.json"))
+# Fator mínimo aceitável (1 = tempo real); abaixo disso a sessão "congela" para o cliente
+MIN_SPEED = float(os.getenv("CAPACITY_MIN_SPEED", "1.0"))
+if not MIN_SPEED > 0: raise ValueError(f"CAPACITY_MIN_SPEED precisa ser > 0 (veio {MIN_SPEED:g})")
+MAX_VEHICLES = int(os.getenv("CAPACITY_MAX_VEHICLES", "50000"))
+MAX_RADIUS_KM = float(os.getenv("CAPACITY_MAX_RADIUS_KM", "10"))
+MAX_DURATION = float(os.getenv("CAPACITY_MAX_DURATION", "86400"))
+MIN_VEHICLES = 50
+EDGES_PER_KM2 = float(os.getenv("CAPACITY_EDGES_PER_KM2", "600"))  # rede urbana do OSM após netconvert
+MEAN_SPEED = 8.0  # m/s em área urbana
+DETOUR = 1.3  # rota / distância em linha reta
+
+# Medido com TraCI num núcleo (grades 10x10 e 25x25, até ~1300 veículos ativos); c inclui os semáforos
+DEFAULT_MODEL = {"a": 1.0e-4, "b": 5.0e-5, "c": 6.0e-6}
+
+# Pontos da calibração: (grade NxN, veículos)
+CALIBRATION = ((10, 100), (10, 1000), (25, 300), (25, 1500), (25, 3000))
+CALIBRATION_WARMUP_S = 300.0
+CALIBRATION_STEPS = 200
+
+
+class CapacityModel:
+    def __init__(self, a, b, c, **info):
+        self.a, self.b, self.c = float(a), float(b), float(c)
+        self.info = info
+
+    def step_time(self, active, edges):
+        return self.a + self.b * active + self.c * edges
+
+    def speed(self, active, edges):
+        """Fator de tempo real que um núcleo sustenta (passos/s x tamanho do passo)."""
+        return STEP_LENGTH / self.step_time(active, edges)
+
+    def max_active(self, edges, min_speed=MIN_SPEED):
+        """Veículos ativos que ainda rodam a min_speed (0 se nem a rede vazia roda)."""
+        budget = STEP_LENGTH / min_speed - self.a - self.c * edges
+        return max(0.0, budget / self.b) if self.b > 0 else float("inf")
+
+    def to_dict(self):
+        return {"a": self.a, "b": self.b, "c": self.c, **self.info}
+
+    @classmethod
+    def load(cls, path=CAPACITY_FILE):
+        try: return cls(**json.loads(Path(path).read_text()))
+        except (OSError, ValueError, TypeError): return cls(**DEFAULT_MODEL, source="default")
+
+    def save(self, path=CAPACITY_FILE):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.to_dict(), indent=2))
+        os.replace(tmp, path)
+
+
+def expected_edges(radius_km):
+    """Arestas esperadas no quadrado de lado 2 x raio (bbox do _get_bbox_from_city)."""
+    return EDGES_PER_KM2 * (2 * radius_km) ** 2
+
+
+def active_fraction(radius_km, duration):
+    """Fração dos veículos na rede ao mesmo tempo: duração de uma viagem típica / duração."""
+    trip_s = radius_km * 1000 * DETOUR / MEAN_SPEED
+    return min(1.0, trip_s / max(duration, 1.0))
+
+
+def check(num_vehicles, duration, radius_km, model=None, speed=DEFAULT_SPEED, allow_downscale=True, edges=None):
+    """
+    Decide "admit", "downscale" (num_vehicles reduzido) ou "reject" para o pedido.
+    speed é o fator alvo das sessões (SIM_SPEED); a estimativa de tempo usa o menor
+    entre ele e o que um núcleo sustenta.
+    """
+    model = model or CapacityModel.load()
+    target = parse_speed(speed) or float("inf")
+    edges = expected_edges(radius_km) if edges is None else edges
+    fraction = active_fraction(radius_km, duration)
+    out = {"requested_vehicles": num_vehicles, "duration": duration, "radius_km": radius_km,
+           "edges_est": round(edges), "min_speed": MIN_SPEED, "model": model.info.get("source", "calibrated")}
+
+    def result(decision, vehicles, reason=None):
+        active = vehicles * fraction
+        achievable = model.speed(active, edges)
+        real = min(target, achievable)
+        out.update(decision=decision, num_vehicles=vehicles, active_est=round(active),
+                   steps_per_s=round(achievable / STEP_LENGTH, 1), speed_factor=round(achievable, 2),
+                   estimated_runtime_s=round(duration / real, 1), reason=reason)
+        return out
+
+    if num_vehicles < 1 or duration <= 0 or radius_km <= 0:
+        return result("reject", num_vehicles, "veículos, duração e raio precisam ser positivos")
+    if radius_km > MAX_RADIUS_KM:
+        return result("reject", num_vehicles, f"raio acima de {MAX_RADIUS_KM:g} km")
+    if duration > MAX_DURATION:
+        return result("reject", num_vehicles, f"duração acima de {MAX_DURATION:g} s")
+    limit = min(MAX_VEHICLES, int(model.max_active(edges) / fraction))
+    if num_vehicles <= limit: return result("admit", num_vehicles)
+    if not allow_downscale or limit < MIN_VEHICLES:
+        return result("reject", num_vehicles,
+                      f"capacidade estimada: {max(limit, 0)} veículos a {MIN_SPEED:g}x nesta área/duração")
+    return result("downscale", limit, f"reduzido de {num_vehicles} para caber a {MIN_SPEED:g}x")
+
+
+def _measure(net_file, vehicles, backend):
+    """(veículos ativos médios, s/passo) do loop da sessão depois do aquecimento."""
+    import sim_backend
+    from demand import generate_demand
+    from snapshot import SimulationSnapshot
+    from projection import NetProjection
+    from headless import SUMO_ARGS
+    rou_file = f"{net_file}.{vehicles}.rou.xml"
+    generate_demand(net_file, rou_file, vehicles, 2 * CALIBRATION_WARMUP_S, seed=1)
+    cmd = ["sumo", "-n", net_file, "-r", rou_file] + SUMO_ARGS
+    conn = sim_backend.start(cmd, f"capacity-{uuid.uuid4().hex[:8]}", backend)
+    try:
+        snapshot = SimulationSnapshot(conn, geo=NetProjection.from_net_file(net_file))
+        snapshot.start()
+        while snapshot.time < CALIBRATION_WARMUP_S and snapshot.running(): snapshot.advance()
+        active, t0 = 0, time.perf_counter()
+        for _ in range(CALIBRATION_STEPS):
+            snapshot.advance()
+            active += len(snapshot.frame())
+        return active / CALIBRATION_STEPS, (time.perf_counter() - t0) / CALIBRATION_STEPS
+    finally:
+        conn.close()
+        os.remove(rou_file)
+
+
+def calibrate(points=CALIBRATION, backend="traci", path=CAPACITY_FILE, work_dir=None, log=print):
+    """Roda os pontos, ajusta a + b*ativos + c*arestas e grava o modelo."""
+    from demand import load_net
+    from headless import grid_net
+    work_dir = work_dir or tempfile.mkdtemp(prefix="capacity-")
+    rows, samples = [], []
+    for size, vehicles in points:
+        net_file = grid_net(size, work_dir)
+        edges = len(load_net(net_file).ids)
+        active, step = _measure(net_file, vehicles, backend)
+        rows.append([1.0, active, edges])
+        samples.append(step)
+        log(f"grade {size}x{size} ({edges} arestas), {active:.0f} ativos: {step * 1000:.2f} ms/passo")
+    coef, *_ = np.linalg.lstsq(np.asarray(rows), np.asarray(samples), rcond=None)
+    a, b, c = np.maximum(coef, [1e-5, 1e-8, 0.0]).tolist()
+    model = CapacityModel(a, b, c, source="calibrated", backend=backend, calibrated_at=time.time(),
+                          points=[{"edges": r[2], "active": round(r[1]), "step_s": s} for r, s in zip(rows, samples)])
+    if path: model.save(path)
+    return model
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Modelo de capacidade das sessões")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("calibrate", help="mede o custo por passo e grava o modelo")
+    p.add_argument("--backend", choices=("traci", "libsumo"), default="traci")
+    p.add_argument("--output", default=str(CAPACITY_FILE))
+    p = sub.add_parser("check", help="avalia um pedido com o modelo gravado")
+    p.add_argument("--vehicles", type=int, default=300)
+    p.add_argument("--duration", type=float, default=1000)
+    p.add_argument("--radius-km", type=float, default=1.5)
+    args = parser.parse_args(argv)
+    if args.cmd == "calibrate":
+        model = calibrate(backend=args.backend, path=args.output)
+        print(json.dumps({k: v for k, v in model.to_dict().items() if k != "points"}))
+    else:
+        print(json.dumps(check(args.vehicles, args.duration, args.radius_km), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
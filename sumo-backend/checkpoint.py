@@ -0,0 +1,179 @@
+"""
+Checkpoints da simulação (simulation.saveState) para retomar sem refazer do t=0.
+
+Cada sessão grava numa linha do tempo própria: <cenário>/state/<linha>/<tempo>.xml.gz
+(gzip: ~10x menor que o XML puro). Sessões do mesmo cenário salvam nos mesmos
+tempos (múltiplos do intervalo) e, sem isso, uma carregaria o estado da outra.
+Sessão retomada de um checkpoint anota a linha de origem (timeline.json) e o
+seek para antes do ponto de retomada segue por ela. O prune das linhas antigas
+poupa as de sessões vivas (acquire/release pelo SessionManager) e as de origem.
+
+O worker salva a cada CHECKPOINT_INTERVAL segundos simulados e ao encerrar a
+sessão; o /ws?resume=... sobe o SUMO com --load-state e o seek do
+/control-simulation carrega o checkpoint mais próximo (loadState) em vez de
+passar por todos os frames intermediários.
+"""
+import os
+import re
+import json
+import uuid
+import shutil
+import threading
+from collections import Counter
+from pathlib import Path
+
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", "300"))  # segundos simulados; 0 desliga
+KEEP_CHECKPOINTS = int(os.getenv("CHECKPOINT_KEEP", "12"))  # por linha do tempo
+KEEP_TIMELINES = int(os.getenv("CHECKPOINT_KEEP_TIMELINES", "10"))  # por cenário
+STATE_SUFFIX = ".xml.gz"  # o SUMO comprime pela extensão
+
+_STATE_RE = re.compile(r"^(\d+(?:\.\d+)?)\.xml\.gz$")
+_TIMELINE_RE = re.compile(r"^[0-9a-f]{6,32}$")
+
+# Linhas em uso por sessões vivas (e as de origem delas): o prune não apaga
+_active = Counter()
+_active_lock = threading.Lock()
+
+
+def active_timelines():
+    with _active_lock: return {name for name, count in _active.items() if count > 0}
+
+
+def _mtime(path):
+    try: return path.stat().st_mtime
+    except OSError: return 0.0
+
+
+def timelines(scenario_dir):
+    """[(linha, última gravação)] do cenário, da mais antiga para a mais recente."""
+    root = Path(scenario_dir) / "state"
+    if not root.is_dir(): return []
+    found = []
+    for path in root.iterdir():
+        if not path.is_dir() or not _TIMELINE_RE.match(path.name): continue
+        states = [_mtime(p) for p in path.iterdir() if _STATE_RE.match(p.name)]
+        if states: found.append((path.name, max(states)))
+    return sorted(found, key=lambda item: item[1])
+
+
+def resume_point(scenario_dir, spec, timeline=None):
+    """
+    (linha, tempo, caminho) para o ?resume=: "latest" é o último estado gravado da
+    linha (padrão: a linha gravada por último), um número é o mais recente <= t.
+    """
+    if timeline is None:
+        found = timelines(scenario_dir)
+        if not found: return None, None, None
+        timeline = found[-1][0]
+    elif not _TIMELINE_RE.match(timeline): return None, None, None
+    store = CheckpointStore(scenario_dir, timeline)
+    saved_time, path = store.latest() if spec == "latest" else store.at(float(spec))
+    return (store.timeline_of(path), saved_time, path) if path else (None, None, None)
+
+
+class CheckpointStore:
+    """Checkpoints de uma linha do tempo do cenário, ordenados pelo tempo simulado."""
+
+    def __init__(self, scenario_dir, timeline=None, parent=None, interval=CHECKPOINT_INTERVAL, keep=KEEP_CHECKPOINTS):
+        self.scenario_dir = Path(scenario_dir)
+        self.timeline = timeline or uuid.uuid4().hex[:12]
+        self.dir = self.scenario_dir / "state" / self.timeline
+        self.interval = interval
+        self.keep = max(1, keep)
+        self.next_save = None
+        # (linha, tempo) de onde esta sessão foi retomada; lido do disco para linhas existentes
+        self.parent = parent or self._read_parent()
+        self._held = []
+
+    def _read_parent(self):
+        try:
+            data = json.loads((self.dir / "timeline.json").read_text())
+            return data["parent"], float(data["from"])
+        except (OSError, ValueError, KeyError, TypeError): return None
+
+    def _lineage(self):
+        """Esta linha e as de origem (até onde o timeline.json de cada uma aponta)."""
+        names, parent = [self.timeline], self.parent
+        while parent and _TIMELINE_RE.match(parent[0]) and parent[0] not in names:
+            names.append(parent[0])
+            parent = CheckpointStore(self.scenario_dir, parent[0]).parent
+        return names
+
+    def acquire(self):
+        """Marca a linha (e as de origem) como em uso enquanto a sessão viver."""
+        self._held = self._lineage()
+        with _active_lock: _active.update(self._held)
+
+    def release(self):
+        held, self._held = self._held, []
+        with _active_lock:
+            _active.subtract(held)
+            for name in held:
+                if _active[name] <= 0: del _active[name]
+
+    def timeline_of(self, path):
+        return Path(path).parent.name
+
+    def list(self):
+        """[(tempo, caminho)] desta linha, do mais antigo para o mais recente."""
+        if not self.dir.is_dir(): return []
+        found = []
+        for path in self.dir.iterdir():
+            match = _STATE_RE.match(path.name)
+            if match: found.append((float(match.group(1)), path))
+        return sorted(found)
+
+    def latest(self):
+        """Último checkpoint gravado (depois de um seek para trás o tempo maior pode ser de antes do seek)."""
+        found = self.list()
+        return max(found, key=lambda item: _mtime(item[1])) if found else (None, None)
+
+    def at(self, sim_time):
+        """Checkpoint mais recente com tempo <= sim_time nesta linha ou nas de origem, ou (None, None)."""
+        best = (None, None)
+        for t, path in self.list():
+            if t > sim_time + 1e-6: break
+            best = (t, path)
+        if best[1] is None and self.parent:
+            parent, resumed_at = self.parent
+            if _TIMELINE_RE.match(parent):
+                return CheckpointStore(self.scenario_dir, parent).at(min(sim_time, resumed_at))
+        return best
+
+    def due(self, sim_time):
+        if not self.interval: return False
+        # Múltiplos do intervalo (300, 600...) para sessões do mesmo cenário reaproveitarem os tempos
+        if self.next_save is None: self.next_save = (sim_time // self.interval + 1) * self.interval
+        return sim_time >= self.next_save
+
+    def save(self, conn, sim_time):
+        """saveState num arquivo temporário e troca atômica (restart no meio não deixa estado pela metade)."""
+        if not self.dir.is_dir():
+            self.dir.mkdir(parents=True, exist_ok=True)
+            if self.parent:
+                (self.dir / "timeline.json").write_text(json.dumps({"parent": self.parent[0], "from": self.parent[1]}))
+        path = self.dir / f"{sim_time:.1f}{STATE_SUFFIX}"
+        tmp = self.dir / f".tmp-{uuid.uuid4().hex}{STATE_SUFFIX}"
+        conn.simulation.saveState(str(tmp))
+        os.replace(tmp, path)
+        self.next_save = None
+        self._prune()
+        return path
+
+    def _prune(self):
+        found = sorted(self.list(), key=lambda item: _mtime(item[1]))
+        for _, path in found[:-self.keep]:
+            try: path.unlink()
+            except OSError: pass
+        # Linhas antigas do cenário: não apaga as de sessões vivas nem as que são
+        # origem (timeline.json) de outra linha que fica
+        found = [name for name, _ in timelines(self.scenario_dir)]
+        busy = active_timelines() | {self.timeline}
+        parents = {name: CheckpointStore(self.scenario_dir, name).parent for name in found}
+        excess = len(found) - KEEP_TIMELINES
+        for name in found:
+            if excess <= 0: break
+            if name in busy or any(p and p[0] == name for other, p in parents.items() if other != name): continue
+            shutil.rmtree(self.scenario_dir / "state" / name, ignore_errors=True)
+            parents.pop(name)
+            excess -= 1
@@ -0,0 +1,141 @@
+import os
+import time
+import math
+import asyncio
+from collections import deque
+from fastapi import WebSocket
+
+PRIORITIES = ("high", "normal", "low")
+# Duração média assumida de uma sessão enquanto não há histórico (para o ETA)
+DEFAULT_SESSION_S = float(os.getenv("QUEUE_DEFAULT_SESSION_S", "300"))
+# Reavalia a folga de CPU/memória quando há vaga mas a admissão recusou
+RECHECK_S = 5.0
+
+
+class QueueEntry:
+    __slots__ = ("websocket", "priority", "future", "enqueued_at", "cancelled")
+
+    def __init__(self, websocket, priority):
+        self.websocket = websocket
+        self.priority = priority
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.cancelled = False
+
+
+class ConnectionManager:
+    """
+    Fila de admissão do /ws. Cada cliente na fila espera numa future própria,
+    resolvida assim que uma sessão libera vaga (sem polling). Filas por classe
+    de prioridade em deque; saídas da fila são marcadas e descartadas no pop.
+    """
+
+    def __init__(self, sessions):
+        self.sessions = sessions  # Admissão por folga de CPU/memória
+        self.active_connections: dict[WebSocket, float] = {}
+        self.queues = {p: deque() for p in PRIORITIES}
+        self.waiting: dict[WebSocket, QueueEntry] = {}
+        self.durations = deque(maxlen=20)
+        self._recheck = None
+
+    @property
+    def queue_length(self):
+        return len(self.waiting)
+
+    async def connect(self, websocket: WebSocket, subprotocol=None, priority="normal"):
+        await websocket.accept(subprotocol=subprotocol)
+        if not self.waiting and self.sessions.can_admit(len(self.active_connections)):
+            self.active_connections[websocket] = time.monotonic()
+            return True
+        entry = QueueEntry(websocket, priority if priority in PRIORITIES else "normal")
+        self.waiting[websocket] = entry
+        self.queues[entry.priority].append(entry)
+        await self.notify_positions()
+        return False
+
+    async def wait_turn(self, websocket: WebSocket):
+        """Espera a promoção; retorna False se o cliente desconectar antes."""
+        entry = self.waiting.get(websocket)
+        if entry is None: return websocket in self.active_connections
+        receiver = asyncio.ensure_future(websocket.receive())
+        try:
+            while True:
+                done, _ = await asyncio.wait({entry.future, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                if entry.future in done:
+                    return True
+                if receiver.result().get("type") == "websocket.disconnect":
+                    self.disconnect(websocket)
+                    return False
+                receiver = asyncio.ensure_future(websocket.receive())
+        finally:
+            receiver.cancel()
+
+    def disconnect(self, websocket: WebSocket):
+        started = self.active_connections.pop(websocket, None)
+        if started is not None:
+            self.durations.append(time.monotonic() - started)
+        entry = self.waiting.pop(websocket, None)
+        if entry: entry.cancelled = True
+        self.try_promote()
+        self._schedule_notify()
+
+    def is_active(self, websocket: WebSocket):
+        return websocket in self.active_connections
+
+    def _pop_next(self):
+        for priority in PRIORITIES:
+            queue = self.queues[priority]
+            while queue:
+                entry = queue.popleft()
+                if not entry.cancelled: return entry
+        return None
+
+    def try_promote(self):
+        """Promove quantos clientes couberem agora; chamado sempre que uma vaga abre."""
+        promoted = []
+        while self.waiting and self.sessions.can_admit(len(self.active_connections)):
+            entry = self._pop_next()
+            if entry is None: break
+            del self.waiting[entry.websocket]
+            self.active_connections[entry.websocket] = time.monotonic()
+            if not entry.future.done(): entry.future.set_result(True)
+            promoted.append(entry.websocket)
+        if self.waiting and len(self.active_connections) < self.sessions.pool_size:
+            # Há vaga no pool mas faltou folga de CPU/memória: tenta de novo em breve
+            self._schedule_recheck()
+        return promoted
+
+    def eta(self, position):
+        avg = sum(self.durations) / len(self.durations) if self.durations else DEFAULT_SESSION_S
+        return math.ceil(position / self.sessions.pool_size) * avg
+
+    def positions(self):
+        """Ordem atual de atendimento: [(websocket, posição, prioridade)]."""
+        order, pos = [], 0
+        for priority in PRIORITIES:
+            for entry in self.queues[priority]:
+                if entry.cancelled: continue
+                pos += 1
+                order.append((entry.websocket, pos, priority))
+        return order
+
+    async def notify_positions(self):
+        for websocket, pos, priority in self.positions():
+            try:
+                await websocket.send_json({"status": "queue", "position": pos, "priority": priority,
+                                           "eta_s": round(self.eta(pos)),
+                                           "message": "Servidor ocupado. Aguarde na fila."})
+            except Exception: pass
+
+    def _schedule_notify(self):
+        if not self.waiting: return
+        try: asyncio.get_running_loop().create_task(self.notify_positions())
+        except RuntimeError: pass
+
+    def _schedule_recheck(self):
+        if self._recheck and not self._recheck.cancelled(): return
+        def _run():
+            self._recheck = None
+            if self.try_promote(): self._schedule_notify()
+        try: self._recheck = asyncio.get_running_loop().call_later(RECHECK_S, _run)
+        except RuntimeError: pass
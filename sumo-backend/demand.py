@@ -0,0 +1,253 @@
+"""
+Gerador de demanda dentro do processo (substitui randomTrips.py + duarouter).
+
+A rede é lida uma vez (net_stream.iter_elements, ou o ramo da passada que o
+gerador compartilha com sync e tiles) e vira um grafo por arestas: nó =
+aresta da rede, arco = conexão, custo = tempo de percurso da aresta
+seguinte. Origens e destinos saem só da maior componente fortemente conexa
+(toda viagem tem rota, o mesmo que o --validate garantia) e são sorteados
+com peso por atributo da aresta. A partida segue um perfil no tempo
+(uniforme, pico da manhã/tarde, rush com dois picos).
+
+Saída (mode):
+  - trips:  um <trip from to> por veículo, o SUMO roteia na partida (compacto);
+  - routes: <vehicle> com a rota pronta (caminho mínimo com cache por origem);
+  - flows:  <flow number=...> por par O/D e faixa de tempo (mais compacto ainda).
+Mesma rede + parâmetros + semente = mesmo arquivo.
+"""
+import os
+import sys
+import time
+import argparse
+from collections import OrderedDict
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra
+
+from net_stream import iter_elements
+
+DEFAULT_PROFILE = os.getenv("DEMAND_PROFILE", "uniform")
+DEFAULT_WEIGHT = os.getenv("DEMAND_WEIGHT", "lane_length")
+DEFAULT_MODE = os.getenv("DEMAND_MODE", "trips")
+DEFAULT_SEED = int(os.getenv("DEMAND_SEED", "42"))
+VCLASS = "passenger"
+PROFILE_BIN_S = 60.0  # resolução do perfil de partidas
+FLOW_BIN_S = 300.0  # faixa de tempo de cada <flow>
+OD_PAIRS = 200  # pares O/D distintos no modo flows
+ROUTE_CACHE = 256  # origens com predecessores em cache
+ROUTE_BATCH = 64  # origens por chamada do dijkstra
+
+
+def _peak(center, width):
+    return lambda x: np.exp(-0.5 * ((x - center) / width) ** 2)
+
+
+# x = fração da duração (0..1) -> peso relativo de partidas
+PROFILES = {
+    "uniform": lambda x: np.ones_like(x),
+    "morning": lambda x: 0.2 + _peak(0.3, 0.1)(x),
+    "evening": lambda x: 0.2 + _peak(0.7, 0.1)(x),
+    "rush_hour": lambda x: 0.2 + _peak(0.25, 0.08)(x) + _peak(0.75, 0.08)(x),
+}
+# Peso de cada aresta como origem/destino
+WEIGHTS = {
+    "uniform": lambda net: np.ones(len(net.ids)),
+    "length": lambda net: net.length,
+    "lane_length": lambda net: net.length * net.lanes,
+    "speed": lambda net: net.length * net.speed,
+}
+MODES = ("trips", "routes", "flows")
+
+
+def _allows(allow, disallow, vclass=VCLASS):
+    if allow is not None: return vclass in allow.split() or "all" in allow.split()
+    return disallow is None or vclass not in disallow.split()
+
+
+class DemandNet:
+    """Arestas normais (arrays) e o grafo de conexões; candidatas = maior componente fortemente conexa."""
+
+    def __init__(self, net_file, vclass=VCLASS, elements=None):
+        ids, length, speed, lanes = [], [], [], []
+        index, arcs = {}, []
+        # elements: ramo de um ElementTee (passada compartilhada com sync/tiles no gerador)
+        for kind, item in iter_elements(net_file, detail=True) if elements is None else elements:
+            if kind == "lanes":
+                edge_id, edge_lanes = item
+                edge_lanes = [l for l in edge_lanes if _allows(l[2], l[3], vclass)]
+                if edge_lanes:
+                    index[edge_id] = len(ids)
+                    ids.append(edge_id)
+                    length.append(edge_lanes[0][0])
+                    speed.append(max(edge_lanes[0][1], 0.1))
+                    lanes.append(len(edge_lanes))
+            elif kind == "connection":
+                a, b = index.get(item[0]), index.get(item[1])
+                if a is not None and b is not None: arcs.append((a, b))
+        self.ids = ids
+        self.length = np.asarray(length)
+        self.speed = np.asarray(speed)
+        self.lanes = np.asarray(lanes, dtype=float)
+        self.travel_time = self.length / self.speed
+        n = len(ids)
+        arcs = np.unique(np.asarray(arcs, dtype=np.int64).reshape(-1, 2), axis=0)
+        self.graph = csr_matrix((self.travel_time[arcs[:, 1]], (arcs[:, 0], arcs[:, 1])), shape=(n, n))
+        _, labels = connected_components(self.graph, directed=True, connection="strong")
+        largest = np.bincount(labels).argmax() if n else 0
+        self.candidates = np.flatnonzero(labels == largest)
+        self.paths = ShortestPaths(self.graph)
+
+
+class ShortestPaths:
+    """
+    Caminhos mínimos por origem: um dijkstra (scipy, em lote) devolve os
+    predecessores para todos os destinos; as origens recentes ficam num LRU.
+    """
+
+    def __init__(self, graph, cache_size=ROUTE_CACHE, batch=ROUTE_BATCH):
+        self.graph = graph
+        self.cache_size = max(1, cache_size)
+        self.batch = max(1, batch)
+        self._cache = OrderedDict()
+
+    def _load(self, origins):
+        missing = [o for o in dict.fromkeys(origins) if o not in self._cache]
+        for i in range(0, len(missing), self.batch):
+            chunk = missing[i:i + self.batch]
+            _, pred = dijkstra(self.graph, directed=True, indices=chunk, return_predecessors=True)
+            for o, row in zip(chunk, pred.astype(np.int32)):
+                self._cache[o] = row
+                self._cache.move_to_end(o)
+        while len(self._cache) > max(self.cache_size, len(origins)): self._cache.popitem(last=False)
+
+    def route(self, origin, dest):
+        pred = self._cache.get(origin)
+        if pred is None:
+            self._load([origin])
+            pred = self._cache[origin]
+        path = [dest]
+        while path[-1] != origin:
+            prev = pred[path[-1]]
+            if prev < 0: return None
+            path.append(prev)
+        return path[::-1]
+
+    def routes(self, origins, dests):
+        """Rotas para pares (origem, destino), agrupando por origem (cada origem = 1 dijkstra)."""
+        out = [None] * len(origins)
+        order = np.argsort(origins, kind="stable")
+        for start in range(0, len(order), self.cache_size):
+            part = order[start:start + self.cache_size]
+            self._load([int(origins[i]) for i in part])
+            for i in part.tolist(): out[i] = self.route(int(origins[i]), int(dests[i]))
+        return out
+
+
+_nets = {}
+
+
+def load_net(net_file, elements=None):
+    """DemandNet em cache por processo (o pool de jobs reaproveita entre gerações)."""
+    key = (os.path.abspath(net_file), os.path.getmtime(net_file))
+    net = _nets.get(key)
+    if net is None:
+        _nets.clear()
+        net = _nets[key] = DemandNet(net_file, elements=elements)
+    return net
+
+
+def departures(rng, vehicles, duration, profile=DEFAULT_PROFILE, begin=0.0):
+    """Tempos de partida ordenados, sorteados pelo perfil (faixas de PROFILE_BIN_S)."""
+    if profile not in PROFILES: raise ValueError(f"Perfil desconhecido: {profile} (use {', '.join(PROFILES)})")
+    bins = max(1, int(np.ceil(duration / PROFILE_BIN_S)))
+    width = duration / bins
+    weight = PROFILES[profile]((np.arange(bins) + 0.5) / bins)
+    chosen = rng.choice(bins, size=vehicles, p=weight / weight.sum())
+    return np.sort(np.round(begin + (chosen + rng.random(vehicles)) * width, 2))
+
+
+def sample_od(rng, net, count, weight=DEFAULT_WEIGHT):
+    """Pares (origem, destino) distintos entre as candidatas, com peso por atributo."""
+    if weight not in WEIGHTS: raise ValueError(f"Peso desconhecido: {weight} (use {', '.join(WEIGHTS)})")
+    cand = net.candidates
+    if len(cand) < 2: raise ValueError("Rede sem arestas conectadas suficientes para gerar viagens.")
+    w = WEIGHTS[weight](net)[cand]
+    p = w / w.sum()
+    origins = cand[rng.choice(len(cand), size=count, p=p)]
+    dests = cand[rng.choice(len(cand), size=count, p=p)]
+    same = np.flatnonzero(origins == dests)
+    while len(same):
+        dests[same] = cand[rng.choice(len(cand), size=len(same), p=p)]
+        same = same[origins[same] == dests[same]]
+    return origins, dests
+
+
+def generate_demand(net_file, rou_file, vehicles, duration, seed=DEFAULT_SEED, profile=DEFAULT_PROFILE,
+                    weight=DEFAULT_WEIGHT, mode=DEFAULT_MODE, begin=0.0):
+    """Gera rou_file; devolve estatísticas (veículos, linhas, bytes, tempo)."""
+    if mode not in MODES: raise ValueError(f"Modo desconhecido: {mode} (use {', '.join(MODES)})")
+    t0 = time.perf_counter()
+    net = load_net(net_file)
+    rng = np.random.default_rng(seed)
+    vehicles = int(vehicles)
+    depart = departures(rng, vehicles, float(duration), profile, begin)
+    ids = net.ids
+    lines = []
+    if mode == "flows":
+        pairs = min(OD_PAIRS, vehicles) or 1
+        origins, dests = sample_od(rng, net, pairs, weight)
+        pair = rng.integers(0, pairs, size=vehicles)
+        bins = max(1, int(np.ceil(duration / FLOW_BIN_S)))
+        slot = np.minimum(((depart - begin) / FLOW_BIN_S).astype(int), bins - 1)
+        counts = np.zeros((bins, pairs), dtype=int)
+        np.add.at(counts, (slot, pair), 1)
+        for b, p in zip(*np.nonzero(counts)):
+            start = begin + b * FLOW_BIN_S
+            end = min(start + FLOW_BIN_S, begin + duration)
+            lines.append(f'    <flow id="f{p}_{b}" begin="{start:.2f}" end="{end:.2f}" number="{counts[b, p]}" '
+                         f'from={quoteattr(ids[origins[p]])} to={quoteattr(ids[dests[p]])}/>')
+    else:
+        origins, dests = sample_od(rng, net, vehicles, weight)
+        if mode == "routes":
+            routes = net.paths.routes(origins, dests)
+            for i, (t, path) in enumerate(zip(depart.tolist(), routes)):
+                edges = quoteattr(" ".join(ids[e] for e in path))
+                lines.append(f'    <vehicle id="{i}" depart="{t:.2f}"><route edges={edges}/></vehicle>')
+        else:
+            for i, (t, o, d) in enumerate(zip(depart.tolist(), origins.tolist(), dests.tolist())):
+                lines.append(f'    <trip id="{i}" depart="{t:.2f}" from={quoteattr(ids[o])} to={quoteattr(ids[d])}/>')
+
+    tmp = f"{rou_file}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<!-- demand: vehicles={vehicles} duration={duration} '
+                f'seed={seed} profile={profile} weight={weight} mode={mode} -->\n<routes>\n')
+        if lines: f.write("\n".join(lines) + "\n")
+        f.write("</routes>\n")
+    os.replace(tmp, rou_file)
+    return {"vehicles": vehicles, "lines": len(lines), "bytes": os.path.getsize(rou_file),
+            "edges": len(ids), "candidates": int(len(net.candidates)),
+            "elapsed_s": round(time.perf_counter() - t0, 3)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera demanda (trips/rotas/flows) para uma rede SUMO")
+    parser.add_argument("net")
+    parser.add_argument("output")
+    parser.add_argument("--vehicles", type=int, default=300)
+    parser.add_argument("--duration", type=float, default=1000)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--profile", choices=tuple(PROFILES), default=DEFAULT_PROFILE)
+    parser.add_argument("--weight", choices=tuple(WEIGHTS), default=DEFAULT_WEIGHT)
+    parser.add_argument("--mode", choices=MODES, default=DEFAULT_MODE)
+    args = parser.parse_args(argv)
+    stats = generate_demand(args.net, args.output, args.vehicles, args.duration, args.seed,
+                            args.profile, args.weight, args.mode)
+    print(f"{stats['vehicles']} veículos, {stats['lines']} linhas, {stats['bytes'] // 1024} KB "
+          f"em {stats['elapsed_s']}s ({stats['candidates']}/{stats['edges']} arestas candidatas)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
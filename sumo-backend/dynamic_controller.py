@@ -1,57 +1,223 @@
+import numpy as np
 import traci
+import traci.constants as tc
+
+from snapshot import TLS_VARS
+from signal_control import STRATEGIES, DEFAULT_STRATEGY, DECISION_INTERVAL, EXTEND, TlsProgram
+
+# Variáveis por faixa lidas numa única subscription (chegam junto com o simulationStep)
+LANE_VARS = (tc.LAST_STEP_VEHICLE_HALTING_NUMBER, tc.VAR_WAITING_TIME,
+             tc.LAST_STEP_VEHICLE_NUMBER, tc.LAST_STEP_MEAN_SPEED)
+METRICS = ("halting", "wait", "count", "speed")
 
 class TrafficAI:
-    def __init__(self, ai_enabled=False):
+    """
+    A topologia semáforo -> faixas é estática: é lida uma vez (start) e vira
+    arrays de índices. Cada faixa distinta é inscrita uma vez enquanto a IA
+    está ligada, e as métricas por semáforo saem de reduções segmentadas
+    (reduceat) sobre o array das faixas, sem RPC por faixa.
+
+    As decisões (signal_control) saem a cada decision_interval segundos e só
+    em fases verdes; a fase de cada semáforo vem da subscription dos semáforos.
+    """
+
+    def __init__(self, ai_enabled=False, conn=traci, strategy=DEFAULT_STRATEGY,
+                 decision_interval=DECISION_INTERVAL):
         self.ai_enabled = ai_enabled
-        self.tls_timers = {} # Para evitar troca frenética de luzes
+        self.conn = conn # Conexão TraCI da sessão (padrão: conexão global)
+        self.strategy_name = strategy if strategy in STRATEGIES else DEFAULT_STRATEGY
+        self.strategy = None
+        self.decision_interval = decision_interval
+        self.tls_ids = None
+        self.lanes = []  # faixas distintas (controladas e de saída)
+        self.lane_index = None  # para cada faixa controlada (na ordem do semáforo): posição em lanes
+        self.starts = None  # início do segmento de cada semáforo em lane_index
+        self.counts = None
+        self.programs = {}
+        self.subscribed = False
+        self.writes = 0  # comandos que alteram os semáforos (setPhase/setPhaseDuration)
+        # Por semáforo: fase atual, quando começou, quando o SUMO vai encerrá-la e a fase verde pedida
+        self.phase, self.phase_start, self.phase_end, self.target = {}, {}, {}, {}
+        self.last_time = None
+        self.next_decision = 0.0
+
+    def attach(self, conn):
+        self.conn = conn
 
-    def set_ai_status(self, status: bool):
+    def set_ai_status(self, status: bool, strategy=None):
+        # Só sinaliza; (des)inscrição e troca de estratégia acontecem na thread da simulação
+        if strategy is not None:
+            if strategy not in STRATEGIES: raise ValueError(f"Estratégia desconhecida: {strategy}")
+            self.strategy_name = strategy
         self.ai_enabled = status
-        print(f"🧠 IA Status: {'ATIVADA' if status else 'DESATIVADA'}")
+        print(f"🧠 IA Status: {'ATIVADA' if status else 'DESATIVADA'} ({self.strategy_name})")
 
-    def step(self):
+    def start(self):
+        """Lê a topologia uma vez (faixas repetidas contam de novo, como no getControlledLanes)."""
+        self.tls_ids = list(self.conn.trafficlight.getIDList())
+        positions, index, counts = {}, [], []
+        for tls_id in self.tls_ids:
+            controlled = self.conn.trafficlight.getControlledLanes(tls_id)
+            counts.append(len(controlled))
+            for lane in controlled:
+                index.append(positions.setdefault(lane, len(positions)))
+        for tls_id in self.tls_ids:
+            prog = TlsProgram(self.conn, tls_id, positions)
+            # Com uma fase verde só não há o que decidir
+            if len(prog.green) > 1: self.programs[tls_id] = prog
+            # Mesmas variáveis do SimulationSnapshot (subscription repetida não muda nada)
+            self.conn.trafficlight.subscribe(tls_id, TLS_VARS)
+        self.lanes = list(positions)
+        self.lane_index = np.asarray(index, dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.starts = np.concatenate(([0], np.cumsum(self.counts)[:-1])).astype(np.int64)
+
+    def reset(self):
+        """Depois de um loadState: as subscriptions caíram e fases/tempos são os do checkpoint."""
+        self.subscribed = False
+        self.strategy = None
+        self.phase.clear()
+        self.target.clear()
+        self.last_time = None
+        self.next_decision = 0.0
+
+    def _subscribe(self, enabled):
+        for lane in self.lanes:
+            if enabled: self.conn.lane.subscribe(lane, LANE_VARS)
+            else: self.conn.lane.unsubscribe(lane)
+        self.subscribed = enabled
+        if not enabled: self._restore_programs()
+        self.phase.clear()
+        self.target.clear()
+
+    def _lane_metrics(self):
+        results = self.conn.lane.getAllSubscriptionResults()
+        values = np.zeros((len(self.lanes), len(LANE_VARS)))
+        for i, lane in enumerate(self.lanes):
+            lane_values = results.get(lane)
+            if lane_values: values[i] = [lane_values[var] for var in LANE_VARS]
+        return dict(zip(METRICS, values.T))
+
+    def step(self, now=None):
+        if self.tls_ids is None: self.start()
+        if self.ai_enabled != self.subscribed: self._subscribe(self.ai_enabled)
         # Se IA desligada, deixa o SUMO controlar (tempo fixo)
         if not self.ai_enabled:
             return {}
+        if now is None: now = self.conn.simulation.getTime()
+        if self.strategy is None or self.strategy.name != self.strategy_name:
+            self._restore_programs()
+            self.strategy = STRATEGIES[self.strategy_name](self)
+
+        metrics = self._lane_metrics()
+        self.strategy.observe(now, metrics)
+        self._control(now, metrics)
+        self.last_time = now
+
+        # Fila máxima e espera média das faixas de cada semáforo
+        max_queue = np.zeros(len(self.tls_ids))
+        total_wait = np.zeros(len(self.tls_ids))
+        has_lanes = self.counts > 0
+        if len(self.lane_index):
+            starts = self.starts[has_lanes]
+            max_queue[has_lanes] = np.maximum.reduceat(metrics["halting"][self.lane_index], starts)
+            total_wait[has_lanes] = np.add.reduceat(metrics["wait"][self.lane_index], starts)
+        avg_wait = total_wait / np.maximum(self.counts, 1)
+
+        # Log para salvar no banco
+        return [{
+            "traffic_light_id": tls_id,
+            "queue_length": q,
+            "avg_wait_time": w,
+            "is_ai_active": True
+        } for tls_id, q, w in zip(self.tls_ids, max_queue.astype(int).tolist(), avg_wait.tolist())]
+
+    # --- controle ---
+    def _set_phase(self, tls_id, phase, now):
+        self.conn.trafficlight.setPhase(tls_id, phase)
+        self.writes += 1
+        self._enter(tls_id, phase, now)
+
+    def _set_duration(self, tls_id, seconds, now):
+        self.conn.trafficlight.setPhaseDuration(tls_id, seconds)
+        self.writes += 1
+        self.phase_end[tls_id] = now + seconds
+
+    def _enter(self, tls_id, phase, now):
+        self.phase[tls_id] = phase
+        self.phase_start[tls_id] = now
+        self.phase_end[tls_id] = now + self.programs[tls_id].durations[phase]
+
+    def apply_plan(self, tls_id, plan):
+        """
+        Reescreve a duração das fases verdes ({fase: s}); vale a partir da próxima fase.
+        Sem mudança não escreve nada; com mudança, a fase atual mantém o tempo que
+        faltava (setProgramLogic reinicia a contagem dela).
+        """
+        prog = self.programs[tls_id]
+        plan = {phase: seconds for phase, seconds in plan.items() if float(seconds) != prog.durations[phase]}
+        if not plan: return
+        logic = prog.logic
+        remaining = self.conn.trafficlight.getNextSwitch(tls_id) - self.conn.simulation.getTime()
+        for phase, seconds in plan.items():
+            p = logic.phases[phase]
+            if p.minDur == p.maxDur: p.minDur = p.maxDur = seconds
+            p.duration = seconds
+            prog.durations[phase] = float(seconds)
+        logic.currentPhaseIndex = self.phase.get(tls_id, logic.currentPhaseIndex)
+        self.conn.trafficlight.setProgramLogic(tls_id, logic)
+        self.conn.trafficlight.setPhaseDuration(tls_id, max(remaining, 0.0))
+        self.writes += 2
+
+    def _restore_programs(self):
+        for tls_id, prog in self.programs.items():
+            changed = {p: prog.base_durations[p] for p in prog.green if prog.durations[p] != prog.base_durations[p]}
+            if changed: self.apply_plan(tls_id, changed)
+
+    def _control(self, now, metrics):
+        tls_results = self.conn.trafficlight.getAllSubscriptionResults()
+        dt = now - self.last_time if self.last_time is not None else 0.0
+        for tls_id, prog in self.programs.items():
+            values = tls_results.get(tls_id)
+            if not values or tc.TL_CURRENT_PHASE not in values: continue
+            phase = values[tc.TL_CURRENT_PHASE]
+            if self.phase.get(tls_id) != phase:
+                target = self.target.pop(tls_id, None)
+                if target is not None and phase not in prog.min_green: self.target[tls_id] = target
+                elif target is not None and phase != target:
+                    # Programa chegou a outra fase verde antes do pulo: vai direto para a pedida
+                    self._set_phase(tls_id, target, now)
+                    continue
+                self._enter(tls_id, phase, now)
+            target = self.target.get(tls_id)
+            # Último passo da transição: se a próxima fase é um verde diferente do pedido, pula para ele
+            following = (phase + 1) % len(prog.states)
+            if (target is not None and following in prog.min_green and following != target
+                    and self.phase_end[tls_id] - now <= dt + 1e-6):
+                self.target.pop(tls_id)
+                self._set_phase(tls_id, target, now)
+
+        if now < self.next_decision: return
+        self.next_decision = now + self.decision_interval
+        for tls_id, prog in self.programs.items():
+            phase = self.phase.get(tls_id)
+            # Só age em fase verde e sem troca em andamento
+            if phase not in prog.min_green or tls_id in self.target: continue
+            action = self.strategy.decide(tls_id, prog, phase, metrics)
+            elapsed = now - self.phase_start[tls_id]
+            if action == EXTEND:
+                # Só escreve se o verde acabaria antes da próxima decisão; aí estende até o máximo
+                end = self.phase_start[tls_id] + prog.max_green[phase]
+                if self.phase_end[tls_id] - now < self.decision_interval and end > self.phase_end[tls_id] + 1e-6:
+                    self._set_duration(tls_id, end - now, now)
+            elif action is not None and action != phase and elapsed >= prog.min_green[phase]:
+                self._switch(tls_id, prog, phase, action, now)
 
-        logs = []
-        tls_ids = traci.trafficlight.getIDList()
-
-        for tls_id in tls_ids:
-            # Lógica Simples de IA Adaptativa:
-            # Verifica todas as faixas controladas por esse semáforo
-            controlled_lanes = traci.trafficlight.getControlledLanes(tls_id)
-            
-            max_queue = 0
-            total_wait = 0
-            
-            for lane in controlled_lanes:
-                # Pega numero de carros parados na faixa
-                queue = traci.lane.getLastStepHaltingNumber(lane)
-                # Pega tempo de espera acumulado
-                wait = traci.lane.getWaitingTime(lane)
-                
-                if queue > max_queue:
-                    max_queue = queue
-                total_wait += wait
-
-            # DECISÃO DA IA:
-            # Se a fila estiver grande (> 5 carros) e o sinal não trocou recentemente
-            # Força o verde para a via mais congestionada (Simplificação)
-            # No SUMO real, mudamos a "Phase" do programa
-            
-            current_phase = traci.trafficlight.getPhase(tls_id)
-            
-            # Log para salvar no banco
-            logs.append({
-                "traffic_light_id": tls_id,
-                "queue_length": max_queue,
-                "avg_wait_time": total_wait / (len(controlled_lanes) or 1),
-                "is_ai_active": True
-            })
-
-            # Exemplo de ação: Se fila > 10, estende o tempo da fase atual
-            if max_queue > 10:
-                traci.trafficlight.setPhaseDuration(tls_id, 60) # Dá mais tempo verde
-
-        return logs
\ No newline at end of file
+    def _switch(self, tls_id, prog, phase, target, now):
+        """Encerra o verde atual pela transição do programa (amarelo) e pede a fase alvo."""
+        following = (phase + 1) % len(prog.states)
+        if following in prog.min_green:
+            self._set_phase(tls_id, target, now)  # sem fase de transição no programa
+            return
+        self.target[tls_id] = target
+        self._set_phase(tls_id, following, now)
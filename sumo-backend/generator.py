@@ -1,17 +1,22 @@
 import os
 import shutil
-import random
+import hashlib
 import urllib.request
 import urllib.parse
 import ssl
 import subprocess
 from pathlib import Path
 import json
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-try:
-    from github import Github, Auth
-    HAS_GITHUB = True
-except ImportError: HAS_GITHUB = False
+from scenario_cache import ScenarioCache, make_key, normalize_city, round_bbox
+from net_stream import ElementTee
+from demand import generate_demand, load_net, DEFAULT_PROFILE, DEFAULT_WEIGHT, DEFAULT_MODE, DEFAULT_SEED
+
+from github_sync import HAS_GITHUB, connect as github_connect, upload_scenario
 
 try:
     from supabase import create_client
@@ -25,165 +30,333 @@ PROJECT_ROOT = Path("/app")
 SCENARIO_DIR = PROJECT_ROOT / "scenarios" 
 SCENARIO_DIR.mkdir(parents=True, exist_ok=True)
 
+RADIUS_KM = 1.5
+NETCONVERT_OPTS = ["--geometry.remove", "true", "--tls.guess", "true", "--output.street-names", "true"]
+# Parâmetros da demanda (entram na chave do cache: mudar qualquer um gera rotas novas)
+TRIPS_OPTS = {"engine": "demand", "profile": DEFAULT_PROFILE, "weight": DEFAULT_WEIGHT,
+              "mode": DEFAULT_MODE, "seed": DEFAULT_SEED}
+SYNC_BATCH = 50
+
 class ScenarioGeneratorAPI:
-    def __init__(self):
-        self.device_manifest = []
+    def __init__(self, out_dir=SCENARIO_DIR, on_stage=None):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        # on_stage(stages) é chamado a cada mudança de etapa (progresso do job)
+        self.on_stage = on_stage
+        self.stages = []
+        self.critical_path = []
+        self._stage_lock = threading.Lock()
         self.generated_macs = set()
+        self._client = None
         self.sb_url = os.getenv("SUPABASE_URL")
         self.sb_key = os.getenv("SUPABASE_KEY")
         self.gh_token = os.getenv("GITHUB_TOKEN")
-        self.repo_name = "RoHenPe/sumo-docker" 
-        self.repo_map_path = "scenarios" 
+        self.cache = ScenarioCache(SCENARIO_DIR / "cache")
+
+    @staticmethod
+    def scenario_key(city_name, num_vehicles, duration, radius_km=RADIUS_KM):
+        return make_key("scenario", city=normalize_city(city_name), radius_km=radius_km,
+                        vehicles=num_vehicles, duration=duration,
+                        netconvert=NETCONVERT_OPTS, trips=TRIPS_OPTS)
+
+    @staticmethod
+    def artifact_keys(bbox, num_vehicles, duration):
+        net_key = make_key("net", bbox=round_bbox(bbox), netconvert=NETCONVERT_OPTS)
+        routes_key = make_key("routes", net=net_key, vehicles=num_vehicles, duration=duration, trips=TRIPS_OPTS)
+        return net_key, routes_key
+
+    @classmethod
+    def cache_keys(cls, city_name, num_vehicles, duration, bbox):
+        return (cls.scenario_key(city_name, num_vehicles, duration),) + cls.artifact_keys(bbox, num_vehicles, duration)
+
+    @contextmanager
+    def _stage(self, name, deps=()):
+        stage = {"name": name, "status": "running", "started": time.time(), "elapsed": None}
+        if deps: stage["deps"] = list(deps)
+        with self._stage_lock:
+            self.stages.append(stage)
+            self._report()
+        t0 = time.perf_counter()
+        try:
+            yield stage
+            stage["status"] = "done"
+        except BaseException:
+            stage["status"] = "error"
+            raise
+        finally:
+            stage["elapsed"] = round(time.perf_counter() - t0, 3)
+            with self._stage_lock: self._report()
+
+    def _report(self):
+        if not self.on_stage: return
+        try: self.on_stage(self.stages)
+        except Exception as e: log(f"Erro ao reportar progresso: {e}", "WARN")
+
+    def _run_graph(self, graph):
+        """
+        Executa as etapas como grafo de dependências. graph = {nome: (deps, fn, opcional)};
+        fn(resultados) roda numa thread assim que as deps terminam. Falha de etapa
+        opcional só pula quem depende dela; falha obrigatória é relançada no fim.
+        """
+        results, failed, error = {}, set(), None
+        pending, running = dict(graph), {}
+        with ThreadPoolExecutor(max_workers=max(1, len(graph)), thread_name_prefix="gen") as pool:
+            while pending or running:
+                changed = True
+                while changed:
+                    changed = False
+                    for name, (deps, fn, optional) in list(pending.items()):
+                        if error or any(d in failed for d in deps):
+                            del pending[name]
+                            failed.add(name)
+                            with self._stage_lock:
+                                self.stages.append({"name": name, "status": "skipped", "started": None, "elapsed": None})
+                            changed = True
+                        elif all(d in results for d in deps):
+                            del pending[name]
+                            running[pool.submit(self._run_stage, name, deps, fn, results)] = (name, optional)
+                if not running:
+                    if pending: raise ValueError(f"Dependências inexistentes: {sorted(pending)}")
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, optional = running.pop(future)
+                    try: results[name] = future.result()
+                    except Exception as e:
+                        failed.add(name)
+                        if optional: log(f"Etapa '{name}' falhou: {e}", "WARN")
+                        else: error = error or e
+        self.critical_path = self._critical_path(graph)
+        if error: raise error
+        return results
+
+    def _run_stage(self, name, deps, fn, results):
+        with self._stage(name, deps): return fn(results)
+
+    def _critical_path(self, graph):
+        """Cadeia que terminou por último: da etapa final volta pela dependência mais tardia."""
+        end = {st["name"]: st["started"] + st["elapsed"] for st in self.stages
+               if st["name"] in graph and st["started"] is not None and st["elapsed"] is not None}
+        path, name = [], max(end, key=end.get, default=None)
+        while name is not None:
+            path.append(name)
+            name = max((d for d in graph[name][0] if d in end), key=end.get, default=None)
+        return path[::-1]
 
-    def _gen_mac(self):
+    def _net_graph(self, net_file, net_key, extra=()):
+        """
+        Etapas que só dependem do net: sync em streaming com o Supabase (memória não
+        cresce com a rede) e tiles simplificados da malha para o frontend. As duas
+        (e os ramos em extra, como a demanda) leem da mesma passada pelo arquivo (tee).
+        Tiles já gerados para este net saem do cache e o sync é pulado se o manifesto
+        diz que o Supabase já está com ele: sem nada a ler, o tee nem é criado.
+        Devolve (grafo, tee ou None).
+        """
+        from tiles import MIN_ZOOM, MAX_ZOOM
+        tiles_key = make_key("tiles", net=net_key, zooms=[MIN_ZOOM, MAX_ZOOM])
+        graph, branches = {}, list(extra)
+        with self._stage("tiles-cache"):
+            tiles_cached = self.cache.materialize_tree("tiles", tiles_key, self.out_dir / "tiles")
+        if tiles_cached: log("Tiles encontrados no cache.")
+        else:
+            branches.append("tiles")
+            graph["tiles"] = ((), lambda r: tee.consume("tiles", lambda elements: self._build_tiles(net_file, tiles_key, elements)), True)
+        sync = HAS_SUPABASE and bool(self.sb_url)
+        if sync and self._synced(net_key):
+            log("Supabase já sincronizado com esta rede (manifesto); sync pulado.")
+            sync = False
+        if sync:
+            branches.append("sync")
+            graph["sync"] = ((), lambda r: tee.consume("sync", lambda elements: self._sync(net_file, net_key, elements)), True)
+        tee = ElementTee(net_file, branches) if branches else None
+        return graph, tee
+
+    def _build_tiles(self, net_file, tiles_key=None, elements=None):
+        from tiles import build_tiles
+        index = build_tiles(net_file, self.out_dir / "tiles", elements=elements)
+        log(f"Tiles: {index['tiles']} arquivos, {index['bytes'] // 1024} KB "
+            f"({index['points_in']} pontos -> {index['points_out'][index['max_zoom']]} no zoom {index['max_zoom']}).")
+        if tiles_key: self.cache.put_tree("tiles", tiles_key, self.out_dir / "tiles")
+        return index
+
+    def _sync_key(self):
+        return make_key("sync", url=self.sb_url)
+
+    def _synced(self, net_key):
+        """O último sync completo neste Supabase foi desta rede (as tabelas guardam só uma)."""
+        manifest = self.cache.get_json("sync", self._sync_key())
+        return bool(manifest and manifest.get("net") == net_key)
+
+    def _sync(self, net_file, net_key, elements=None):
+        results = self._stream_sync(net_file, elements)
+        if results is not None: self.cache.put_json("sync", self._sync_key(), {"net": net_key, "time": time.time()})
+        return results
+
+    def _supabase(self):
+        """Client único por gerador (reaproveita a conexão HTTP entre os lotes)."""
+        if self._client is None: self._client = create_client(self.sb_url, self.sb_key)
+        return self._client
+
+    def _stream_sync(self, net_file, elements=None):
+        if not HAS_SUPABASE or not self.sb_url: return
+        from net_stream import iter_net
+        from supabase_sync import TableSync
+        client = self._supabase()
+        # Diff por hash contra o que já está no servidor: só insere/atualiza/apaga o que mudou
+        roads = TableSync(client, "rede_viaria", key="id").begin()
+        devices = TableSync(client, "dispositivos", key="mac_address").begin()
+        results, errors, complete = {}, [], False
+        try:
+            for kind, batch in iter_net(net_file, SYNC_BATCH, elements):
+                if kind == "road": roads.feed(batch)
+                else: devices.feed(self._device_rows(batch))
+            complete = True
+        finally:
+            # Leitura incompleta: envia o que já foi lido, mas não apaga nada
+            for sync in (roads, devices):
+                try: results[sync.table] = sync.finish(delete_stale=complete)
+                except RuntimeError as e: errors.append(e)
+        if errors: raise errors[0]
+        for table, stats in results.items():
+            log(f"Tabela '{table}': {stats['inserted']} novos, {stats['updated']} alterados, "
+                f"{stats['deleted']} removidos, {stats['unchanged']} iguais ({stats['elapsed_s']}s).")
+        return results
+
+    def _device_rows(self, sites):
+        rows = []
+        for site in sites:
+            lat, lon = site["latitude"], site["longitude"]
+            rows.append({"mac_address": self._device_mac(site["id"], "SEMAFARO"), "tipo": "SEMAFARO", "latitude": lat, "longitude": lon, "status": "active"})
+            rows.append({"mac_address": self._device_mac(site["id"], "CAMERA"), "tipo": "CAMERA", "latitude": lat+0.0001, "longitude": lon+0.0001, "status": "active"})
+        return rows
+
+    def _device_mac(self, tls_id, tipo):
+        """MAC fixo por semáforo + tipo (regerar a mesma cidade não muda os dispositivos)."""
+        salt = 0
         while True:
-            mac = ":".join([f"{random.randint(0, 255):02X}" for _ in range(6)])
+            digest = bytearray(hashlib.sha1(f"{tls_id}:{tipo}:{salt}".encode()).digest()[:6])
+            digest[0] = (digest[0] & 0xFC) | 0x02  # unicast, administrado localmente
+            mac = ":".join(f"{b:02X}" for b in digest)
             if mac not in self.generated_macs:
                 self.generated_macs.add(mac)
                 return mac
+            salt += 1
 
-    def generate(self, city_name, num_vehicles=300, duration=1000):
+    def generate(self, city_name, num_vehicles=300, duration=1000, radius_km=RADIUS_KM):
         log(f"=== INICIANDO GERAÇÃO OSM: {city_name} ===")
         
-        osm_file = SCENARIO_DIR / "map.osm.xml"
-        net_file = SCENARIO_DIR / "simulacao.net.xml"
-        rou_file = SCENARIO_DIR / "simulacao.rou.xml"
-        cfg_file = SCENARIO_DIR / "simulacao.sumocfg"
+        osm_file = self.out_dir / "map.osm.xml"
+        net_file = self.out_dir / "simulacao.net.xml"
+        rou_file = self.out_dir / "simulacao.rou.xml"
+        cfg_file = self.out_dir / "simulacao.sumocfg"
+
+        # 0. Cache: mesmo cenário já gerado antes -> só copia os arquivos
+        scenario_key = self.scenario_key(city_name, num_vehicles, duration, radius_km)
+        with self._stage("cache"):
+            hit = self.cache.get_json("scenario", scenario_key)
+            cached = bool(hit and self.cache.materialize("net", hit["net"], net_file)
+                          and self.cache.materialize("routes", hit["routes"], rou_file))
+        if cached:
+            log("Cenário encontrado no cache (sem download/netconvert/demanda).")
+            self._write_cfg(cfg_file, duration)
+            graph, tee = self._net_graph(net_file, hit["net"])
+            if tee: log(f"Lendo a rede para: {', '.join(graph)}...")
+            try: self._run_graph(graph)
+            finally:
+                if tee: tee.close()
+            return {"status": "success", "city": city_name, "cached": True, "stages": self.stages,
+                    "critical_path": self.critical_path}
 
-        if osm_file.exists(): os.remove(osm_file)
-        
         # 1. Download
-        bbox, lat, lon = self._get_bbox_from_city(city_name)
-        self._download_map(bbox, osm_file)
-        
-        # 2. Conversão
-        log("Convertendo OSM para SUMO...")
-        try:
-            self._build_net(osm_file, net_file, bbox)
-        except subprocess.CalledProcessError as e:
-            log(f"ERRO NETCONVERT (Ignoravel se gerou arquivo): {e}", "WARN")
-        
-        # 3. Sync Supabase
-        log("Sincronizando com Supabase...")
-        try:
-            roads_data = self._extract_sumo_geometry(net_file)
-            self._sync_roads_to_supabase(roads_data)
-            self._generate_devices(net_file)
-            self._sync_devices_db()
-        except Exception as e:
-            log(f"Erro sync dados: {e}", "WARN")
+        with self._stage("geocode"):
+            bbox, lat, lon = self._get_bbox_from_city(city_name, radius_km)
+        net_key, routes_key = self.artifact_keys(bbox, num_vehicles, duration)
+        osm_key = make_key("osm", bbox=round_bbox(bbox))
+
+        if not self.cache.materialize("net", net_key, net_file):
+            with self._stage("download"):
+                if not self.cache.materialize("osm", osm_key, osm_file):
+                    if osm_file.exists(): os.remove(osm_file)
+                    self._download_map(bbox, osm_file)
+                    self.cache.put("osm", osm_key, osm_file, {"city": city_name})
+            
+            # 2. Conversão
+            log("Convertendo OSM para SUMO...")
+            with self._stage("netconvert"):
+                if net_file.exists(): os.remove(net_file)
+                try:
+                    self._build_net(osm_file, net_file, bbox)
+                except subprocess.CalledProcessError as e:
+                    log(f"ERRO NETCONVERT (Ignoravel se gerou arquivo): {e}", "WARN")
+                if net_file.exists(): self.cache.put("net", net_key, net_file, {"city": city_name})
+            # O OSM bruto já está no cache; não precisa ficar no diretório do cenário
+            if osm_file.exists(): os.remove(osm_file)
         
-        # 4. Tráfego
-        log("Gerando tráfego...")
-        self._gen_trips(net_file, rou_file, duration, num_vehicles)
+        # 3-5. Depois do netconvert: sync (Supabase), tráfego e GitHub como grafo.
+        # Demanda (demand.py, no processo) roda junto com a extração; uploads sobrepõem o CPU.
+        self._write_cfg(cfg_file, duration)
 
-        with open(cfg_file, 'w') as f:
-            f.write(f"""<configuration><input><net-file value="simulacao.net.xml"/><route-files value="simulacao.rou.xml"/></input><time><begin value="0"/><end value="{duration}"/></time></configuration>""")
+        # Uma passada pelo net alimenta sync, tiles e o grafo da demanda
+        graph, tee = self._net_graph(net_file, net_key, extra=("demand",))
 
-        # 5. GitHub
-        log("Salvando no GitHub...")
-        self._upload_scenario_to_github(city_name, [
-            (net_file, f"{city_name}.net.xml"),
-            (rou_file, f"{city_name}.rou.xml"),
-            (cfg_file, f"{city_name}.sumocfg")
-        ])
+        def trips(elements):
+            if not self.cache.materialize("routes", routes_key, rou_file):
+                load_net(net_file, elements)  # fica no cache do processo; o generate_demand reaproveita
+                self._gen_trips(net_file, rou_file, duration, num_vehicles)
+                self.cache.put("routes", routes_key, rou_file, {"city": city_name, "vehicles": num_vehicles, "duration": duration})
+            self.cache.put_json("scenario", scenario_key, {"net": net_key, "routes": routes_key, "bbox": bbox,
+                                                           "center": [lat, lon]}, {"city": city_name})
 
-        return {"status": "success", "city": city_name}
+        def github(r):
+            self._upload_scenario_to_github(city_name, [
+                (net_file, f"{city_name}.net.xml"),
+                (rou_file, f"{city_name}.rou.xml"),
+                (cfg_file, f"{city_name}.sumocfg")
+            ])
 
-    def _sync_roads_to_supabase(self, roads_data):
-        if not HAS_SUPABASE or not self.sb_url: return
-        try:
-            client = create_client(self.sb_url, self.sb_key)
-            # CORREÇÃO UUID: Deleta filtrando por nome, não por ID zero
-            try: client.table("rede_viaria").delete().neq("name", "SYSTEM_INIT_CHECK").execute()
-            except: pass 
-            
-            batch_size = 50
-            for i in range(0, len(roads_data), batch_size):
-                batch = roads_data[i:i+batch_size]
-                client.table("rede_viaria").upsert(batch).execute()
-            log("Tabela 'rede_viaria' atualizada.")
-        except Exception as e:
-            log(f"Erro Supabase (Ruas): {e}", "ERROR")
+        log("Sincronizando com Supabase, gerando tráfego e salvando no GitHub...")
+        graph["trips"] = ((), lambda r: tee.consume("demand", trips), False)
+        graph["github"] = (("trips",), github, True)
+        try: self._run_graph(graph)
+        finally: tee.close()
 
-    def _sync_devices_db(self):
-        if not HAS_SUPABASE or not self.sb_url: return
-        try:
-            client = create_client(self.sb_url, self.sb_key)
-            if not self.device_manifest: return
-            
-            # CORREÇÃO UUID: Deleta filtrando por MAC, não por ID zero
-            try: client.table("dispositivos").delete().neq("mac_address", "00:00:00:00:00:00").execute()
-            except: pass
+        return {"status": "success", "city": city_name, "stages": self.stages,
+                "critical_path": self.critical_path}
 
-            client.table("dispositivos").upsert(self.device_manifest).execute()
-            log(f"Inseridos {len(self.device_manifest)} dispositivos.")
-        except Exception as e:
-            log(f"Erro Supabase (Devices): {e}", "ERROR")
+    def _write_cfg(self, cfg_file, duration):
+        with open(cfg_file, 'w') as f:
+            f.write(f"""<configuration><input><net-file value="simulacao.net.xml"/><route-files value="simulacao.rou.xml"/></input><time><begin value="0"/><end value="{duration}"/></time></configuration>""")
 
     def _upload_scenario_to_github(self, city_slug, files_to_upload):
         if not HAS_GITHUB or not self.gh_token: return
         try:
-            g = Github(auth=Auth.Token(self.gh_token))
-            try: repo = g.get_repo(self.repo_name)
-            except: repo = g.get_user().get_repo(self.repo_name.split('/')[-1])
-            
-            for local_path, remote_name in files_to_upload:
-                if not local_path.exists(): continue
-                remote_path = f"{self.repo_map_path}/{city_slug}/{remote_name}"
-                with open(local_path, 'r', encoding='utf-8', errors='ignore') as f: content = f.read()
-                try:
-                    c = repo.get_contents(remote_path)
-                    repo.update_file(c.path, f"Update {remote_name}", content, c.sha)
-                except:
-                    repo.create_file(remote_path, f"Create {remote_name}", content)
+            stats = upload_scenario(github_connect(self.gh_token), city_slug, files_to_upload, log=log)
+            log(f"GitHub: {stats['uploaded']} enviados ({stats['bytes'] // 1024} KB), {stats['skipped']} iguais, "
+                f"commit {stats['commit'] or '-'}.")
         except Exception as e:
             log(f"Erro GitHub: {e}", "ERROR")
 
-    def _extract_sumo_geometry(self, net_file):
-        import sumolib
-        net = sumolib.net.readNet(str(net_file))
-        roads = []
-        for edge in net.getEdges():
-            if edge.getFunction() == "internal": continue
-            geo_shape = [[net.convertXY2LonLat(x,y)[1], net.convertXY2LonLat(x,y)[0]] for x,y in edge.getShape()]
-            speed = edge.getSpeed()
-            rtype = 'rodovia' if speed > 20 else 'primaria' if speed > 13 else 'secundaria'
-            roads.append({
-                'id': edge.getID(), 
-                'name': edge.getName() or edge.getID(),
-                'type': rtype,
-                'points': geo_shape,
-                'style': {'color': '#22c55e' if rtype == 'primaria' else '#eab308'}
-            })
-        return roads
-
-    def _generate_devices(self, net_file):
-        import sumolib
-        net = sumolib.net.readNet(str(net_file))
-        self.device_manifest = []
-        for tls in net.getTrafficLights():
-            conns = tls.getConnections()
-            if not conns: continue
-            lane = conns[0][0]
-            sx, sy = lane.getShape()[-1]
-            lon, lat = net.convertXY2LonLat(sx, sy)
-            self.device_manifest.append({"mac_address": self._gen_mac(), "tipo": "SEMAFARO", "latitude": lat, "longitude": lon, "status": "active"})
-            self.device_manifest.append({"mac_address": self._gen_mac(), "tipo": "CAMERA", "latitude": lat+0.0001, "longitude": lon+0.0001, "status": "active"})
-
-    def _get_bbox_from_city(self, city, radius_km=1.5):
-        try:
-            q = urllib.parse.quote(city)
-            url = f"https://nominatim.openstreetmap.org/search?q={q}&format=json&limit=1"
-            req = urllib.request.Request(url, headers={'User-Agent': 'Fluxus/1.0'})
-            ctx = ssl.create_default_context(); ctx.check_hostname=False; ctx.verify_mode=ssl.CERT_NONE
-            with urllib.request.urlopen(req, context=ctx, timeout=10) as r:
-                data = json.loads(r.read())
-                lat, lon = float(data[0]['lat']), float(data[0]['lon'])
-                offset = radius_km / 111.0
-                return (lat - offset, lon - offset, lat + offset, lon + offset), lat, lon
-        except:
-            return (-23.56-0.01, -46.65-0.01, -23.56+0.01, -46.65+0.01), -23.56, -46.65
+    def _geocode(self, city):
+        key = make_key("geocode", city=normalize_city(city))
+        hit = self.cache.get_json("geocode", key)
+        if hit: return hit["lat"], hit["lon"]
+        q = urllib.parse.quote(city)
+        url = f"https://nominatim.openstreetmap.org/search?q={q}&format=json&limit=1"
+        req = urllib.request.Request(url, headers={'User-Agent': 'Fluxus/1.0'})
+        ctx = ssl.create_default_context(); ctx.check_hostname=False; ctx.verify_mode=ssl.CERT_NONE
+        with urllib.request.urlopen(req, context=ctx, timeout=10) as r:
+            data = json.loads(r.read())
+            lat, lon = float(data[0]['lat']), float(data[0]['lon'])
+        self.cache.put_json("geocode", key, {"lat": lat, "lon": lon}, {"city": city})
+        return lat, lon
+
+    def _get_bbox_from_city(self, city, radius_km=RADIUS_KM):
+        # Sem fallback: um bbox genérico seria gravado no cache com a chave desta cidade
+        try: lat, lon = self._geocode(city)
+        except (OSError, ValueError, LookupError) as e:
+            raise RuntimeError(f"Geocodificação falhou para '{city}': {e}") from e
+        offset = radius_km / 111.0
+        return (lat - offset, lon - offset, lat + offset, lon + offset), lat, lon
 
     def _download_map(self, bbox, target):
         s, w, n, e = bbox
@@ -194,15 +367,16 @@ class ScenarioGeneratorAPI:
     def _build_net(self, osm, net, bbox):
         s, w, n, e = bbox
         cmd = ["netconvert", "--osm-files", str(osm), "-o", str(net), 
-               "--keep-edges.in-geo-boundary", f"{w},{s},{e},{n}",
-               "--geometry.remove", "true", "--tls.guess", "true", "--output.street-names", "true"]
+               "--keep-edges.in-geo-boundary", f"{w},{s},{e},{n}"] + NETCONVERT_OPTS
         subprocess.run(cmd, check=True)
 
     def _gen_trips(self, net_file, rou_file, duration, vehicles):
-        if "SUMO_HOME" not in os.environ: os.environ["SUMO_HOME"] = "/usr/share/sumo"
-        trips_script = os.path.join(os.environ['SUMO_HOME'], 'tools', 'randomTrips.py')
-        subprocess.run(["python3", trips_script, "-n", str(net_file), "-r", str(rou_file), "-e", str(duration), "-p", str(float(duration)/vehicles), "--validate"], check=True)
+        stats = generate_demand(net_file, rou_file, vehicles, duration, TRIPS_OPTS["seed"], TRIPS_OPTS["profile"],
+                                TRIPS_OPTS["weight"], TRIPS_OPTS["mode"])
+        log(f"Demanda: {stats['vehicles']} veículos ({TRIPS_OPTS['mode']}, {TRIPS_OPTS['profile']}), "
+            f"{stats['bytes'] // 1024} KB em {stats['elapsed_s']}s.")
 
-def generate_scenario(city_name, max_vehicles=300):
-    gen = ScenarioGeneratorAPI()
-    return gen.generate(city_name, max_vehicles)
\ No newline at end of file
+def generate_scenario(city_name, max_vehicles=300, duration=1000, out_dir=SCENARIO_DIR, on_stage=None,
+                      radius_km=RADIUS_KM):
+    gen = ScenarioGeneratorAPI(out_dir=out_dir, on_stage=on_stage)
+    return gen.generate(city_name, max_vehicles, duration, radius_km)
\ No newline at end of file
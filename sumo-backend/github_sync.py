@@ -0,0 +1,122 @@
+"""
+Publicação dos arquivos de um cenário no GitHub (scenarios/<cidade>/ do repo).
+
+Em vez de get_contents + create/update_file por arquivo (dois round-trips cada,
+reenvio de conteúdo igual e o limite da contents API para redes grandes), usa a
+Git Data API:
+  - o SHA de blob do git é calculado localmente (sha1 de "blob <n>\\0" + bytes) e
+    comparado com a árvore remota do diretório: arquivo igual não é enviado;
+  - os blobs que mudaram sobem em paralelo e entram numa única árvore/commit
+    por cenário (nada muda: nenhum commit);
+  - redes acima de GZIP_MIN_BYTES vão como <nome>.gz (gzip com mtime=0, então o
+    hash é estável entre gerações); a versão da outra forma é apagada do diretório.
+
+Se a branch andar no meio (outro job publicou), o commit é refeito sobre a ponta
+nova com os mesmos blobs. GITHUB_API_URL aponta para GitHub Enterprise ou para
+um servidor local que imite a API.
+"""
+import os
+import gzip
+import base64
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from github import Github, Auth, InputGitTreeElement, GithubException
+    HAS_GITHUB = True
+except ImportError: HAS_GITHUB = False
+
+API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+REPO_NAME = os.getenv("GITHUB_REPO", "RoHenPe/sumo-docker")
+BRANCH = os.getenv("GITHUB_BRANCH")  # padrão: a branch default do repo
+REMOTE_DIR = "scenarios"
+WORKERS = int(os.getenv("GITHUB_UPLOAD_WORKERS", "4"))
+GZIP_MIN_BYTES = int(float(os.getenv("GITHUB_GZIP_MB", "5")) * 1024 * 1024)
+GZIP_SUFFIXES = (".net.xml",)
+MAX_BLOB_BYTES = 100 * 1024 * 1024  # limite de arquivo do GitHub
+COMMIT_RETRIES = 3
+
+
+def blob_sha(data):
+    """SHA que o git dá ao blob com esse conteúdo (o mesmo da árvore remota)."""
+    h = hashlib.sha1(b"blob %d\0" % len(data))
+    h.update(data)
+    return h.hexdigest()
+
+
+def prepare(local_path, remote_name):
+    """(nome remoto, bytes, nome da outra forma): comprime redes grandes."""
+    with open(local_path, "rb") as f: data = f.read()
+    if remote_name.endswith(GZIP_SUFFIXES):
+        if len(data) >= GZIP_MIN_BYTES:
+            return remote_name + ".gz", gzip.compress(data, mtime=0), remote_name
+        return remote_name, data, remote_name + ".gz"
+    return remote_name, data, None
+
+
+def connect(token, api_url=API_URL, repo_name=REPO_NAME):
+    g = Github(auth=Auth.Token(token), base_url=api_url, pool_size=WORKERS)
+    try: return g.get_repo(repo_name)
+    except GithubException: return g.get_user().get_repo(repo_name.split('/')[-1])
+
+
+def _subtree(repo, tree_sha, parts):
+    """{nome: sha} do diretório parts dentro da árvore (vazio se não existe)."""
+    entries = repo.get_git_tree(tree_sha).tree
+    for part in parts:
+        sha = next((e.sha for e in entries if e.path == part and e.type == "tree"), None)
+        if sha is None: return {}
+        entries = repo.get_git_tree(sha).tree
+    return {e.path: e.sha for e in entries if e.type == "blob"}
+
+
+def upload_scenario(repo, city_slug, files, branch=BRANCH, log=print):
+    """
+    files: [(caminho local, nome remoto)]. Devolve o resumo
+    {uploaded, skipped, deleted, bytes, commit}; commit é None se nada mudou.
+    """
+    branch = branch or repo.default_branch
+    base = f"{REMOTE_DIR}/{city_slug}"
+    local = [prepare(path, name) for path, name in files if os.path.exists(path)]
+    for name, data, _ in local:
+        if len(data) > MAX_BLOB_BYTES: log(f"GitHub: {name} tem {len(data) >> 20} MB, acima do limite; ignorado", "WARN")
+    local = [(name, data, other) for name, data, other in local if len(data) <= MAX_BLOB_BYTES]
+    hashes = {name: blob_sha(data) for name, data, _ in local}
+    uploaded = {}  # nome -> sha do blob já criado (vale entre tentativas)
+    summary = {"uploaded": 0, "skipped": 0, "deleted": 0, "bytes": 0, "commit": None}
+
+    for attempt in range(COMMIT_RETRIES):
+        ref = repo.get_git_ref(f"heads/{branch}")
+        head = repo.get_git_commit(ref.object.sha)
+        remote = _subtree(repo, head.tree.sha, base.split("/"))
+        changed = [(name, data) for name, data, _ in local if remote.get(name) != hashes[name]]
+        stale = [other for _, _, other in local if other and other in remote]
+        summary.update(skipped=len(local) - len(changed), deleted=len(stale))
+        if not changed and not stale: return summary
+
+        def create(item):
+            name, data = item
+            blob = repo.create_git_blob(base64.b64encode(data).decode(), "base64")
+            return name, blob.sha, len(data)
+        pending = [item for item in changed if item[0] not in uploaded]
+        with ThreadPoolExecutor(min(WORKERS, len(pending)) or 1) as pool:
+            for name, sha, size in pool.map(create, pending):
+                uploaded[name] = sha
+                summary["bytes"] += size
+        summary["uploaded"] = len(changed)
+
+        elements = [InputGitTreeElement(f"{base}/{name}", "100644", "blob", sha=uploaded[name]) for name, _ in changed]
+        elements += [InputGitTreeElement(f"{base}/{name}", "100644", "blob", sha=None) for name in stale]
+        tree = repo.create_git_tree(elements, base_tree=head.tree)
+        names = ", ".join(name for name, _ in changed) or "remoção"
+        commit = repo.create_git_commit(f"Cenário {city_slug}: {names}", tree, [head])
+        try:
+            ref.edit(commit.sha)
+        except GithubException as e:
+            # 422: a branch andou (não é fast-forward); refaz sobre a ponta nova
+            if e.status != 422 or attempt == COMMIT_RETRIES - 1: raise
+            log(f"GitHub: {branch} mudou durante o commit, tentando de novo", "WARN")
+            continue
+        summary["commit"] = commit.sha
+        return summary
+    return summary
@@ -0,0 +1,266 @@
+"""
+Avaliação em lote, sem cliente e sem ritmo: roda cenários o mais rápido que o
+SUMO consegue, em paralelo nos núcleos, e resume os KPIs do tripinfo/summary.
+
+Uso (dentro do container):
+    python headless.py scenarios/osasco --controller off,max_pressure,webster --seeds 1-5 [--end 3600] [--json saida.json]
+
+Controladores: off (programa fixo do net, SUMO puro sem TraCI), on (IA com a
+estratégia padrão) ou o nome de uma estratégia de signal_control. Com IA o
+passo a passo usa libsumo quando instalado (--backend traci força o socket).
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import statistics
+import subprocess
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from simulation_worker import STEP_LENGTH
+from signal_control import STRATEGIES, DEFAULT_STRATEGY
+
+SUMO_ARGS = ["--step-length", str(STEP_LENGTH), "--no-warnings", "--no-step-log"]
+CONTROLLERS = ("off", "on") + tuple(STRATEGIES)
+KPIS = ("throughput_vph", "trips", "mean_travel_time", "mean_waiting_time", "mean_halts",
+        "mean_time_loss", "mean_halting", "steps_per_s")
+
+
+def scenario_cmd(scenario_dir, binary="sumo"):
+    """Monta o comando do SUMO para uma pasta de cenário (sumocfg ou net + rou)."""
+    for cfg in sorted(glob.glob(os.path.join(scenario_dir, "*.sumocfg"))):
+        if os.path.getsize(cfg) > 0:
+            return [binary, "-c", cfg] + SUMO_ARGS
+    nets = sorted(glob.glob(os.path.join(scenario_dir, "*.net.xml*")))
+    routes = sorted(glob.glob(os.path.join(scenario_dir, "*.rou.xml*")))
+    if not nets or not routes:
+        raise FileNotFoundError(f"Cenário incompleto em {scenario_dir}: precisa de .sumocfg ou .net.xml + .rou.xml")
+    return [binary, "-n", nets[0], "-r", ",".join(routes)] + SUMO_ARGS
+
+
+def scenario_net(scenario_dir):
+    """Caminho do .net.xml usado pelo cenário."""
+    for cfg in sorted(glob.glob(os.path.join(scenario_dir, "*.sumocfg"))):
+        if os.path.getsize(cfg) == 0: continue
+        node = ET.parse(cfg).find(".//net-file")
+        if node is not None:
+            return os.path.join(os.path.dirname(cfg), node.get("value"))
+    nets = sorted(glob.glob(os.path.join(scenario_dir, "*.net.xml*")))
+    return nets[0] if nets else None
+
+
+# Grade georreferenciada perto de Osasco (UTM 23S) para os nets sintéticos
+GRID_PROJ = "+proj=utm +zone=23 +south +ellps=WGS84 +datum=WGS84 +units=m +no_defs"
+GRID_OFFSET = "-320000.00,-7396000.00"
+
+
+def grid_net(size, out_dir):
+    """Net sintético size x size com semáforos (netgenerate), georreferenciado como um net do OSM."""
+    net_file = os.path.join(out_dir, f"grid{size}.net.xml")
+    if os.path.exists(net_file): return net_file
+    raw = net_file + ".raw"
+    subprocess.run(["netgenerate", "--grid", "--grid.number", str(size), "--grid.length", "100",
+                    "--default.lanenumber", "2", "--tls.guess", "true", "-o", raw],
+                   check=True, stdout=subprocess.DEVNULL)
+    with open(raw) as src, open(net_file, "w") as dst:
+        for line in src:
+            if "<location " in line:
+                line = re.sub(r'netOffset="[^"]*"', f'netOffset="{GRID_OFFSET}"', line)
+                line = re.sub(r'projParameter="[^"]*"', f'projParameter="{GRID_PROJ}"', line)
+            dst.write(line)
+    os.remove(raw)
+    return net_file
+
+
+def grid_scenario(size, vehicles, duration, out_dir):
+    """Pasta de cenário sintética (grid_net + demanda do demand.py) para quem não tem um cenário gerado."""
+    from demand import generate_demand
+    scenario_dir = os.path.join(out_dir, f"grid{size}-{vehicles}-{int(duration)}")
+    rou_file = os.path.join(scenario_dir, "grid.rou.xml")
+    if os.path.exists(rou_file): return scenario_dir
+    os.makedirs(scenario_dir, exist_ok=True)
+    generate_demand(grid_net(size, scenario_dir), rou_file, vehicles, duration, seed=1)
+    return scenario_dir
+
+
+def parse_seeds(value):
+    """ "1,2,7" ou "1-5" (ou misturado) -> lista de inteiros."""
+    seeds = []
+    for part in str(value).split(","):
+        if not part: continue
+        if "-" in part:
+            a, b = part.split("-", 1)
+            seeds.extend(range(int(a), int(b) + 1))
+        else: seeds.append(int(part))
+    return seeds
+
+
+def _run_controlled(cmd, controller, end=None, backend=None):
+    """Passo a passo (libsumo ou TraCI) com a IA ligada; devolve (passos, escritas nos semáforos, backend)."""
+    import traci.constants as tc
+    import sim_backend
+    from dynamic_controller import TrafficAI
+    conn = sim_backend.start(cmd, f"headless-{uuid.uuid4().hex[:8]}", backend)
+    try:
+        strategy = DEFAULT_STRATEGY if controller == "on" else controller
+        ai = TrafficAI(ai_enabled=True, conn=conn, strategy=strategy)
+        ai.start()
+        # Tempo e veículos pendentes vêm junto com o simulationStep (um round-trip por passo)
+        conn.simulation.subscribe((tc.VAR_TIME, tc.VAR_MIN_EXPECTED_VEHICLES))
+        steps, sim = 0, conn.simulation.getSubscriptionResults()
+        while sim[tc.VAR_MIN_EXPECTED_VEHICLES] > 0 and (not end or sim[tc.VAR_TIME] + STEP_LENGTH <= end):
+            conn.simulationStep()
+            sim = conn.simulation.getSubscriptionResults()
+            ai.step(sim[tc.VAR_TIME])
+            steps += 1
+        return steps, ai.writes, conn.backend
+    finally:
+        conn.close()
+
+
+def read_tripinfo(path):
+    trips = {"trips": 0, "duration": 0.0, "waitingTime": 0.0, "waitingCount": 0.0, "timeLoss": 0.0}
+    for _, elem in ET.iterparse(path):
+        if elem.tag != "tripinfo": continue
+        trips["trips"] += 1
+        for key in ("duration", "waitingTime", "waitingCount", "timeLoss"):
+            trips[key] += float(elem.get(key, 0))
+        elem.clear()
+    return trips
+
+
+def read_summary(path):
+    """(último tempo, média de veículos parados por passo, passos)."""
+    end, halting, steps = 0.0, 0.0, 0
+    for _, elem in ET.iterparse(path):
+        if elem.tag != "step": continue
+        end = float(elem.get("time"))
+        halting += float(elem.get("halting", 0))
+        steps += 1
+        elem.clear()
+    return end, (halting / steps if steps else 0.0), steps
+
+
+def run_one(scenario_dir, controller="off", seed=42, end=None, binary="sumo", backend=None):
+    """Uma execução (roda no processo filho): KPIs de um cenário/controlador/semente."""
+    with tempfile.TemporaryDirectory(prefix="headless-") as tmp:
+        tripinfo = os.path.join(tmp, "tripinfo.xml")
+        summary = os.path.join(tmp, "summary.xml")
+        cmd = scenario_cmd(scenario_dir, binary) + ["--seed", str(seed), "--tripinfo-output", tripinfo,
+                                                    "--summary-output", summary, "--duration-log.disable"]
+        if end: cmd += ["--end", str(end)]
+        t0 = time.perf_counter()
+        writes, used = 0, "sumo"
+        if controller == "off":
+            proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            if proc.returncode:
+                errors = [l for l in proc.stderr.splitlines() if l.startswith("Error")]
+                raise RuntimeError(errors[0] if errors else f"sumo saiu com {proc.returncode}")
+        else:
+            _, writes, used = _run_controlled(cmd, controller, end, backend)
+        wall = time.perf_counter() - t0
+        trips = read_tripinfo(tripinfo)
+        sim_end, mean_halting, steps = read_summary(summary)
+
+    n = trips["trips"] or 1
+    return {
+        "scenario": scenario_dir, "controller": controller, "seed": seed, "backend": used,
+        "sim_time": sim_end, "wall_s": round(wall, 3), "steps": steps, "tls_writes": writes,
+        "trips": trips["trips"],
+        "throughput_vph": trips["trips"] * 3600 / sim_end if sim_end else 0.0,
+        "mean_travel_time": trips["duration"] / n,
+        "mean_waiting_time": trips["waitingTime"] / n,
+        "mean_halts": trips["waitingCount"] / n,
+        "mean_time_loss": trips["timeLoss"] / n,
+        "mean_halting": mean_halting,
+        "steps_per_s": steps / wall if wall else 0.0,
+    }
+
+
+def aggregate(runs):
+    """Média e desvio padrão de cada KPI por (cenário, controlador)."""
+    groups = {}
+    for run in runs: groups.setdefault((run["scenario"], run["controller"]), []).append(run)
+    out = []
+    for (scenario, controller), items in groups.items():
+        row = {"scenario": scenario, "controller": controller, "runs": len(items)}
+        for kpi in KPIS:
+            values = [r[kpi] for r in items]
+            row[kpi] = statistics.fmean(values)
+            row[kpi + "_std"] = statistics.stdev(values) if len(values) > 1 else 0.0
+        out.append(row)
+    return out
+
+
+def run_batch(scenarios, controllers=("off",), seeds=(42,), end=None, workers=None, binary="sumo",
+              backend=None, on_result=None):
+    """Todas as combinações em paralelo (um SUMO por processo); devolve (execuções, agregado)."""
+    jobs = [(s, c, seed) for s in scenarios for c in controllers for seed in seeds]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    runs, errors = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_one, s, c, seed, end, binary, backend): (s, c, seed) for s, c, seed in jobs}
+        for future in as_completed(futures):
+            try: result = future.result()
+            except Exception as e:
+                errors.append((futures[future], e))
+                continue
+            runs.append(result)
+            if on_result: on_result(result)
+    for (s, c, seed), e in errors: print(f"ERRO {s} {c} seed={seed}: {e}", file=sys.stderr)
+    runs.sort(key=lambda r: (r["scenario"], CONTROLLERS.index(r["controller"]), r["seed"]))
+    return runs, aggregate(runs)
+
+
+def print_table(rows):
+    print(f"{'cenário':<24} {'controle':<13} {'n':>3} {'viagens':>8} {'veíc/h':>8} {'viagem':>8} "
+          f"{'espera':>8} {'paradas':>8} {'perda':>8} {'passos/s':>9}")
+    for r in rows:
+        print(f"{os.path.basename(os.path.normpath(r['scenario'])):<24} {r['controller']:<13} {r['runs']:>3} "
+              f"{r['trips']:8.0f} {r['throughput_vph']:8.0f} {r['mean_travel_time']:7.1f}s "
+              f"{r['mean_waiting_time']:7.1f}s {r['mean_halts']:8.2f} {r['mean_time_loss']:7.1f}s "
+              f"{r['steps_per_s']:9.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Avaliação headless de cenários e controladores")
+    parser.add_argument("scenarios", nargs="+", help="pastas de cenário (sumocfg ou net + rou)")
+    parser.add_argument("--controller", default="off", help=f"lista separada por vírgula: {', '.join(CONTROLLERS)}")
+    parser.add_argument("--seeds", default="42", help='ex.: "1-5" ou "1,2,3"')
+    parser.add_argument("--end", type=float, help="tempo simulado máximo (s)")
+    parser.add_argument("--workers", type=int, help="processos em paralelo (padrão: núcleos)")
+    parser.add_argument("--binary", default="sumo")
+    parser.add_argument("--backend", choices=("auto", "libsumo", "traci"), default="auto",
+                        help="com IA: libsumo dentro do processo (auto, se instalado) ou TraCI")
+    parser.add_argument("--json", help="grava execuções e agregado neste arquivo")
+    args = parser.parse_args(argv)
+
+    controllers = [c for c in args.controller.split(",") if c]
+    unknown = [c for c in controllers if c not in CONTROLLERS]
+    if unknown: parser.error(f"controlador desconhecido: {', '.join(unknown)} (use {', '.join(CONTROLLERS)})")
+    seeds = parse_seeds(args.seeds)
+
+    t0 = time.perf_counter()
+    total = len(args.scenarios) * len(controllers) * len(seeds)
+    done = []
+    def progress(result):
+        done.append(result)
+        print(f"[{len(done)}/{total}] {result['controller']} seed={result['seed']}: "
+              f"{result['steps_per_s']:.0f} passos/s, espera {result['mean_waiting_time']:.1f}s", file=sys.stderr)
+    runs, rows = run_batch(args.scenarios, controllers, seeds, args.end, args.workers, args.binary,
+                           args.backend, progress)
+    print_table(rows)
+    print(f"{len(runs)}/{total} execuções em {time.perf_counter() - t0:.1f}s")
+    if args.json:
+        with open(args.json, "w") as f: json.dump({"runs": runs, "aggregate": rows}, f, indent=2)
+    return 0 if len(runs) == total else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Fila de geração de cenários do /generate.
+
+Cada pedido vira um job que roda num pool de processos (geração trava CPU e faz
+I/O pesado; fora do processo do servidor não segura os WebSockets). Cada job
+escreve num diretório próprio (/app/scenarios/jobs/<job_id>/), então pedidos
+simultâneos não sobrescrevem os simulacao.* um do outro. O processo filho grava
+o andamento por etapa em progress.json; o status é lido de lá.
+
+Pedidos idênticos (mesma cidade/veículos/duração/raio) enquanto um job está na fila
+ou rodando recebem o mesmo job_id.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from scenario_cache import make_key, normalize_city
+
+JOBS_DIR = Path(os.getenv("GENERATE_JOBS_DIR", "/app/scenarios/jobs"))
+MAX_WORKERS = int(os.getenv("GENERATE_WORKERS", "2"))
+# Diretórios de jobs concluídos mantidos em disco (o mais recente nunca é apagado)
+KEEP_JOBS = int(os.getenv("GENERATE_KEEP_JOBS", "20"))
+# Jobs com checkpoints (state/) ou gravações (runs/) têm cota própria: é para eles que se volta
+KEEP_RECORDED_JOBS = int(os.getenv("GENERATE_KEEP_RECORDED_JOBS", "20"))
+HISTORY_DIRS = ("state", "runs")
+LOG_FILE = "log.jsonl"  # saída do processo de geração; o servidor reenvia ao Supabase no fim
+RADIUS_KM = 1.5  # o mesmo padrão do generator (não importado para o servidor não carregar sumolib)
+
+
+def _write_json(path, data):
+    tmp = Path(f"{path}.tmp")
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try: return json.loads(Path(path).read_text())
+    except (OSError, ValueError): return None
+
+
+def run_job(job_dir, city_name, num_vehicles, duration, radius_km=RADIUS_KM):
+    """
+    Executa no processo filho. Importa o gerador aqui para o servidor não carregar sumolib.
+    Os prints do filho não passam pelo logger do servidor: vão para <job>/log.jsonl.
+    """
+    from generator import generate_scenario
+    from logger_utils import capture_logs
+    progress = Path(job_dir) / "progress.json"
+    with capture_logs(Path(job_dir) / LOG_FILE, "GENERATOR"):
+        return generate_scenario(city_name, num_vehicles, duration, out_dir=job_dir, radius_km=radius_km,
+                                 on_stage=lambda stages: _write_json(progress, stages))
+
+
+class GenerateJob:
+    def __init__(self, job_id, key, city_name, num_vehicles, duration, job_dir, radius_km=RADIUS_KM):
+        self.id = job_id
+        self.key = key
+        self.city_name = city_name
+        self.num_vehicles = num_vehicles
+        self.duration = duration
+        self.radius_km = radius_km
+        self.dir = Path(job_dir)
+        self.state = "queued"
+        self.created = time.time()
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.scenario_id = None
+        self.future = None
+
+    @property
+    def stages(self):
+        return _read_json(self.dir / "progress.json") or []
+
+    def logs(self):
+        """[(tabela, linha)] que o processo do job logou."""
+        from logger_utils import read_log_file
+        return read_log_file(self.dir / LOG_FILE)
+
+    @property
+    def has_history(self):
+        return any(any((self.dir / name).glob("*")) for name in HISTORY_DIRS)
+
+    @property
+    def status(self):
+        # O pool não avisa quando o job começa: o primeiro progress.json marca o início
+        if self.state == "queued" and (self.dir / "progress.json").exists(): return "running"
+        return self.state
+
+    def to_dict(self):
+        return {"job_id": self.id, "status": self.status, "city_name": self.city_name,
+                "num_vehicles": self.num_vehicles, "duration": self.duration, "radius_km": self.radius_km,
+                "created": self.created, "finished": self.finished, "stages": self.stages,
+                "error": self.error, "scenario_id": self.scenario_id}
+
+    def save(self):
+        _write_json(self.dir / "job.json", {**self.to_dict(), "key": self.key, "result": self.result})
+
+    @classmethod
+    def load(cls, job_dir):
+        data = _read_json(Path(job_dir) / "job.json")
+        if not data: return None
+        job = cls(data["job_id"], data["key"], data["city_name"], data["num_vehicles"], data["duration"], job_dir,
+                  data.get("radius_km", RADIUS_KM))
+        job.state = data["status"]
+        job.created, job.finished = data["created"], data["finished"]
+        job.error, job.scenario_id, job.result = data["error"], data["scenario_id"], data.get("result")
+        return job
+
+
+class JobManager:
+    """
+    Submete e acompanha jobs de geração. on_done(job) roda (fora do event loop)
+    quando um job termina, antes de ele ser persistido em job.json. in_use()
+    devolve as pastas de cenário abertas (sessões, replays), que o prune não apaga;
+    on_prune(pasta) roda antes de cada pasta ser apagada (ex.: soltar mmaps).
+    """
+
+    def __init__(self, root=JOBS_DIR, max_workers=MAX_WORKERS, on_done=None, in_use=None, on_prune=None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max(1, max_workers)
+        self.on_done = on_done
+        self.in_use = in_use
+        self.on_prune = on_prune
+        self.jobs: dict[str, GenerateJob] = {}
+        self.inflight: dict[str, GenerateJob] = {}
+        self.latest = None  # último job concluído com sucesso (cenário padrão do /ws)
+        self._pool = None
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        """Recupera jobs concluídos de execuções anteriores (o cenário padrão sobrevive ao restart)."""
+        for job_dir in self.root.iterdir():
+            job = GenerateJob.load(job_dir) if job_dir.is_dir() else None
+            if job is None: continue
+            if job.state in ("queued", "running"):
+                job.state, job.error = "error", "interrompido (servidor reiniciado)"
+            self.jobs[job.id] = job
+            if job.state == "done" and (self.latest is None or job.finished > self.latest.finished):
+                self.latest = job
+
+    def _executor(self):
+        if self._pool is None:
+            # spawn: o servidor tem threads (sessões, sink de logs); fork herdaria locks
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    @staticmethod
+    def job_key(city_name, num_vehicles, duration, radius_km=RADIUS_KM):
+        return make_key("job", city=normalize_city(city_name), vehicles=num_vehicles, duration=duration,
+                        radius=radius_km)
+
+    def submit(self, city_name, num_vehicles=300, duration=1000, radius_km=RADIUS_KM):
+        """(job, deduplicado). Pedido idêntico a um job em andamento devolve o mesmo job."""
+        key = self.job_key(city_name, num_vehicles, duration, radius_km)
+        with self._lock:
+            job = self.inflight.get(key)
+            if job: return job, True
+            job_id = uuid.uuid4().hex[:12]
+            job = GenerateJob(job_id, key, city_name, num_vehicles, duration, self.root / job_id, radius_km)
+            job.dir.mkdir(parents=True, exist_ok=True)
+            job.save()
+            args = (str(job.dir), city_name, num_vehicles, duration, radius_km)
+            try:
+                job.future = self._executor().submit(run_job, *args)
+            except BrokenProcessPool:
+                # Um filho morreu (ex.: OOM no netconvert) e quebrou o pool: recria
+                self._pool = None
+                job.future = self._executor().submit(run_job, *args)
+            self.jobs[job_id] = job
+            self.inflight[key] = job
+        job.future.add_done_callback(lambda f, job=job: self._finish(job, f))
+        return job, False
+
+    def _finish(self, job, future):
+        try:
+            job.result = future.result()
+            job.state = "done"
+        except Exception as e:
+            job.state, job.error = "error", str(e) or type(e).__name__
+        job.finished = time.time()
+        with self._lock:
+            if self.inflight.get(job.key) is job: del self.inflight[job.key]
+            if job.state == "done": self.latest = job
+        if self.on_done:
+            try: self.on_done(job)
+            except Exception as e: print(f"Erro pós-geração ({job.id}): {e}")
+        job.save()
+        self._prune()
+
+    def _prune(self):
+        busy = {Path(p) for p in self.in_use() if p} if self.in_use else set()
+        with self._lock:
+            finished = sorted((j for j in self.jobs.values()
+                               if j.finished and j is not self.latest and j.dir not in busy),
+                              key=lambda j: j.finished)
+            recorded = [j for j in finished if j.has_history]
+            plain = [j for j in finished if not j.has_history]
+            expired = plain[:max(0, len(plain) - KEEP_JOBS)] + recorded[:max(0, len(recorded) - KEEP_RECORDED_JOBS)]
+            for job in expired:
+                if self.on_prune: self.on_prune(job.dir)
+                shutil.rmtree(job.dir, ignore_errors=True)
+                del self.jobs[job.id]
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def scenario_dir(self, job_id=None):
+        """Diretório do cenário de um job concluído (ou do mais recente); None se não houver."""
+        job = self.jobs.get(job_id) if job_id else self.latest
+        if job is None or job.state != "done": return None
+        return job.dir
+
+    def shutdown(self):
+        if self._pool: self._pool.shutdown(wait=False, cancel_futures=True)
@@ -1,14 +1,142 @@
 import sys
+import json
+import time
+import queue
+import random
 import threading
 import datetime
 import traceback
-from supabase import Client
+from contextlib import contextmanager
+
+try:
+    from supabase import Client
+except ImportError: Client = None  # processos de geração sem o client ainda gravam o log em arquivo
+
+class SupabaseLogSink:
+    """
+    Escritor único em background para o Supabase. Quem loga só enfileira (nunca
+    bloqueia); a thread agrupa as linhas por tabela e envia em lote por tamanho ou
+    intervalo, com retry e backoff. Fila cheia = linha descartada e contada.
+    """
+
+    def __init__(self, supabase_client: Client, max_queue=10000, batch_size=200,
+                 flush_interval=2.0, max_retries=5, terminal=None):
+        self.supabase = supabase_client
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.terminal = terminal or sys.__stdout__
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="supabase-log-sink")
+        self._thread.start()
+
+    def submit(self, table, rows):
+        """Enfileira uma linha (dict) ou lista de linhas para a tabela. Não bloqueia."""
+        for row in (rows if isinstance(rows, list) else [rows]):
+            try: self.queue.put_nowait((table, row))
+            except queue.Full: self.dropped += 1
+
+    @property
+    def backlog(self):
+        return self.queue.qsize()
+
+    def _run(self):
+        pending = {}  # tabela -> linhas
+        count = 0
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                table, row = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                pending.setdefault(table, []).append(row)
+                count += 1
+                # Pega o que já está na fila sem esperar, até completar o lote
+                while count < self.batch_size:
+                    table, row = self.queue.get_nowait()
+                    pending.setdefault(table, []).append(row)
+                    count += 1
+            except queue.Empty: pass
+            stopping = self._stop.is_set()
+            if count >= self.batch_size or time.monotonic() >= deadline or stopping:
+                for table, rows in pending.items():
+                    self._send(table, rows)
+                pending, count = {}, 0
+                deadline = time.monotonic() + self.flush_interval
+            if stopping and self.queue.empty(): return
+
+    def _send(self, table, rows):
+        delay = 0.5
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.supabase.table(table).insert(rows).execute()
+                self.sent += len(rows)
+                return
+            except Exception as e:
+                if attempt == self.max_retries or self._stop.is_set():
+                    self.failed += len(rows)
+                    print(f"Erro ao salvar {len(rows)} logs no Supabase: {e}", file=self.terminal)
+                    return
+                time.sleep(delay + random.uniform(0, delay / 2))
+                delay = min(delay * 2, 30.0)
+
+    def close(self, timeout=5.0):
+        self._stop.set()
+        self._thread.join(timeout)
+
+class FileLogSink:
+    """
+    Mesmo submit() do SupabaseLogSink, mas grava as linhas em JSON Lines. Usado nos
+    processos de geração: o servidor lê o arquivo no fim do job e reenvia pelo sink dele.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def submit(self, table, rows):
+        with self._lock:
+            for row in (rows if isinstance(rows, list) else [rows]):
+                self._file.write(json.dumps(dict(row, _table=table), ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def close(self, timeout=None):
+        with self._lock: self._file.close()
+
+
+def read_log_file(path):
+    """[(tabela, linha)] gravados por um FileLogSink (linha truncada no fim é ignorada)."""
+    out = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try: row = json.loads(line)
+                except ValueError: continue
+                out.append((row.pop("_table", "simulation_logs"), row))
+    except OSError: pass
+    return out
+
+
+@contextmanager
+def capture_logs(path, module_name):
+    """Redireciona stdout/stderr deste processo para um FileLogSink enquanto o bloco roda."""
+    sink = FileLogSink(path)
+    stdout, stderr = sys.stdout, sys.stderr
+    logger = SupabaseLogger(None, module_name, sink=sink)
+    sys.stdout, sys.stderr = StreamInterceptor(logger, "INFO"), StreamInterceptor(logger, "ERROR")
+    try: yield logger
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        sink.close()
 
 class SupabaseLogger:
-    def __init__(self, supabase_client: Client, module_name="SUMO_DOCKER"):
+    def __init__(self, supabase_client: Client, module_name="SUMO_DOCKER", sink: SupabaseLogSink = None):
         self.supabase = supabase_client
         self.module = module_name
         self.terminal = sys.stdout # Guarda o print original
+        self.sink = sink or SupabaseLogSink(supabase_client, terminal=self.terminal)
 
     def log(self, level, message):
         """Envia o log para o Supabase e imprime no terminal do Docker"""
@@ -17,19 +145,13 @@ class SupabaseLogger:
         colored_level = f"[{level}]"
         print(f"{timestamp} {colored_level} {message}", file=self.terminal)
 
-        # 2. Envia para o Supabase (em uma thread separada para não travar a simulação)
-        def _send():
-            try:
-                self.supabase.table("simulation_logs").insert({
-                    "nivel": level,
-                    "modulo": self.module,
-                    "mensagem": str(message),
-                    "timestamp": datetime.datetime.now().isoformat()
-                }).execute()
-            except Exception as e:
-                print(f"Erro ao salvar log no Supabase: {e}", file=self.terminal)
-        
-        threading.Thread(target=_send).start()
+        # 2. Enfileira para o Supabase (envio em lote pela thread do sink, não trava a simulação)
+        self.sink.submit("simulation_logs", {
+            "nivel": level,
+            "modulo": self.module,
+            "mensagem": str(message),
+            "timestamp": datetime.datetime.now().isoformat()
+        })
 
     def info(self, msg): self.log("INFO", msg)
     def warning(self, msg): self.log("WARNING", msg)
@@ -51,14 +173,14 @@ class StreamInterceptor:
     def flush(self):
         pass
 
-def setup_global_logging(supabase_client):
+def setup_global_logging(supabase_client, sink: SupabaseLogSink = None):
     """Ativa a interceptação global"""
-    logger = SupabaseLogger(supabase_client)
-    
+    logger = SupabaseLogger(supabase_client, sink=sink)
+
     # Redireciona prints normais -> INFO
     sys.stdout = StreamInterceptor(logger, "INFO")
-    
+
     # Redireciona erros (ex: exceções do Python) -> ERROR
     sys.stderr = StreamInterceptor(logger, "ERROR")
-    
-    return logger
\ No newline at end of file
+
+    return logger
@@ -1,15 +1,32 @@
 import os
 import json
+import uuid
 import asyncio
-import traci
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from collections import Counter
+from typing import Optional
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from supabase import create_client, Client
 from github import Github
 
 # Logger
-from logger_utils import setup_global_logging
+from logger_utils import setup_global_logging, SupabaseLogSink
+from projection import NetProjection
+from protocol import negotiate
+from simulation_worker import STEP_LENGTH, DEFAULT_SPEED, DEFAULT_FPS, parse_speed
+from sessions import SessionManager
+from connection_manager import ConnectionManager
+from broadcast import FrameBroadcaster
+from jobs import JobManager
+from tiles import tile_path
+from spatial import parse_bbox, load_tls_positions
+from signal_control import STRATEGIES, DEFAULT_STRATEGY
+from metrics import registry, profiler
+from checkpoint import CheckpointStore, resume_point, timelines as checkpoint_timelines
+from capacity import CapacityModel, check as check_capacity, calibrate as calibrate_capacity
+from trajectory import (RECORD_RUNS, TrajectoryRecorder, ReplayWorker, runs_dir, list_runs, open_trajectory,
+                        release_trajectory, forget_trajectories)
 
 # Imports Opcionais
 try:
@@ -18,16 +35,6 @@ except ImportError:
     ox = None
     print("AVISO: osmnx não instalado.")
 
-try:
-    from generator import generate_scenario
-    from dynamic_controller import TrafficAI
-except ImportError:
-    def generate_scenario(*args, **kwargs): return {"nodes": 0, "edges": 0}
-    class TrafficAI:
-        def __init__(self, ai_enabled): pass
-        def set_ai_status(self, enabled): pass
-        def step(self): return []
-
 # Configurações
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
@@ -51,10 +58,12 @@ app.add_middleware(
 
 # Inicializa Logs
 sys_logger = None
+log_sink = None
 try:
     if SUPABASE_URL and SUPABASE_KEY:
         supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        sys_logger = setup_global_logging(supabase)
+        log_sink = SupabaseLogSink(supabase)
+        sys_logger = setup_global_logging(supabase, log_sink)
         sys_logger.info("Backend iniciado com sucesso.")
     else:
         supabase = None
@@ -62,183 +71,405 @@ except Exception as e:
     print(f"ERRO SUPABASE: {e}")
     supabase = None
 
-traffic_ai = TrafficAI(ai_enabled=False)
-simulation_running = False 
+sessions = SessionManager()
+replaying = Counter()  # pasta do cenário -> replays abertos
 current_scenario_id = None
 
+def register_scenario(job):
+    """Chamado quando um job de geração termina: registra o cenário no Supabase."""
+    global current_scenario_id
+    # Logs do processo de geração (lá não há sink): reenviados pelo sink do servidor
+    if log_sink:
+        for table, row in job.logs(): log_sink.submit(table, row)
+    if job.state != "done":
+        if sys_logger: sys_logger.error(f"Erro Generator ({job.city_name}): {job.error}")
+        return
+    if sys_logger: sys_logger.info(f"Cenário gerado: {job.city_name} (job {job.id})")
+    if not supabase: return
+    try:
+        res = supabase.table("scenarios").insert({
+            "city_name": job.city_name,
+            "node_count": (job.result or {}).get("nodes", 0),
+            "edge_count": (job.result or {}).get("edges", 0)
+        }).execute()
+        if res.data: job.scenario_id = current_scenario_id = res.data[0]['id']
+    except: pass
+
+def scenarios_in_use():
+    return [s.scenario_dir for s in sessions.targets()] + list(replaying)
+
+jobs = JobManager(on_done=register_scenario, in_use=scenarios_in_use, on_prune=forget_trajectories)
+if jobs.latest: current_scenario_id = jobs.latest.scenario_id
+
+@app.on_event("shutdown")
+def shutdown():
+    """Para os jobs e esvazia a fila do sink (sem isso o último lote de logs se perde no restart)."""
+    jobs.shutdown()
+    if log_sink: log_sink.close()
+
 # --- GERENCIADOR DE CONEXÕES (FILA) ---
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-        self.queue: list[WebSocket] = []
-        self.MAX_SIMULATIONS = 1  # Limite de 1 simulação
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        if len(self.active_connections) < self.MAX_SIMULATIONS:
-            self.active_connections.append(websocket)
-            return True 
-        else:
-            self.queue.append(websocket)
-            pos = len(self.queue)
-            await websocket.send_json({"status": "queue", "position": pos, "message": "Servidor ocupado. Aguarde na fila."})
-            return False 
-
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        elif websocket in self.queue:
-            self.queue.remove(websocket)
-
-    def is_active(self, websocket: WebSocket):
-        return websocket in self.active_connections
-
-    def try_promote(self):
-        if len(self.active_connections) < self.MAX_SIMULATIONS and len(self.queue) > 0:
-            next_ws = self.queue.pop(0)
-            self.active_connections.append(next_ws)
-            return next_ws
-        return None
-
-manager = ConnectionManager()
+manager = ConnectionManager(sessions)
+
+# --- MÉTRICAS GLOBAIS (lidas na coleta) ---
+registry.gauge("sumo_queue_length", "Clientes na fila de espera", fn=lambda: manager.queue_length)
+registry.gauge("sumo_active_sessions", "Sessões de simulação ativas", fn=lambda: len(sessions.sessions))
+registry.gauge("sumo_subscribers", "WebSockets inscritos em sessões",
+               fn=lambda: sum(len(s.broadcaster.subscribers) for s in sessions.targets() if s.broadcaster))
+if log_sink:
+    registry.gauge("supabase_log_backlog", "Linhas na fila do sink de logs", fn=lambda: log_sink.backlog)
+    registry.gauge("supabase_log_dropped", "Linhas descartadas (fila cheia)", fn=lambda: log_sink.dropped)
+    registry.gauge("supabase_log_sent", "Linhas enviadas", fn=lambda: log_sink.sent)
+    registry.gauge("supabase_log_failed", "Linhas que falharam após os retries", fn=lambda: log_sink.failed)
 
 class CityRequest(BaseModel):
     city_name: str
     ai_enabled: bool = False
+    num_vehicles: int = 300
+    duration: float = 1000
+    radius_km: float = 1.5
+    allow_downscale: bool = True  # False: recusa em vez de reduzir os veículos
 
 class ControlRequest(BaseModel):
     action: str 
+    session_id: Optional[str] = None
+    owner_token: Optional[str] = None
+    time: Optional[float] = None  # seek: tempo simulado alvo
 
 # --- ROTAS HTTP ---
 @app.get("/")
 def health_check():
     if sys_logger: sys_logger.info("Health Check OK.")
-    return {"status": "online", "active": len(manager.active_connections), "queue": len(manager.queue)}
+    return {"status": "online", "active": len(manager.active_connections), "queue": manager.queue_length,
+            "capacity": sessions.pool_size}
 
 @app.post("/generate")
 def generate_and_save(req: CityRequest):
-    global current_scenario_id
-    if sys_logger: sys_logger.info(f"Gerando: {req.city_name}")
-    try:
-        data = generate_scenario(req.city_name, max_vehicles=300)
-    except Exception as e:
-        if sys_logger: sys_logger.error(f"Erro Generator: {e}")
-        raise HTTPException(status_code=400, detail=str(e))
-    
-    if supabase:
-        try:
-            res = supabase.table("scenarios").insert({
-                "city_name": req.city_name,
-                "node_count": data.get("nodes", 0),
-                "edge_count": data.get("edges", 0)
-            }).execute()
-            if res.data: current_scenario_id = res.data[0]['id']
-        except: pass
-    return {"status": "success", "scenario_id": current_scenario_id}
+    """
+    Enfileira a geração e responde na hora; acompanhe em GET /generate/{job_id}.
+    O pedido passa antes pelo modelo de capacidade: admitido, reduzido ou recusado (422).
+    """
+    capacity = check_capacity(req.num_vehicles, req.duration, req.radius_km, allow_downscale=req.allow_downscale)
+    if capacity["decision"] == "reject": raise HTTPException(status_code=422, detail=capacity)
+    job, deduplicated = jobs.submit(req.city_name, num_vehicles=capacity["num_vehicles"],
+                                    duration=req.duration, radius_km=req.radius_km)
+    if sys_logger and not deduplicated:
+        sys_logger.info(f"Gerando: {req.city_name} (job {job.id}, {job.num_vehicles} veículos, "
+                        f"{capacity['decision']})")
+    return {"status": job.status, "job_id": job.id, "deduplicated": deduplicated, "capacity": capacity}
+
+@app.get("/generate/{job_id}")
+def generate_status(job_id: str):
+    job = jobs.get(job_id)
+    if not job: raise HTTPException(status_code=404)
+    return job.to_dict()
+
+@app.get("/capacity")
+def capacity_model():
+    return CapacityModel.load().to_dict()
+
+@app.get("/capacity/estimate")
+def capacity_estimate(num_vehicles: int = 300, duration: float = 1000, radius_km: float = 1.5,
+                      allow_downscale: bool = True):
+    """A decisão que o /generate tomaria, sem gerar nada."""
+    return check_capacity(num_vehicles, duration, radius_km, allow_downscale=allow_downscale)
+
+@app.post("/capacity/calibrate")
+async def capacity_calibrate():
+    """Roda o benchmark de calibração (~2 min, disputa CPU com as sessões) e grava o modelo."""
+    log = sys_logger.info if sys_logger else print
+    model = await asyncio.to_thread(calibrate_capacity, log=log)
+    return model.to_dict()
+
+def resolve_scenario(scenario=None):
+    """Diretório do cenário: job_id informado ou o último gerado (cai no simulacao.* legado)."""
+    return jobs.scenario_dir(scenario) or (None if scenario else SCENARIO_DIR)
+
+@app.get("/tiles")
+def tiles_index(scenario: Optional[str] = None):
+    scenario_dir = resolve_scenario(scenario)
+    index = os.path.join(scenario_dir, "tiles", "index.json") if scenario_dir else None
+    if not index or not os.path.exists(index): raise HTTPException(status_code=404)
+    with open(index) as f: return json.load(f)
+
+@app.get("/tiles/{z}/{x}/{y}")
+def get_tile(z: int, x: int, y: int, scenario: Optional[str] = None):
+    """Tile da malha viária, já comprimido no disco (gerado junto com o cenário)."""
+    scenario_dir = resolve_scenario(scenario)
+    path = tile_path(os.path.join(scenario_dir, "tiles"), z, x, y) if scenario_dir else None
+    if path is None: raise HTTPException(status_code=404)
+    if not path.exists(): return Response(status_code=204)  # tile sem vias
+    return Response(path.read_bytes(), media_type="application/json",
+                    headers={"Content-Encoding": "gzip", "Cache-Control": "public, max-age=86400"})
+
+def controlled_session(session_id=None, owner_token=None):
+    """
+    Sessão alvo de um comando. session_id é obrigatório (um cliente não mexe nas
+    sessões dos outros); compartilhadas só obedecem ao dono (owner_token).
+    """
+    if not session_id: raise HTTPException(status_code=400, detail="Informe session_id.")
+    session = sessions.get(session_id)
+    if not session: raise HTTPException(status_code=404, detail=f"Sessão {session_id} não existe.")
+    if session.shared and owner_token != session.owner_token: raise HTTPException(status_code=403)
+    return session
 
 @app.post("/toggle-ai")
-def toggle_ai(enabled: bool):
-    traffic_ai.set_ai_status(enabled)
-    return {"ai_active": enabled}
+def toggle_ai(enabled: bool, session_id: Optional[str] = None, owner_token: Optional[str] = None,
+              strategy: Optional[str] = None):
+    """Liga/desliga a IA da sessão; strategy escolhe o controle (max_pressure, actuated, webster)."""
+    if strategy is not None and strategy not in STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Estratégias: {', '.join(STRATEGIES)}")
+    session = controlled_session(session_id, owner_token)
+    session.traffic_ai.set_ai_status(enabled, strategy)
+    return {"session_id": session.id, "ai_active": enabled,
+            "strategy": getattr(session.traffic_ai, "strategy_name", strategy or DEFAULT_STRATEGY)}
 
 @app.post("/control-simulation")
 def control_simulation(req: ControlRequest):
-    global simulation_running
+    session = controlled_session(req.session_id, req.owner_token)
+    worker = session.worker
     if req.action == "stop":
-        simulation_running = False
+        session.stop()
         return {"status": "success"}
     elif req.action == "start":
         return {"status": "success"}
+    elif req.action == "seek":
+        # Para trás só até um checkpoint; para frente avança sem enviar os frames intermediários
+        if req.time is None or req.time < 0: raise HTTPException(status_code=400, detail="Informe time (s).")
+        saved_time, _ = worker.checkpoints.at(req.time) if worker.checkpoints else (None, None)
+        if worker.sim_time is not None and req.time < worker.sim_time and saved_time is None:
+            raise HTTPException(status_code=409, detail=f"Sem checkpoint até t={req.time:.1f} ({session.id}).")
+        result = {"session_id": session.id, "from": worker.sim_time, "checkpoint": saved_time}
+        worker.seek(req.time)
+        return {"status": "success", "sessions": [result]}
     raise HTTPException(status_code=400)
 
+@app.get("/checkpoints")
+def list_checkpoints(scenario: Optional[str] = None, timeline: Optional[str] = None):
+    """Tempos com estado salvo por linha do tempo (para o resume do /ws e o seek); padrão: a última gravada."""
+    scenario_dir = resolve_scenario(scenario)
+    if scenario_dir is None: raise HTTPException(status_code=404)
+    found = [name for name, _ in checkpoint_timelines(scenario_dir)]
+    timeline = timeline or (found[-1] if found else None)
+    if timeline not in found: return {"timelines": found, "timeline": None, "checkpoints": [], "latest": None}
+    store = CheckpointStore(scenario_dir, timeline)
+    latest, _ = store.latest()
+    return {"timelines": found, "timeline": timeline, "parent": store.parent,
+            "checkpoints": [t for t, _ in store.list()], "latest": latest}
+
+@app.get("/runs")
+def recorded_runs(scenario: Optional[str] = None):
+    """Gravações do cenário disponíveis para replay (/ws?replay=<run_id>)."""
+    scenario_dir = resolve_scenario(scenario)
+    if scenario_dir is None: raise HTTPException(status_code=404)
+    return {"runs": list_runs(scenario_dir)}
+
+# --- MÉTRICAS / PROFILER ---
+@app.get("/metrics")
+def metrics_endpoint():
+    return Response(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/summary")
+def metrics_summary():
+    return {**registry.summary(), "profiler": profiler.running}
+
+@app.post("/metrics/toggle")
+def metrics_toggle(enabled: bool):
+    registry.enabled = enabled
+    return {"enabled": enabled}
+
+@app.post("/profiler")
+def profiler_toggle(enabled: bool, interval_ms: float = 5.0):
+    """Liga (zerando as amostras) ou desliga o profiler por amostragem."""
+    if enabled: profiler.start(interval_ms)
+    else: profiler.stop()
+    return profiler.report(limit=10)
+
+@app.get("/profiler")
+def profiler_report(format: str = "json", limit: int = 30):
+    """json: funções com mais amostras; collapsed: pilhas para flamegraph/speedscope."""
+    if format == "collapsed": return Response(profiler.collapsed(), media_type="text/plain")
+    return profiler.report(limit)
+
 # --- WEBSOCKET ---
+def follow_viewport(sub, websocket: WebSocket, on_message=None):
+    """Viewport inicial pela query (?viewport=s,w,n,e&zoom=z) e task que lê as atualizações do cliente."""
+    bbox = parse_bbox(websocket.query_params.get("viewport"))
+    if bbox: sub.set_viewport(bbox, websocket.query_params.get("zoom"))
+    return asyncio.create_task(sub.read_viewport(on_message))
+
+async def watch_session(websocket: WebSocket, session_id, protocol, subprotocol):
+    """Espectador: só leitura, não ocupa vaga nem passa pela fila."""
+    session = sessions.get(session_id)
+    await websocket.accept(subprotocol=subprotocol)
+    if not session or not session.shared or not session.broadcaster:
+        await websocket.send_json({"status": "error", "message": "Sessão não encontrada ou não compartilhada."})
+        await websocket.close()
+        return
+    sub = session.broadcaster.subscribe(websocket, protocol)
+    reader = follow_viewport(sub, websocket)
+    try:
+        await websocket.send_json({"status": "watching", "session_id": session.id})
+        await sub.run()
+    except Exception: pass
+    finally:
+        reader.cancel()
+        session.broadcaster.unsubscribe(sub)
+
+async def replay_session(websocket: WebSocket, run_id, protocol, subprotocol):
+    """
+    Replay de uma gravação: sem SUMO e sem fila. Aceita speed/fps/t na query e,
+    durante o stream, {"seek": t}, {"speed": "4x"} e {"pause": true} além do viewport.
+    """
+    await websocket.accept(subprotocol=subprotocol)
+    scenario_dir = resolve_scenario(websocket.query_params.get("scenario"))
+    path = runs_dir(scenario_dir) / f"{run_id}.traj" if scenario_dir and os.path.basename(run_id) == run_id else None
+    try: reader = await asyncio.to_thread(open_trajectory, path) if path and path.exists() else None
+    except (OSError, ValueError): reader = None
+    if reader is None or not reader.steps:
+        if reader: release_trajectory(reader)
+        await websocket.send_json({"status": "error", "message": "Gravação não encontrada."})
+        await websocket.close()
+        return
+    try:
+        speed = parse_speed(websocket.query_params.get("speed", DEFAULT_SPEED))
+        fps = float(websocket.query_params.get("fps", DEFAULT_FPS))
+        start = float(websocket.query_params["t"]) if websocket.query_params.get("t") else None
+    except ValueError:
+        speed, fps, start = parse_speed(DEFAULT_SPEED), DEFAULT_FPS, None
+    try: tls_positions = await asyncio.to_thread(load_tls_positions, os.path.join(scenario_dir, "simulacao.net.xml"))
+    except Exception: tls_positions = None
+
+    player = ReplayWorker(reader, speed, fps, start)
+    broadcaster = FrameBroadcaster(player, fps, tls_positions)
+    sub = broadcaster.subscribe(websocket, protocol, owner=True)
+    reader_task = follow_viewport(sub, websocket, on_message=player.control)
+    playing = asyncio.create_task(player.run())
+    publisher = asyncio.create_task(broadcaster.run())
+    replaying[scenario_dir] += 1
+    try:
+        await websocket.send_json({"status": "replay", "run_id": run_id, "start": reader.start, "end": reader.end})
+        await sub.run()
+    except Exception: pass
+    finally:
+        reader_task.cancel()
+        player.stop()
+        await playing
+        await publisher
+        replaying[scenario_dir] -= 1
+        if not replaying[scenario_dir]: del replaying[scenario_dir]
+        release_trajectory(reader)
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    is_authorized = await manager.connect(websocket)
+    protocol, subprotocol = negotiate(websocket)
+    if websocket.query_params.get("watch"):
+        return await watch_session(websocket, websocket.query_params["watch"], protocol, subprotocol)
+    if websocket.query_params.get("replay"):
+        return await replay_session(websocket, websocket.query_params["replay"], protocol, subprotocol)
+
+    scenario = websocket.query_params.get("scenario")
+    scenario_dir = resolve_scenario(scenario)
+    if scenario_dir is None:
+        await websocket.accept(subprotocol=subprotocol)
+        await websocket.send_json({"status": "error", "message": "Cenário não encontrado ou ainda em geração."})
+        await websocket.close()
+        return
+    job = jobs.get(scenario) if scenario else jobs.latest
+    scenario_id = (job and job.scenario_id) or current_scenario_id
+
+    priority = websocket.query_params.get("priority", "normal")
+    is_authorized = await manager.connect(websocket, subprotocol, priority)
     
     if not is_authorized:
         try:
-            while websocket in manager.queue:
-                promoted = manager.try_promote()
-                if promoted == websocket:
-                    is_authorized = True
-                    await websocket.send_json({"status": "started", "message": "Sua vez chegou!"})
-                    break
-                await asyncio.sleep(1)
+            if not await manager.wait_turn(websocket): return
+            await websocket.send_json({"status": "started", "message": "Sua vez chegou!"})
         except WebSocketDisconnect:
             manager.disconnect(websocket)
             return
 
-    global simulation_running
-    simulation_running = True
     if sys_logger: sys_logger.info("Simulacao Iniciada.")
 
-    sumo_cmd = ["sumo", "-c", "/app/scenarios/simulacao.sumocfg", "--step-length", "0.5", "--no-warnings"]
-    if not os.path.exists("/app/scenarios/simulacao.sumocfg"):
-        with open("/app/scenarios/simulacao.sumocfg", "w") as f:
+    cfg_file = os.path.join(scenario_dir, "simulacao.sumocfg")
+    sumo_cmd = ["sumo", "-c", cfg_file, "--step-length", str(STEP_LENGTH), "--no-warnings"]
+    if not os.path.exists(cfg_file):
+        with open(cfg_file, "w") as f:
             f.write("""<configuration><input><net-file value="simulacao.net.xml"/><route-files value="simulacao.rou.xml"/></input></configuration>""")
 
+    # ?resume=1 (último checkpoint gravado) ou ?resume=<t> (mais recente até t), da linha do tempo
+    # gravada por último ou da escolhida em ?timeline=. A sessão grava sempre numa linha nova.
+    timeline = uuid.uuid4().hex[:12]
+    resume = websocket.query_params.get("resume")
+    resumed_from, parent = None, None
+    if resume and resume not in ("0", "false"):
+        spec = "latest" if resume in ("1", "true", "latest") else resume
+        try: parent, resumed_from, state_file = resume_point(scenario_dir, spec, websocket.query_params.get("timeline"))
+        except ValueError: parent, resumed_from, state_file = None, None, None
+        if state_file: sumo_cmd += ["--load-state", str(state_file)]
+    checkpoints = CheckpointStore(scenario_dir, timeline, parent=(parent, resumed_from) if parent else None)
+
+    try: geo = NetProjection.from_net_file(os.path.join(scenario_dir, "simulacao.net.xml"))
+    except Exception as e:
+        print(f"AVISO: projeção local indisponível ({e}), usando convertGeo.")
+        geo = None
+
+    # Liga o scenario_id aqui: o worker começa dentro do sessions.create, antes de `session` existir
+    def on_ai_logs(ai_logs, sim_time, scenario_id=scenario_id):
+        if not (scenario_id and supabase): return
+        for log in ai_logs:
+            log['scenario_id'] = scenario_id
+            log['timestamp'] = sim_time
+        save_logs(ai_logs)
+
     try:
-        try: traci.start(sumo_cmd)
-        except: 
-            try: traci.close()
-            except: pass
-            traci.start(sumo_cmd)
-    except Exception:
+        speed = parse_speed(websocket.query_params.get("speed", DEFAULT_SPEED))
+        fps = float(websocket.query_params.get("fps", DEFAULT_FPS))
+    except ValueError:
+        speed, fps = parse_speed(DEFAULT_SPEED), DEFAULT_FPS
+    shared = websocket.query_params.get("share") in ("1", "true")
+    # Grava os frames para replay (?record=0 desliga nesta sessão)
+    run_id, recorder = None, None
+    if RECORD_RUNS and websocket.query_params.get("record") not in ("0", "false"):
+        run_id = timeline  # mesma id da linha do tempo dos checkpoints
+        recorder = TrajectoryRecorder(runs_dir(scenario_dir) / f"{run_id}.traj",
+                                      meta={"scenario_id": scenario_id, "resumed_from": resumed_from,
+                                            "timeline": timeline, "parent": parent})
+    session = sessions.create(sumo_cmd, scenario_id=scenario_id, shared=shared, scenario_dir=scenario_dir,
+                              geo=geo, speed=speed, on_ai_logs=on_ai_logs, checkpoints=checkpoints, recorder=recorder)
+    worker = session.worker
+    # Posições dos semáforos (recorte por viewport) enquanto o SUMO sobe
+    net_file = os.path.join(scenario_dir, "simulacao.net.xml")
+    tls_task = asyncio.create_task(asyncio.to_thread(load_tls_positions, net_file))
+    await asyncio.to_thread(worker.started.wait)
+    try: tls_positions = await tls_task
+    except Exception: tls_positions = None
+    if worker.error:
+        sessions.release(session.id)
+        manager.disconnect(websocket)
         await websocket.close()
         return
 
-    step_count = 0
+    # O dono é só mais um inscrito; o frame é codificado uma vez para todos
+    session.broadcaster = FrameBroadcaster(worker, fps, tls_positions)
+    owner = session.broadcaster.subscribe(websocket, protocol, owner=True)
+    reader = follow_viewport(owner, websocket)
+    publisher = asyncio.create_task(session.broadcaster.run())
     try:
-        while traci.simulation.getMinExpectedNumber() > 0 and simulation_running:
-            if not manager.is_active(websocket): break
-
-            traci.simulationStep()
-            ai_logs = traffic_ai.step()
-            
-            vehicles = []
-            for veh_id in traci.vehicle.getIDList():
-                x, y = traci.vehicle.getPosition(veh_id)
-                lon, lat = traci.simulation.convertGeo(x, y)
-                vehicles.append({
-                    "id": veh_id, 
-                    "lat": lat, 
-                    "lon": lon, 
-                    "angle": traci.vehicle.getAngle(veh_id),
-                    "speed": traci.vehicle.getSpeed(veh_id),
-                    "distance": traci.vehicle.getDistance(veh_id)
-                })
-
-            tls_states = {tls: traci.trafficlight.getRedYellowGreenState(tls) for tls in traci.trafficlight.getIDList()}
-            
-            await websocket.send_json({
-                "time": traci.simulation.getTime(),
-                "vehicles": vehicles,
-                "traffic_lights": tls_states,
-                "status": "running"
-            })
-
-            if step_count % 10 == 0 and ai_logs and current_scenario_id and supabase:
-                for log in ai_logs:
-                    log['scenario_id'] = current_scenario_id
-                    log['timestamp'] = traci.simulation.getTime()
-                asyncio.create_task(save_logs_async(ai_logs))
-
-            step_count += 1
-            await asyncio.sleep(0.05)
-        
-        if not simulation_running:
-             await websocket.send_json({"status": "stopped"})
-
+        info = {"status": "session", "session_id": session.id}
+        if shared: info["owner_token"] = session.owner_token
+        info["timeline"] = timeline
+        if resume: info["resumed_from"], info["resumed_timeline"] = resumed_from, parent
+        if run_id: info["recording"] = run_id
+        await websocket.send_json(info)
+        await owner.run()
     except Exception as e:
         print(f"Erro Loop: {e}")
     finally:
+        reader.cancel()
+        sessions.release(session.id)
         manager.disconnect(websocket)
-        try: traci.close()
-        except: pass
-        simulation_running = False
+        await publisher
 
-async def save_logs_async(logs):
-    try:
-        if supabase: supabase.table("simulation_logs").insert(logs).execute()
-    except: pass
\ No newline at end of file
+def save_logs(logs):
+    """Enfileira no sink em lote (seguro para chamar da thread do worker)."""
+    if log_sink: log_sink.submit("simulation_logs", logs)
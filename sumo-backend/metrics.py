@@ -0,0 +1,285 @@
+"""
+Métricas do loop de simulação (formato texto do Prometheus em /metrics e resumo
+JSON em /metrics/summary) e profiler por amostragem ligável em tempo de execução.
+
+Custo no caminho quente: com as métricas desligadas registry.now() devolve 0 e
+Histogram.since(0) retorna na hora; ligadas, cada fase custa dois perf_counter
+e um bisect. Sem lock nas séries: cada uma é escrita por uma thread só (o worker
+da sessão ou o event loop).
+"""
+import os
+import sys
+import time
+import threading
+from bisect import bisect_left
+from collections import Counter as _Counter
+
+ENABLED = os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+# Segundos (fases do passo, envio) e bytes (tamanho do frame)
+TIME_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+PHASES = ("simulation_step", "vehicle_query", "traffic_ai", "encode", "checkpoint", "record")
+RATE_WINDOW_S = 1.0
+IDLE_FRAMES = ("threading.py:wait", "selectors.py:select", "queue.py:get", "thread.py:_worker")
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # último = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def since(self, t0):
+        """Observa o tempo desde t0 (de registry.now()); t0 == 0 = métricas desligadas."""
+        if t0: self.observe(time.perf_counter() - t0)
+
+    def quantile(self, q):
+        """Estimativa por interpolação linear dentro do bucket."""
+        if not self.count: return 0.0
+        rank, seen, lower = q * self.count, 0, 0.0
+        for bound, n in zip(self.buckets + (self.buckets[-1],), self.counts):
+            if n and seen + n >= rank: return lower + (bound - lower) * (rank - seen) / n
+            seen += n
+            lower = bound
+        return self.buckets[-1]
+
+    def summary(self):
+        return {"count": self.count, "mean": self.sum / self.count if self.count else 0.0,
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95), "p99": self.quantile(0.99)}
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+
+class Gauge:
+    __slots__ = ("value", "fn")
+
+    def __init__(self, fn=None):
+        self.value = 0.0
+        self.fn = fn  # lida na coleta (fila, backlog...)
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        if self.fn is None: return self.value
+        try: return float(self.fn())
+        except Exception: return float("nan")
+
+
+def _labels(labels, extra=None):
+    items = list(labels) + (list(extra.items()) if extra else [])
+    if not items: return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in items) + "}"
+
+
+class Registry:
+    def __init__(self, enabled=ENABLED):
+        self.enabled = enabled
+        self._families = {}  # nome -> [tipo, ajuda, {labels: série}]
+        self._lock = threading.Lock()
+
+    def now(self):
+        return time.perf_counter() if self.enabled else 0.0
+
+    def _get(self, kind, name, help, factory, labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, [kind, help, {}])
+            series = family[2].get(key)
+            if series is None: series = family[2][key] = factory()
+            return series
+
+    def histogram(self, name, help, buckets=TIME_BUCKETS, **labels):
+        return self._get("histogram", name, help, lambda: Histogram(buckets), labels)
+
+    def counter(self, name, help, **labels):
+        return self._get("counter", name, help, Counter, labels)
+
+    def gauge(self, name, help, fn=None, **labels):
+        gauge = self._get("gauge", name, help, Gauge, labels)
+        if fn is not None: gauge.fn = fn
+        return gauge
+
+    def remove(self, **labels):
+        """Apaga as séries que têm todos esses labels (ex.: session=... quando a sessão acaba)."""
+        match = set(labels.items())
+        with self._lock:
+            for family in self._families.values():
+                for key in [k for k in family[2] if match <= set(k)]: del family[2][key]
+
+    def _series(self):
+        with self._lock:
+            return [(name, kind, help, list(series.items())) for name, (kind, help, series) in self._families.items()]
+
+    def render(self):
+        """Formato texto 0.0.4 do Prometheus."""
+        lines = []
+        for name, kind, help, series in self._series():
+            if not series: continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in series:
+                if kind == "histogram":
+                    cumulative = 0
+                    for bound, n in zip(metric.buckets + ("+Inf",), metric.counts):
+                        cumulative += n
+                        lines.append(f"{name}_bucket{_labels(labels, {'le': bound})} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {metric.sum}")
+                    lines.append(f"{name}_count{_labels(labels)} {metric.count}")
+                elif kind == "counter":
+                    lines.append(f"{name}{_labels(labels)} {metric.value}")
+                else:
+                    lines.append(f"{name}{_labels(labels)} {metric.get()}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Resumo JSON: por métrica, lista de {labels..., valor ou count/mean/p50/p95/p99}."""
+        out = {"enabled": self.enabled}
+        for name, kind, _, series in self._series():
+            rows = []
+            for labels, metric in series:
+                row = dict(labels)
+                if kind == "histogram": row.update(metric.summary())
+                elif kind == "counter": row["value"] = metric.value
+                else: row["value"] = metric.get()
+                rows.append(row)
+            if rows: out[name] = rows
+        return out
+
+
+registry = Registry()
+
+
+class SessionMetrics:
+    """Séries de uma sessão (label session); close() tira do /metrics."""
+
+    def __init__(self, session_id, reg=None):
+        self.session_id = session_id
+        self.registry = reg or registry
+        r, s = self.registry, session_id
+        self.phase = {p: r.histogram("sumo_step_phase_seconds", "Tempo por fase do passo/publicação",
+                                     phase=p, session=s) for p in PHASES}
+        self.steps = r.counter("sumo_steps_total", "Passos simulados", session=s)
+        self.rate = r.gauge("sumo_steps_per_second", "Passos por segundo (janela de 1 s)", session=s)
+        self.published = r.counter("sumo_frames_published_total", "Frames publicados aos inscritos", session=s)
+        self.skipped = r.counter("sumo_frames_skipped_total", "Frames descartados (cliente lento)", session=s)
+        self.send = r.histogram("sumo_send_seconds", "Latência de envio no WebSocket", session=s)
+        self._frame_bytes = {}
+        self._window_start = time.perf_counter()
+        self._window_steps = 0
+
+    def now(self):
+        return self.registry.now()
+
+    def frame_bytes(self, protocol):
+        hist = self._frame_bytes.get(protocol)
+        if hist is None:
+            hist = self._frame_bytes[protocol] = self.registry.histogram(
+                "sumo_frame_bytes", "Tamanho do payload enviado", BYTE_BUCKETS, protocol=protocol, session=self.session_id)
+        return hist
+
+    def step_done(self):
+        self.steps.inc()
+        self._window_steps += 1
+        now = time.perf_counter()
+        if now - self._window_start >= RATE_WINDOW_S:
+            self.rate.set(self._window_steps / (now - self._window_start))
+            self._window_start, self._window_steps = now, 0
+
+    def close(self):
+        self.registry.remove(session=self.session_id)
+
+
+class SamplingProfiler:
+    """
+    Profiler por amostragem: a cada intervalo lê a pilha de todas as threads
+    (sys._current_frames) e conta pilhas iguais. Desligado não custa nada (sem thread).
+    """
+
+    MAX_STACKS = 20000
+    MAX_DEPTH = 64
+
+    def __init__(self):
+        self.interval = 0.005
+        self.samples = 0
+        self.stacks = _Counter()
+        self.started = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms=5.0, reset=True):
+        if self.running: self.stop()
+        if reset:
+            self.stacks.clear()
+            self.samples = 0
+        self.interval = max(float(interval_ms), 0.5) / 1000
+        self.started = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="sampling-profiler")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread: self._thread.join(timeout=2)
+        self._thread = None
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me: continue
+                stack = []
+                while frame is not None and len(stack) < self.MAX_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                # Thread ociosa (esperando lock/evento/select/tarefa do pool) não interessa
+                if stack and stack[0].startswith(IDLE_FRAMES): continue
+                key = (names.get(ident, str(ident)),) + tuple(reversed(stack))
+                if key in self.stacks or len(self.stacks) < self.MAX_STACKS: self.stacks[key] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Formato 'pilha;separada;por;ponto-e-vírgula contagem' (flamegraph.pl / speedscope)."""
+        return "\n".join(f"{';'.join(stack)} {n}" for stack, n in self.stacks.most_common()) + "\n"
+
+    def report(self, limit=30):
+        total = sum(self.stacks.values()) or 1
+        own, inclusive = _Counter(), _Counter()
+        for stack, n in self.stacks.items():
+            own[stack[-1]] += n
+            for fn in set(stack[1:]): inclusive[fn] += n
+        return {
+            "running": self.running, "interval_ms": self.interval * 1000, "samples": self.samples,
+            "started": self.started,
+            "self": [{"function": fn, "samples": n, "pct": round(100 * n / total, 2)} for fn, n in own.most_common(limit)],
+            "inclusive": [{"function": fn, "samples": n, "pct": round(100 * n / total, 2)}
+                          for fn, n in inclusive.most_common(limit)],
+        }
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,227 @@
+"""
+Leitura do .net.xml em streaming para o gerador (uma passada com iterparse).
+
+Ao contrário do sumolib.net.readNet, não monta o grafo em memória: cada aresta
+normal (sem function, ou seja, sem internas/crossings/walkingareas) vira um
+registro de rua assim que o </edge> fecha, e os elementos já lidos são
+descartados. Os registros saem em lotes, com a projeção feita por lote.
+
+O único estado que cresce com a rede é o ponto final de cada faixa, usado
+para posicionar os semáforos: o dispositivo fica no fim da faixa de entrada
+da primeira conexão controlada pelo semáforo (mesma regra do readNet).
+
+ElementTee reparte uma única passada entre várias etapas do gerador (sync,
+tiles, demanda), cada uma lendo o seu ramo numa thread própria.
+"""
+import os
+import gzip
+import queue
+import threading
+import xml.etree.ElementTree as ET
+
+from projection import NetProjection
+
+BATCH_SIZE = 50
+TEE_BATCH = 512  # elementos por item da fila de cada ramo
+# Itens de folga por ramo: um consumidor lento (sync pela rede) só segura a leitura depois disso
+TEE_BUFFER = int(os.getenv("NET_TEE_BUFFER", "256"))
+
+
+def road_type(speed):
+    return 'rodovia' if speed > 20 else 'primaria' if speed > 13 else 'secundaria'
+
+
+def road_record(edge_id, name, speed, points):
+    """Registro da tabela rede_viaria (points em [lat, lon])."""
+    rtype = road_type(speed)
+    return {
+        'id': edge_id,
+        'name': name or edge_id,
+        'type': rtype,
+        'points': points,
+        'style': {'color': '#22c55e' if rtype == 'primaria' else '#eab308'}
+    }
+
+
+def _parse_shape(text):
+    return [tuple(float(v) for v in p.split(",")[:2]) for p in text.split()]
+
+
+def _edge_shape(lane_shapes):
+    """Mesma forma do Edge.getShape do sumolib: faixa do meio, ou média ponto a ponto se o nº de faixas é par."""
+    n = len(lane_shapes)
+    if n % 2 == 1: return lane_shapes[n // 2]
+    size = min(len(s) for s in lane_shapes)
+    return [(sum(s[i][0] for s in lane_shapes) / n, sum(s[i][1] for s in lane_shapes) / n) for i in range(size)]
+
+
+def _open(net_file):
+    return gzip.open(net_file, "rb") if str(net_file).endswith(".gz") else open(net_file, "rb")
+
+
+def _project_roads(proj, edges):
+    lonlat = proj.to_lonlat([p for _, _, _, shape in edges for p in shape]).tolist()
+    roads, i = [], 0
+    for edge_id, name, speed, shape in edges:
+        roads.append(road_record(edge_id, name, speed, [[lat, lon] for lon, lat in lonlat[i:i + len(shape)]]))
+        i += len(shape)
+    return roads
+
+
+def _project_tls(proj, sites):
+    lonlat = proj.to_lonlat([xy for _, xy in sites]).tolist()
+    return [{"id": tl_id, "latitude": lat, "longitude": lon} for (tl_id, _), (lon, lat) in zip(sites, lonlat)]
+
+
+def iter_elements(net_file, detail=False):
+    """
+    Uma passada pelo arquivo: gera ("location", NetProjection), ("edge", (id, nome,
+    velocidade, forma XY)) para arestas normais e ("tls", (id, ponto XY)) para cada
+    semáforo na primeira conexão controlada por ele. Com detail=True gera também
+    ("lanes", (id, [(comprimento, velocidade, allow, disallow)])) logo após cada
+    "edge" e ("connection", (de, para)) para cada conexão (o que a demanda usa).
+    """
+    lane_end = {}  # id da faixa -> último ponto (x, y)
+    seen_tls = set()
+    with _open(net_file) as f:
+        context = ET.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        depth = 1
+        for event, elem in context:
+            if event == "start":
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1: continue  # filhos (lane, param, request...) são tratados pelo pai
+
+            tag = elem.tag
+            if tag == "location":
+                offset = [float(v) for v in elem.get("netOffset", "0,0").split(",")]
+                yield "location", NetProjection(elem.get("projParameter", "!"), offset)
+            elif tag == "edge" and not elem.get("function"):
+                lanes = elem.findall("lane")
+                shapes = [_parse_shape(lane.get("shape", "")) for lane in lanes]
+                for lane, shape in zip(lanes, shapes):
+                    if shape: lane_end[lane.get("id")] = shape[-1]
+                if lanes:
+                    yield "edge", (elem.get("id"), elem.get("name"), float(lanes[-1].get("speed")), _edge_shape(shapes))
+                    if detail:
+                        yield "lanes", (elem.get("id"), [(float(l.get("length")), float(l.get("speed")),
+                                                          l.get("allow"), l.get("disallow")) for l in lanes])
+            elif tag == "connection":
+                if detail: yield "connection", (elem.get("from"), elem.get("to"))
+                tl_id = elem.get("tl")
+                if tl_id and tl_id not in seen_tls:
+                    from_lane = f"{elem.get('from')}_{elem.get('fromLane')}"
+                    # Conexões de/para arestas não normais não contam (o readNet também as ignora)
+                    if from_lane in lane_end and f"{elem.get('to')}_{elem.get('toLane')}" in lane_end:
+                        seen_tls.add(tl_id)
+                        yield "tls", (tl_id, lane_end[from_lane])
+            root.clear()
+
+
+def iter_net(net_file, batch_size=BATCH_SIZE, elements=None):
+    """
+    Gera ("road", [registros de rua]) e ("tls", [{id, latitude, longitude}]) em lotes
+    de até batch_size. As ruas vêm primeiro (as conexões ficam no fim do arquivo).
+    elements: ramo de um ElementTee no lugar de ler o arquivo.
+    """
+    proj = None
+    edges, sites = [], []
+    for kind, item in iter_elements(net_file) if elements is None else elements:
+        if edges and kind not in ("edge", "lanes"):
+            yield "road", _project_roads(proj, edges)
+            edges = []
+        if kind == "location":
+            proj = item
+        elif kind == "edge":
+            edges.append(item)
+            if len(edges) >= batch_size:
+                yield "road", _project_roads(proj, edges)
+                edges = []
+        elif kind == "tls":
+            sites.append(item)
+            if len(sites) >= batch_size:
+                yield "tls", _project_tls(proj, sites)
+                sites = []
+    if edges: yield "road", _project_roads(proj, edges)
+    if sites: yield "tls", _project_tls(proj, sites)
+
+
+_END = object()
+
+
+class TeeBranch:
+    """Fila de um consumidor do ElementTee; iterar devolve os elementos na ordem do arquivo."""
+
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+        self.closed = False
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is _END: return
+            if isinstance(item, BaseException): raise item
+            yield from item
+
+    def close(self):
+        """Desiste do ramo: o produtor para de esperar por ele."""
+        self.closed = True
+        try:
+            while True: self.queue.get_nowait()
+        except queue.Empty: pass
+
+
+class ElementTee:
+    """
+    Uma passada do iter_elements(detail=True) numa thread, repartida entre ramos
+    nomeados. Cada ramo recebe a sua NetProjection (o pyproj não é seguro entre
+    threads). Quem usa um ramo precisa passar por consume() (ou close()): ramo
+    aberto e sem leitura segura o produtor quando a fila enche.
+    """
+
+    def __init__(self, net_file, names, buffer=TEE_BUFFER, batch=TEE_BATCH):
+        self.net_file = net_file
+        self.batch = batch
+        self.branches = {name: TeeBranch(buffer) for name in names}
+        self._thread = threading.Thread(target=self._run, name="net-tee", daemon=True)
+        self._thread.start()
+
+    def consume(self, name, fn):
+        """fn(ramo) e fecha o ramo na saída, tenha ele sido lido até o fim ou não."""
+        branch = self.branches[name]
+        try: return fn(branch)
+        finally: branch.close()
+
+    def close(self):
+        for branch in self.branches.values(): branch.close()
+
+    def _put(self, branch, item):
+        while not branch.closed:
+            try:
+                branch.queue.put(item, timeout=0.1)
+                return
+            except queue.Full: pass
+
+    def _publish(self, batch):
+        for branch in self.branches.values(): self._put(branch, batch)
+
+    def _run(self):
+        batch, end = [], _END
+        try:
+            for kind, item in iter_elements(self.net_file, detail=True):
+                if kind == "location":
+                    if batch: self._publish(batch)
+                    batch = []
+                    for branch in self.branches.values():
+                        self._put(branch, [(kind, NetProjection(item.proj_parameter, item.offset))])
+                    continue
+                batch.append((kind, item))
+                if len(batch) >= self.batch:
+                    self._publish(batch)
+                    batch = []
+                    if all(b.closed for b in self.branches.values()): return
+            if batch: self._publish(batch)
+        except Exception as e: end = e
+        for branch in self.branches.values(): self._put(branch, end)
@@ -0,0 +1,53 @@
+import gzip
+import xml.etree.ElementTree as ET
+import numpy as np
+
+try:
+    import pyproj
+    HAS_PYPROJ = True
+except ImportError: HAS_PYPROJ = False
+
+
+def read_location(net_file):
+    """Lê apenas o <location> do .net.xml (fica no topo, não percorre o arquivo todo)."""
+    opener = gzip.open if str(net_file).endswith(".gz") else open
+    with opener(net_file, "rb") as f:
+        for _, elem in ET.iterparse(f, events=("start",)):
+            if elem.tag == "location":
+                return dict(elem.attrib)
+            if elem.tag in ("edge", "junction"):
+                break
+    raise ValueError(f"<location> não encontrado em {net_file}")
+
+
+class NetProjection:
+    """
+    Conversão XY (coordenadas da rede) -> lon/lat em lote, mesma conta do SUMO:
+    remove o netOffset e aplica o inverso do projParameter.
+    """
+
+    def __init__(self, proj_parameter, net_offset=(0.0, 0.0)):
+        self.proj_parameter = proj_parameter
+        self.offset = np.asarray(net_offset, dtype=float)
+        self._proj = None
+        if proj_parameter != "!":
+            if not HAS_PYPROJ: raise RuntimeError("pyproj não instalado.")
+            self._proj = pyproj.Proj(proj_parameter)
+
+    @classmethod
+    def from_net_file(cls, net_file):
+        loc = read_location(net_file)
+        offset = [float(v) for v in loc.get("netOffset", "0,0").split(",")]
+        return cls(loc.get("projParameter", "!"), offset)
+
+    def to_lonlat(self, xy):
+        """xy: array Nx2 -> array Nx2 (lon, lat)."""
+        xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+        x = xy[:, 0] - self.offset[0]
+        y = xy[:, 1] - self.offset[1]
+        if self._proj is None:
+            return np.column_stack((x, y))
+        lon, lat = self._proj(x, y, inverse=True)
+        return np.column_stack((lon, lat))
+
+    __call__ = to_lonlat
@@ -0,0 +1,199 @@
+"""
+Protocolos de frame do /ws.
+
+- "json" (padrão): payload legado, lista completa de veículos a cada passo.
+- "delta" (binário, opt-in): keyframe no início e depois só o que mudou.
+
+Negociação: query string `/ws?protocol=delta` ou subprotocolo WebSocket
+`fluxus.delta.v1`. No modo delta, mensagens de status continuam em texto JSON
+e os estados da simulação vão em mensagens binárias (little-endian):
+
+    header  <BBHIdIIIII  version, kind (0=key, 1=delta), reservado, seq, time,
+                         n_names, n_vehicles, n_removed, n_tls_names, n_tls
+    removed  n_removed x u32                  slots liberados
+    names    n_names x (u32 slot, u16 len, utf8 id)   slots novos (ou reatribuídos)
+    vehicles n_vehicles x VEH_DTYPE           veículos novos ou alterados
+    tls_names n_tls_names x (u16 idx, u16 len, utf8 id)
+    tls      n_tls x (u16 idx, u16 len, ascii state)  semáforos que mudaram
+
+O cliente aplica as seções nessa ordem; num keyframe ele descarta o estado
+anterior antes. Escalas em SCALES.
+"""
+import json
+import struct
+import numpy as np
+
+VERSION = 1
+KIND_KEY, KIND_DELTA = 0, 1
+SUBPROTOCOL = "fluxus.delta.v1"
+PROTOCOLS = ("json", "delta")
+
+HEADER = struct.Struct("<BBHIdIIIII")
+NAME = struct.Struct("<IH")
+TLS = struct.Struct("<HH")
+VEH_DTYPE = np.dtype([("slot", "<u4"), ("lat", "<i4"), ("lon", "<i4"),
+                      ("angle", "<u2"), ("speed", "<u2"), ("distance", "<u4")])
+# valor real = inteiro / escala
+SCALES = {"lat": 1e6, "lon": 1e6, "angle": 100.0, "speed": 100.0, "distance": 10.0}
+
+
+def negotiate(websocket):
+    """Retorna (protocolo, subprotocolo a aceitar) a partir do handshake do /ws."""
+    requested = websocket.query_params.get("protocol", "json")
+    offered = websocket.scope.get("subprotocols") or []
+    if SUBPROTOCOL in offered:
+        return "delta", SUBPROTOCOL
+    return (requested if requested in PROTOCOLS else "json"), None
+
+
+def hello(protocol):
+    """Mensagem de texto enviada ao cliente ao iniciar o stream (None no JSON legado)."""
+    return make_encoder(protocol).hello()
+
+
+def make_encoder(protocol):
+    return DeltaEncoder() if protocol == "delta" else JsonEncoder()
+
+
+async def send_payload(websocket, payload):
+    if isinstance(payload, bytes):
+        await websocket.send_bytes(payload)
+    else:
+        await websocket.send_text(payload)
+
+
+class JsonEncoder:
+    protocol = "json"
+
+    def hello(self):
+        return None
+
+    def encode(self, frame, keyframe=False):
+        return json.dumps(frame.to_json(), separators=(",", ":"))
+
+
+class DeltaEncoder:
+    """Mantém o último estado enviado ao cliente e codifica só as diferenças."""
+    protocol = "delta"
+
+    def __init__(self):
+        self.seq = 0
+        self.slots = {}          # veh_id -> slot
+        self.slot_ids = {}       # slot -> veh_id
+        self.free = []           # slots liberados (reaproveitados nos próximos frames)
+        self.next_slot = 0
+        self.last = np.zeros(0, dtype=VEH_DTYPE)   # último registro enviado por slot
+        self.alive = np.zeros(0, dtype=np.uint32)  # slots vivos no último frame
+        self.tls_index = {}
+        self.tls_last = {}
+        self.time = 0.0
+
+    def hello(self):
+        return {"status": "protocol", "protocol": self.protocol, "version": VERSION, "scales": SCALES}
+
+    def _alloc(self, veh_id):
+        slot = self.free.pop() if self.free else self.next_slot
+        if slot == self.next_slot:
+            self.next_slot += 1
+        self.slots[veh_id] = slot
+        self.slot_ids[slot] = veh_id
+        return slot
+
+    def _quantize(self, frame, slots):
+        rec = np.empty(len(slots), dtype=VEH_DTYPE)
+        rec["slot"] = slots
+        if len(slots):
+            rec["lat"] = np.rint(frame.lonlat[:, 1] * SCALES["lat"])
+            rec["lon"] = np.rint(frame.lonlat[:, 0] * SCALES["lon"])
+            rec["angle"] = np.rint(np.mod(frame.angle, 360.0) * SCALES["angle"])
+            rec["speed"] = np.rint(np.clip(frame.speed, 0, 655.35) * SCALES["speed"])
+            rec["distance"] = np.rint(np.clip(frame.distance, 0, 4e8) * SCALES["distance"])
+        return rec
+
+    def encode(self, frame, keyframe=False):
+        new_names = []
+        slots = np.empty(len(frame.ids), dtype=np.uint32)
+        for i, veh_id in enumerate(frame.ids):
+            slot = self.slots.get(veh_id)
+            if slot is None:
+                slot = self._alloc(veh_id)
+                new_names.append((slot, veh_id))
+            slots[i] = slot
+
+        removed = np.setdiff1d(self.alive, slots, assume_unique=True).astype(np.uint32)
+        # Só libera depois de alocar, para um slot nunca ser removido e reusado no mesmo frame
+        for slot in removed.tolist():
+            del self.slots[self.slot_ids.pop(slot)]
+            self.free.append(slot)
+
+        rec = self._quantize(frame, slots)
+        if self.next_slot > len(self.last):
+            grown = np.zeros(max(self.next_slot, 2 * len(self.last)), dtype=VEH_DTYPE)
+            grown[:len(self.last)] = self.last
+            self.last = grown
+
+        mask = rec != self.last[slots]
+        if new_names:
+            mask |= np.isin(slots, [s for s, _ in new_names])
+        changed = rec[mask]
+        self.last[slots] = rec
+        self.alive = slots
+
+        tls_names = []
+        for tls_id in frame.tls:
+            if tls_id not in self.tls_index:
+                self.tls_index[tls_id] = len(self.tls_index)
+                tls_names.append((self.tls_index[tls_id], tls_id))
+        tls_changed = [(t, s) for t, s in frame.tls.items() if self.tls_last.get(t) != s]
+        self.tls_last = dict(frame.tls)
+
+        self.seq += 1
+        self.time = frame.time
+        if keyframe or self.seq == 1:
+            return self.keyframe()
+        return self._pack(KIND_DELTA, new_names, changed, removed, tls_names, tls_changed)
+
+    def keyframe(self):
+        """Estado completo atual, sem mexer na cadeia de deltas (para quem entrou ou atrasou)."""
+        return self._pack(KIND_KEY, list(self.slot_ids.items()), self.last[self.alive],
+                          np.zeros(0, dtype=np.uint32), [(i, t) for t, i in self.tls_index.items()],
+                          list(self.tls_last.items()))
+
+    def _pack(self, kind, names, changed, removed, tls_names, tls_changed):
+        parts = [HEADER.pack(VERSION, kind, 0, self.seq - 1, self.time,
+                             len(names), len(changed), len(removed), len(tls_names), len(tls_changed)),
+                 removed.tobytes()]
+        for slot, veh_id in names:
+            raw = veh_id.encode()
+            parts.append(NAME.pack(slot, len(raw)) + raw)
+        parts.append(changed.tobytes())
+        for idx, tls_id in tls_names:
+            raw = tls_id.encode()
+            parts.append(TLS.pack(idx, len(raw)) + raw)
+        for tls_id, state in tls_changed:
+            raw = state.encode()
+            parts.append(TLS.pack(self.tls_index[tls_id], len(raw)) + raw)
+        return b"".join(parts)
+
+
+def decode(buf):
+    """Decodificador de referência (usado para validar clientes e nos benchmarks)."""
+    (version, kind, _, seq, time, n_names, n_veh, n_removed,
+     n_tls_names, n_tls) = HEADER.unpack_from(buf, 0)
+    off = HEADER.size
+    removed = np.frombuffer(buf, dtype="<u4", count=n_removed, offset=off)
+    off += 4 * n_removed
+    names = []
+    for _ in range(n_names):
+        slot, size = NAME.unpack_from(buf, off); off += NAME.size
+        names.append((slot, bytes(buf[off:off + size]).decode())); off += size
+    vehicles = np.frombuffer(buf, dtype=VEH_DTYPE, count=n_veh, offset=off)
+    off += VEH_DTYPE.itemsize * n_veh
+    tls_names, tls = [], []
+    for out, n in ((tls_names, n_tls_names), (tls, n_tls)):
+        for _ in range(n):
+            idx, size = TLS.unpack_from(buf, off); off += TLS.size
+            out.append((idx, bytes(buf[off:off + size]).decode())); off += size
+    return {"version": version, "keyframe": kind == KIND_KEY, "seq": seq, "time": time,
+            "removed": removed, "names": names, "vehicles": vehicles,
+            "tls_names": tls_names, "tls": tls}
@@ -0,0 +1,240 @@
+"""
+Cache em disco dos artefatos de geração de cenário (em /app/scenarios/cache).
+
+Cada artefato é guardado pelo hash dos parâmetros que o produzem:
+    geocode  cidade normalizada                         -> {lat, lon}
+    osm      bbox                                       -> map.osm.xml
+    net      bbox + opções do netconvert                -> .net.xml
+    routes   chave do net + veículos + duração + opções -> .rou.xml
+    tiles    chave do net + zooms                       -> tiles/ (tar)
+    scenario cidade + raio + veículos + duração + opções -> {net, routes, bbox}
+    sync     URL do Supabase                            -> {net} (última rede sincronizada)
+
+A entrada "scenario" é o caminho rápido: um hit dispensa geocode, download,
+netconvert e geração de demanda; com "tiles" e "sync" também não relê o net. Eviction LRU pelo tamanho total (SCENARIO_CACHE_MAX_MB).
+
+Uso para importar um cenário pronto (ex.: scenarios/osasco) como entrada quente:
+    python scenario_cache.py import /app/scenarios/osasco --city osasco --vehicles 300 --duration 1000
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import shutil
+import tarfile
+import hashlib
+import argparse
+import unicodedata
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from contextlib import contextmanager
+
+CACHE_DIR = Path(os.getenv("SCENARIO_CACHE_DIR", "/app/scenarios/cache"))
+MAX_BYTES = int(float(os.getenv("SCENARIO_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+SUFFIX = {"osm": ".osm.xml", "net": ".net.xml", "routes": ".rou.xml", "tiles": ".tar"}
+
+
+def normalize_city(name):
+    """'  São  Paulo ' -> 'sao paulo'"""
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    return " ".join(name.casefold().split())
+
+
+def _canonical(value):
+    """1000.0 e 1000 viram a mesma chave (o JSON do /generate e o CLI chegam com tipos diferentes)."""
+    if isinstance(value, float) and value.is_integer(): return int(value)
+    if isinstance(value, dict): return {k: _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)): return [_canonical(v) for v in value]
+    return value
+
+
+def make_key(kind, **params):
+    raw = json.dumps(_canonical({"kind": kind, **params}), sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def round_bbox(bbox):
+    return [round(v, 6) for v in bbox]
+
+
+class ScenarioCache:
+    def __init__(self, root=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_file = self.root / "index.json"
+
+    @contextmanager
+    def _locked_index(self):
+        """Índice protegido por flock (vários processos de geração podem usar o cache)."""
+        with open(self.root / "index.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try: index = json.loads(self.index_file.read_text())
+            except (OSError, ValueError): index = {}
+            yield index
+            tmp = self.index_file.with_suffix(".tmp")
+            tmp.write_text(json.dumps(index))
+            os.replace(tmp, self.index_file)
+
+    def _path(self, kind, key):
+        return self.root / kind / f"{key}{SUFFIX.get(kind, '.json')}"
+
+    # --- leitura ---
+    def get(self, kind, key):
+        """Caminho do artefato ou None. Atualiza o LRU."""
+        with self._locked_index() as index:
+            entry = index.get(f"{kind}/{key}")
+            if not entry: return None
+            path = self._path(kind, key)
+            if not path.exists():
+                del index[f"{kind}/{key}"]
+                return None
+            entry["last_used"] = time.time()
+            return path
+
+    def get_json(self, kind, key):
+        path = self.get(kind, key)
+        if path is None: return None
+        try: return json.loads(path.read_text())
+        except (OSError, ValueError): return None
+
+    def materialize(self, kind, key, target):
+        """Copia o artefato para o destino de trabalho (o cache nunca é editado in-place)."""
+        path = self.get(kind, key)
+        if path is None: return False
+        tmp = Path(f"{target}.tmp")
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, target)
+        return True
+
+    def materialize_tree(self, kind, key, target):
+        """Extrai um diretório guardado com put_tree no lugar de target (troca inteira)."""
+        path = self.get(kind, key)
+        if path is None: return False
+        target = Path(target)
+        tmp = target.with_name(target.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        try:
+            with tarfile.open(path) as tar:
+                # filter só existe a partir do 3.11.4/3.10.12 (o tar é nosso, mas sem caminhos absolutos)
+                tar.extractall(tmp, **({"filter": "data"} if hasattr(tarfile, "data_filter") else {}))
+        except (OSError, tarfile.TarError):
+            shutil.rmtree(tmp, ignore_errors=True)
+            return False
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+        return True
+
+    # --- escrita ---
+    def put(self, kind, key, src, meta=None):
+        dst = self._path(kind, key)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(dst.name + ".tmp")
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+        self._register(kind, key, dst, meta)
+        return dst
+
+    def put_tree(self, kind, key, src_dir, meta=None):
+        """Guarda um diretório como tar sem compressão (os tiles já são .gz)."""
+        dst = self._path(kind, key)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(dst.name + ".tmp")
+        with tarfile.open(tmp, "w") as tar: tar.add(src_dir, arcname=".")
+        os.replace(tmp, dst)
+        self._register(kind, key, dst, meta)
+        return dst
+
+    def put_json(self, kind, key, data, meta=None):
+        dst = self._path(kind, key)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(dst.name + ".tmp")
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, dst)
+        self._register(kind, key, dst, meta)
+        return dst
+
+    def _register(self, kind, key, path, meta):
+        now = time.time()
+        with self._locked_index() as index:
+            index[f"{kind}/{key}"] = {"size": path.stat().st_size, "created": now,
+                                      "last_used": now, "meta": meta or {}}
+            self._evict(index)
+
+    def _evict(self, index):
+        total = sum(e["size"] for e in index.values())
+        for name, entry in sorted(index.items(), key=lambda kv: kv[1]["last_used"]):
+            if total <= self.max_bytes: break
+            kind, key = name.split("/", 1)
+            try: self._path(kind, key).unlink()
+            except OSError: pass
+            total -= entry["size"]
+            del index[name]
+
+    def stats(self):
+        with self._locked_index() as index:
+            return {"entries": len(index), "bytes": sum(e["size"] for e in index.values()),
+                    "max_bytes": self.max_bytes}
+
+    def import_scenario(self, scenario_dir, city, vehicles, duration, scenario_key_fn, net=None, routes=None):
+        """
+        Registra um cenário já gerado (net + rou) como entrada quente. scenario_key_fn monta
+        as mesmas chaves que o gerador usa: (city, vehicles, duration, bbox) -> (scenario, net, routes).
+        """
+        scenario_dir = Path(scenario_dir)
+        cfg_net, cfg_routes = None, None
+        for cfg in scenario_dir.glob("*.sumocfg"):
+            try: root = ET.parse(cfg).getroot()
+            except ET.ParseError: continue
+            node = root.find(".//net-file")
+            if node is not None: cfg_net = scenario_dir / node.get("value")
+            node = root.find(".//route-files")
+            if node is not None: cfg_routes = scenario_dir / node.get("value").split(",")[0]
+        net = Path(net) if net else cfg_net
+        routes = Path(routes) if routes else cfg_routes
+        if routes is None or not routes.exists():
+            routes = next(iter(scenario_dir.glob("*.rou.xml")), None)
+        if net is None or not net.exists():
+            net = next(iter(scenario_dir.glob("*.net.xml")), None)
+        missing = [name for name, p in (("net", net), ("routes", routes)) if p is None or not p.exists()]
+        if missing:
+            raise FileNotFoundError(f"{scenario_dir}: faltando {', '.join(missing)} (use --net/--routes)")
+
+        from projection import read_location
+        # bbox do cenário vem do origBoundary do próprio net (lon/lat min/max)
+        w, s, e, n = [float(v) for v in read_location(net)["origBoundary"].split(",")]
+        bbox = (s, w, n, e)
+        scenario_key, net_key, routes_key = scenario_key_fn(city, vehicles, duration, bbox)
+        self.put("net", net_key, net, {"city": city})
+        self.put("routes", routes_key, routes, {"city": city, "vehicles": vehicles, "duration": duration})
+        self.put_json("scenario", scenario_key, {"net": net_key, "routes": routes_key, "bbox": bbox,
+                                                 "center": [(s + n) / 2, (w + e) / 2]}, {"city": city})
+        return scenario_key
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cache de cenários")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("import", help="importa um cenário pronto como entrada quente")
+    p.add_argument("scenario_dir")
+    p.add_argument("--city", required=True)
+    p.add_argument("--vehicles", type=int, default=300)
+    p.add_argument("--duration", type=int, default=1000)
+    p.add_argument("--net")
+    p.add_argument("--routes")
+    sub.add_parser("stats")
+    args = parser.parse_args(argv)
+
+    cache = ScenarioCache()
+    if args.cmd == "stats":
+        print(cache.stats())
+    elif args.cmd == "import":
+        from generator import ScenarioGeneratorAPI
+        key = cache.import_scenario(args.scenario_dir, args.city, args.vehicles, args.duration,
+                                    ScenarioGeneratorAPI.cache_keys, net=args.net, routes=args.routes)
+        print(f"Importado: scenario/{key}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
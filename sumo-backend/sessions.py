@@ -0,0 +1,122 @@
+import os
+import uuid
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from simulation_worker import SimulationWorker
+from sim_backend import BACKENDS
+from metrics import SessionMetrics
+
+try:
+    from dynamic_controller import TrafficAI
+except ImportError:
+    class TrafficAI:
+        def __init__(self, ai_enabled=False, conn=None, strategy=None): self.ai_enabled = ai_enabled
+        def attach(self, conn): pass
+        def start(self): pass
+        def reset(self): pass
+        def set_ai_status(self, enabled, strategy=None): self.ai_enabled = enabled
+        def step(self, now=None): return []
+
+CPU_COUNT = os.cpu_count() or 1
+POOL_SIZE = int(os.getenv("MAX_SIMULATIONS", CPU_COUNT))
+# libsumo segura o GIL no simulationStep e travaria o event loop do /ws: as sessões
+# usam TraCI (SUMO em outro processo); libsumo/auto só com SESSION_BACKEND explícito
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "traci")
+if SESSION_BACKEND not in BACKENDS: raise ValueError(f"SESSION_BACKEND inválido: {SESSION_BACKEND} (use {', '.join(BACKENDS)})")
+# Folga mínima para admitir mais uma simulação (cada SUMO ocupa ~1 núcleo)
+MIN_FREE_CORES = float(os.getenv("ADMIT_MIN_FREE_CORES", "1.0"))
+MIN_FREE_MEM_MB = float(os.getenv("ADMIT_MIN_FREE_MEM_MB", "512"))
+
+
+def system_headroom():
+    """(núcleos livres, MB de memória disponível). Usa loadavg e /proc/meminfo."""
+    try: load = os.getloadavg()[0]
+    except OSError: load = 0.0
+    free_mem = float("inf")
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    free_mem = int(line.split()[1]) / 1024
+                    break
+    except OSError: pass
+    return CPU_COUNT - load, free_mem
+
+
+class SimulationSession:
+    """Estado de uma simulação: conexão TraCI rotulada, worker, IA e cenário."""
+
+    def __init__(self, session_id, scenario_id, worker, traffic_ai, shared=False, scenario_dir=None):
+        self.id = session_id
+        self.scenario_id = scenario_id
+        self.scenario_dir = scenario_dir  # pasta em uso (o prune dos jobs não apaga)
+        self.worker = worker
+        self.traffic_ai = traffic_ai
+        self.future = None
+        # Sessão compartilhada: espectadores assistem, só o dono (token) controla
+        self.shared = shared
+        self.owner_token = secrets.token_urlsafe(16)
+        self.broadcaster = None
+
+    def stop(self):
+        self.worker.stop()
+
+
+class SessionManager:
+    """
+    Sessões de simulação em paralelo. Cada uma roda num thread do pool (dimensionado
+    pelos núcleos) e fala com o seu próprio processo SUMO. A admissão depende da
+    folga de CPU/memória da máquina, não de um limite fixo.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE):
+        self.pool_size = max(1, pool_size)
+        self.pool = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="sumo")
+        self.sessions: dict[str, SimulationSession] = {}
+        self.ai_enabled = False
+        self.ai_strategy = None  # None = AI_STRATEGY do ambiente
+        self._lock = threading.Lock()
+
+    def can_admit(self, active_count=None):
+        active = len(self.sessions) if active_count is None else active_count
+        if active >= self.pool_size: return False
+        if active == 0: return True
+        free_cores, free_mem = system_headroom()
+        # loadavg demora a refletir sessões recém-criadas: conta cada uma como 1 núcleo
+        free_cores = min(free_cores, CPU_COUNT - active)
+        return free_cores >= MIN_FREE_CORES and free_mem >= MIN_FREE_MEM_MB
+
+    def create(self, sumo_cmd, scenario_id=None, shared=False, scenario_dir=None, **worker_kwargs):
+        session_id = uuid.uuid4().hex[:12]
+        traffic_ai = TrafficAI(ai_enabled=self.ai_enabled)
+        if self.ai_strategy: traffic_ai.set_ai_status(self.ai_enabled, self.ai_strategy)
+        worker_kwargs.setdefault("backend", SESSION_BACKEND)
+        worker_kwargs.setdefault("metrics", SessionMetrics(session_id))
+        worker = SimulationWorker(sumo_cmd, traffic_ai, label=f"sim-{session_id}", **worker_kwargs)
+        session = SimulationSession(session_id, scenario_id, worker, traffic_ai, shared, scenario_dir)
+        # Linha do tempo dos checkpoints fica protegida do prune enquanto a sessão viver
+        if worker.checkpoints: worker.checkpoints.acquire()
+        with self._lock:
+            self.sessions[session_id] = session
+        session.future = self.pool.submit(worker.run)
+        return session
+
+    def get(self, session_id):
+        return self.sessions.get(session_id)
+
+    def targets(self, session_id=None):
+        """Sessão específica ou todas (quando session_id não é informado)."""
+        if session_id is None: return list(self.sessions.values())
+        session = self.sessions.get(session_id)
+        return [session] if session else []
+
+    def release(self, session_id):
+        with self._lock:
+            session = self.sessions.pop(session_id, None)
+        if session:
+            session.stop()
+            session.worker.metrics.close()
+            if session.worker.checkpoints: session.worker.checkpoints.release()
+        return session
@@ -0,0 +1,154 @@
+"""
+Estratégias de controle semafórico da IA (selecionáveis pelo /toggle-ai).
+
+O programa de cada semáforo (fases, links faixa de entrada -> faixa de saída) é
+lido uma vez. O TrafficAI decide a cada DECISION_INTERVAL segundos simulados e
+só mexe em fases verdes, respeitando o verde mínimo e máximo:
+  - max_pressure: mantém a fase verde de maior pressão (fila nas entradas menos
+    ocupação das saídas); troca quando outra fase tem pressão maior;
+  - actuated: estende o verde enquanto chegam veículos nas faixas com verde
+    (gap) e troca quando ninguém chega e há fila no vermelho;
+  - webster: não decide fase a fase; a cada WEBSTER_PERIOD recalcula ciclo e
+    verdes pela fórmula de Webster com o fluxo medido e reescreve a duração dos
+    verdes no programa (uma escrita por semáforo por período).
+Uma estratégia devolve None (deixa o programa seguir), EXTEND ou o índice da
+fase verde que deve entrar. A transição (amarelo/vermelho) é a do programa.
+"""
+import os
+import numpy as np
+
+DECISION_INTERVAL = float(os.getenv("AI_DECISION_INTERVAL", "5"))  # segundos simulados
+MIN_GREEN = float(os.getenv("AI_MIN_GREEN", "5"))
+MAX_GREEN = float(os.getenv("AI_MAX_GREEN", "60"))
+FALLBACK_STRATEGY = "max_pressure"
+DEFAULT_STRATEGY = os.getenv("AI_STRATEGY", FALLBACK_STRATEGY)  # conferido contra STRATEGIES no fim do módulo
+
+WEBSTER_PERIOD = 300.0
+SATURATION_FLOW = 0.5  # veículos/s por faixa (1800 veíc/h)
+MIN_CYCLE, MAX_CYCLE = 30.0, 150.0
+
+EXTEND = "extend"
+
+
+def is_green(state):
+    return ("G" in state or "g" in state) and "y" not in state and "Y" not in state
+
+
+class TlsProgram:
+    """Fases e links de um semáforo, lidos uma vez. Faixas viram posições no array de faixas do TrafficAI."""
+
+    def __init__(self, conn, tls_id, lane_pos):
+        self.tls_id = tls_id
+        program = conn.trafficlight.getProgram(tls_id)
+        logics = conn.trafficlight.getAllProgramLogics(tls_id)
+        self.logic = next((l for l in logics if l.programID == program), logics[0])
+        logic = self.logic
+        self.states = [p.state for p in logic.phases]
+        self.durations = [float(p.duration) for p in logic.phases]
+        self.base_durations = list(self.durations)
+        self.green = [i for i, state in enumerate(self.states) if is_green(state)]
+        self.min_green, self.max_green = {}, {}
+        for i in self.green:
+            p = logic.phases[i]
+            # Programa atuado traz minDur/maxDur próprios; estático usa os limites globais
+            actuated = 0 <= p.minDur < p.maxDur
+            self.min_green[i] = max(float(p.minDur), 1.0) if actuated else min(MIN_GREEN, self.durations[i])
+            self.max_green[i] = float(p.maxDur) if actuated else max(MAX_GREEN, self.durations[i])
+        self.lost_time = sum(d for i, d in enumerate(self.durations) if i not in self.min_green)
+
+        links = conn.trafficlight.getControlledLinks(tls_id)
+        self.phase_in, self.phase_out = {}, {}
+        for i in self.green:
+            ins, outs = [], []
+            for signal, state in enumerate(self.states[i]):
+                if state not in "Gg" or signal >= len(links): continue
+                for link in links[signal]:
+                    ins.append(lane_pos.setdefault(link[0], len(lane_pos)))
+                    outs.append(lane_pos.setdefault(link[1], len(lane_pos)))
+            # Faixa com vários movimentos verdes conta uma vez
+            self.phase_in[i] = np.unique(np.asarray(ins, dtype=np.int64))
+            self.phase_out[i] = np.unique(np.asarray(outs, dtype=np.int64))
+
+
+class Strategy:
+    name = None
+
+    def __init__(self, ai):
+        self.ai = ai
+
+    def observe(self, now, metrics):
+        """Chamado a cada passo com as métricas das faixas (só operações vetoriais)."""
+
+    def decide(self, tls, prog, phase, metrics):
+        return None
+
+
+class MaxPressure(Strategy):
+    name = "max_pressure"
+
+    def decide(self, tls, prog, phase, metrics):
+        count = metrics["count"]
+        pressure = {p: count[prog.phase_in[p]].sum() - count[prog.phase_out[p]].sum() for p in prog.green}
+        best = max(pressure, key=pressure.get)
+        if best == phase or pressure[best] <= pressure[phase]: return EXTEND
+        return best
+
+
+class Actuated(Strategy):
+    name = "actuated"
+
+    def decide(self, tls, prog, phase, metrics):
+        count, halting = metrics["count"], metrics["halting"]
+        lanes = prog.phase_in[phase]
+        # Ainda chegam veículos no verde atual: estende (gap não atingido)
+        if (count[lanes] - halting[lanes]).sum() > 0: return EXTEND
+        # Ninguém chegando: passa para a próxima fase verde (na ordem do ciclo) com fila esperando
+        after = [p for p in prog.green if p > phase] + [p for p in prog.green if p < phase]
+        for p in after:
+            if halting[np.setdiff1d(prog.phase_in[p], lanes)].sum() > 0: return p
+        return EXTEND
+
+
+class Webster(Strategy):
+    name = "webster"
+
+    def __init__(self, ai):
+        super().__init__(ai)
+        lengths = [ai.conn.lane.getLength(lane) for lane in ai.lanes]
+        self.lengths = np.maximum(np.asarray(lengths, dtype=float), 1.0)
+        self.flow_sum = np.zeros(len(ai.lanes))
+        self.samples = 0
+        self.next_update = None
+
+    def observe(self, now, metrics):
+        # Fluxo = densidade x velocidade média (veículos/s por faixa)
+        self.flow_sum += metrics["count"] / self.lengths * metrics["speed"]
+        self.samples += 1
+        if self.next_update is None: self.next_update = now + WEBSTER_PERIOD
+        elif now >= self.next_update:
+            self._update(self.flow_sum / self.samples)
+            self.flow_sum[:] = 0
+            self.samples = 0
+            self.next_update = now + WEBSTER_PERIOD
+
+    def _update(self, flow):
+        for tls, prog in self.ai.programs.items():
+            # Razão de fluxo crítica de cada fase: faixa mais carregada / fluxo de saturação
+            y = {p: float(flow[prog.phase_in[p]].max()) / SATURATION_FLOW if len(prog.phase_in[p]) else 0.0
+                 for p in prog.green}
+            total = sum(y.values())
+            if not total: continue
+            cycle = (1.5 * prog.lost_time + 5) / (1 - min(total, 0.9))
+            cycle = min(max(cycle, MIN_CYCLE, prog.lost_time + len(y) * MIN_GREEN), MAX_CYCLE)
+            effective = cycle - prog.lost_time
+            plan = {p: round(min(max(effective * y[p] / total, prog.min_green[p]), prog.max_green[p]))
+                    for p in prog.green}
+            if any(abs(g - prog.durations[p]) >= 1 for p, g in plan.items()): self.ai.apply_plan(tls, plan)
+
+
+STRATEGIES = {cls.name: cls for cls in (MaxPressure, Actuated, Webster)}
+
+# Erro de digitação no AI_STRATEGY aparece no boot, não no meio de uma sessão
+if DEFAULT_STRATEGY not in STRATEGIES:
+    print(f"AVISO: AI_STRATEGY={DEFAULT_STRATEGY!r} desconhecida ({', '.join(STRATEGIES)}); usando {FALLBACK_STRATEGY}.")
+    DEFAULT_STRATEGY = FALLBACK_STRATEGY
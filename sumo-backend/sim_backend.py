@@ -0,0 +1,79 @@
+"""
+Backend da simulação: libsumo (SUMO dentro do processo, sem socket) ou TraCI.
+
+As duas conexões têm a mesma API (conn.simulation, conn.vehicle, conn.lane,
+conn.trafficlight, conn.simulationStep(), conn.close()), então o loop do /ws,
+o TrafficAI e o headless não sabem qual estão usando.
+
+libsumo só comporta uma simulação por processo e segura o GIL durante o
+simulationStep: serve para o headless e os benchmarks (um SUMO por processo).
+As sessões do servidor ficam na TraCI (SESSION_BACKEND em sessions.py). Com
+SIM_BACKEND=auto usa libsumo quando está instalado e livre; senão cai na TraCI.
+"""
+import os
+import threading
+import traci
+
+try:
+    import libsumo
+    HAS_LIBSUMO = True
+except ImportError:
+    libsumo = None
+    HAS_LIBSUMO = False
+
+SIM_BACKEND = os.getenv("SIM_BACKEND", "auto")  # auto | libsumo | traci
+BACKENDS = ("auto", "libsumo", "traci")
+
+_libsumo_slot = threading.Lock()
+
+
+class LibsumoConnection:
+    """Conexão no formato da traci.Connection sobre o módulo libsumo (ocupa a vaga do processo)."""
+    backend = "libsumo"
+
+    def __init__(self):
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(libsumo, name)
+
+    def close(self):
+        if self._closed: return
+        self._closed = True
+        try: libsumo.close()
+        finally: _libsumo_slot.release()
+
+
+def _start_libsumo(cmd):
+    if not (HAS_LIBSUMO and _libsumo_slot.acquire(blocking=False)): return None
+    try:
+        libsumo.start(cmd)
+    except Exception:
+        _libsumo_slot.release()
+        raise
+    return LibsumoConnection()
+
+
+def _start_traci(cmd, label):
+    # Sem trocar a conexão global (doSwitch=False); porta livre escolhida pelo traci,
+    # que tenta outra porta se houver colisão entre sessões iniciando juntas
+    try: traci.start(cmd, label=label, doSwitch=False)
+    except:
+        try: traci.getConnection(label).close()
+        except: pass
+        traci.start(cmd, label=label, doSwitch=False)
+    conn = traci.getConnection(label)
+    conn.backend = "traci"
+    return conn
+
+
+def start(cmd, label="default", backend=None):
+    """Inicia o SUMO e devolve a conexão; conn.backend diz qual backend ficou."""
+    backend = backend or SIM_BACKEND
+    if backend not in BACKENDS: raise ValueError(f"Backend desconhecido: {backend}")
+    if backend != "traci":
+        conn = _start_libsumo(cmd)
+        if conn: return conn
+        if backend == "libsumo":
+            print("AVISO: libsumo indisponível (não instalado ou já em uso neste processo), usando TraCI.")
+    return _start_traci(cmd, label)
@@ -0,0 +1,199 @@
+import os
+import time
+import threading
+from collections import deque
+
+import sim_backend
+from metrics import SessionMetrics, Registry
+from snapshot import SimulationSnapshot
+
+STEP_LENGTH = 0.5
+
+
+def parse_speed(value):
+    """'realtime' -> 1.0, '4x' / '4' -> 4.0, 'max' -> 0 (sem limite)."""
+    if isinstance(value, (int, float)): return max(float(value), 0.0)
+    value = str(value or "").strip().lower()
+    if value in ("", "realtime", "real-time", "1x"): return 1.0
+    if value in ("max", "fast", "0"): return 0.0
+    factor = float(value.rstrip("x"))
+    if factor <= 0: raise ValueError(f"Velocidade inválida: {value}")
+    return factor
+
+
+DEFAULT_SPEED = os.getenv("SIM_SPEED", "10x")
+DEFAULT_FPS = float(os.getenv("WS_FPS", "20"))
+
+
+class FrameBuffer:
+    """Ring buffer limitado com os últimos frames produzidos pelo worker."""
+
+    def __init__(self, size=8):
+        self._frames = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.seq = -1
+
+    def push(self, frame):
+        with self._lock:
+            self.seq += 1
+            self._frames.append((self.seq, frame))
+
+    def latest(self):
+        """(seq, frame) mais recente, ou (-1, None) se ainda não houver frame."""
+        with self._lock:
+            return self._frames[-1] if self._frames else (-1, None)
+
+
+class SimulationWorker:
+    """
+    Produtor: roda o SUMO numa thread do pool (todas as chamadas TraCI ficam aqui)
+    e publica cada passo no FrameBuffer. O consumidor (WebSocket) lê só o frame
+    mais recente no seu próprio ritmo, então cliente lento não segura a simulação.
+    Cada worker usa a própria conexão (sim_backend): TraCI rotulada (label) numa
+    porta livre, ou libsumo dentro do processo quando configurado e livre.
+    Com checkpoints (CheckpointStore) salva o estado periodicamente e ao parar,
+    e atende seek(t) carregando o checkpoint mais próximo. Com recorder
+    (TrajectoryRecorder) grava cada frame para o replay sem SUMO.
+    """
+
+    def __init__(self, sumo_cmd, traffic_ai, geo=None, speed=DEFAULT_SPEED,
+                 buffer_size=8, on_ai_logs=None, label="default", backend=None, metrics=None,
+                 checkpoints=None, recorder=None):
+        self.sumo_cmd = sumo_cmd
+        self.label = label
+        self.backend = backend
+        # Sem métricas da sessão: registro próprio desligado (timers viram no-op)
+        self.metrics = metrics or SessionMetrics(label, Registry(enabled=False))
+        self.checkpoints = checkpoints
+        self.recorder = recorder
+        self.conn = None
+        self.traffic_ai = traffic_ai
+        self.geo = geo
+        self.speed = parse_speed(speed)
+        self.on_ai_logs = on_ai_logs
+        self.buffer = FrameBuffer(buffer_size)
+        self.started = threading.Event()
+        self.finished = threading.Event()
+        self.error = None
+        self.step_count = 0
+        self.stop_requested = False
+        self.sim_time = None
+        self._seek_to = None
+        self._stop_event = threading.Event()
+        self._wake = threading.Event()  # interrompe a espera do ritmo (parada ou seek)
+
+    def stop(self):
+        self.stop_requested = True
+        self._stop_event.set()
+        self._wake.set()
+
+    def seek(self, sim_time):
+        """Pede o salto para sim_time (executado na thread da simulação, no próximo passo)."""
+        self._seek_to = float(sim_time)
+        self._wake.set()
+
+    def is_alive(self):
+        return not self.finished.is_set()
+
+    def _start_sumo(self):
+        self.conn = sim_backend.start(self.sumo_cmd, self.label, self.backend)
+        self.traffic_ai.attach(self.conn)
+
+    def run(self):
+        try:
+            self._start_sumo()
+        except Exception as e:
+            self.error = e
+            self._close_recorder()
+            self.started.set()
+            self.finished.set()
+            return
+
+        try:
+            snapshot = SimulationSnapshot(self.conn, geo=self.geo)
+            snapshot.start()
+            self.traffic_ai.start()
+            self.started.set()
+            wall_start, sim_start = time.perf_counter(), snapshot.time
+            self.sim_time = snapshot.time
+
+            metrics, phase = self.metrics, self.metrics.phase
+            while snapshot.running() and not self._stop_event.is_set():
+                if self._seek_to is not None:
+                    target, self._seek_to = self._seek_to, None
+                    self._seek(snapshot, target)
+                    wall_start, sim_start = time.perf_counter(), snapshot.time
+                    if not snapshot.running(): break
+                t0 = metrics.now()
+                snapshot.advance()
+                phase["simulation_step"].since(t0)
+                t0 = metrics.now()
+                frame = snapshot.frame()
+                phase["vehicle_query"].since(t0)
+                t0 = metrics.now()
+                ai_logs = self.traffic_ai.step(frame.time)
+                phase["traffic_ai"].since(t0)
+                self.buffer.push(frame)
+                self.sim_time = frame.time
+                metrics.step_done()
+                if self.recorder:
+                    t0 = metrics.now()
+                    self.recorder.add(frame)
+                    phase["record"].since(t0)
+                if self.checkpoints and self.checkpoints.due(frame.time):
+                    t0 = metrics.now()
+                    self.checkpoints.save(self.conn, frame.time)
+                    phase["checkpoint"].since(t0)
+
+                if self.step_count % 10 == 0 and ai_logs and self.on_ai_logs:
+                    self.on_ai_logs(ai_logs, frame.time)
+                self.step_count += 1
+
+                # Ritmo: tempo simulado / fator = tempo de parede alvo
+                if self.speed:
+                    ahead = (frame.time - sim_start) / self.speed - (time.perf_counter() - wall_start)
+                    if ahead > 0 and self._wake.wait(ahead): self._wake.clear()
+            # Cliente saiu no meio: guarda onde parou para o resume
+            if self.stop_requested and self.checkpoints and self.sim_time is not None:
+                self.checkpoints.save(self.conn, self.sim_time)
+        except Exception as e:
+            self.error = e
+            print(f"Erro Loop: {e}")
+        finally:
+            self.started.set()
+            try: self.conn.close()
+            except: pass
+            self._close_recorder()
+            self.finished.set()
+
+    def _close_recorder(self):
+        if not self.recorder: return
+        try: self.recorder.close()
+        except Exception as e: print(f"AVISO: gravação não finalizada ({e})")
+        self.recorder = None
+
+    def _seek(self, snapshot, target):
+        """
+        Carrega o checkpoint mais recente <= target quando ele aproxima do alvo
+        (para trás, ou à frente pulando trecho) e avança sem frames nem ritmo
+        até target. loadState derruba as subscriptions: snapshot e IA reinscrevem.
+        """
+        saved_time, path = self.checkpoints.at(target) if self.checkpoints else (None, None)
+        backward = target < snapshot.time  # antes do loadState/advance, que mudam snapshot.time
+        if path is not None and (backward or saved_time > snapshot.time):
+            self.conn.simulation.loadState(str(path))
+            snapshot.start()
+            self.traffic_ai.reset()
+            # Até o próximo passo as subscriptions ainda misturam resultados de antes do load
+            snapshot.advance()
+        elif backward:
+            print(f"AVISO: sem checkpoint até t={target:.1f}, seek ignorado.")
+            return
+        # A gravação é uma linha do tempo só: voltar encerra o arquivo no ponto atual
+        if backward: self._close_recorder()
+        while snapshot.running() and snapshot.time + 1e-6 < target and not self._stop_event.is_set():
+            snapshot.advance()
+            self.traffic_ai.step(snapshot.time)
+        if snapshot.running(): self.buffer.push(snapshot.frame())
+        self.sim_time = snapshot.time
+        if self.checkpoints: self.checkpoints.next_save = None
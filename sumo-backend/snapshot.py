@@ -0,0 +1,111 @@
+import traci
+import traci.constants as tc
+import numpy as np
+
+# Variáveis lidas de cada veículo a cada passo (chegam junto com a resposta do simulationStep)
+VEHICLE_VARS = (tc.VAR_POSITION, tc.VAR_ANGLE, tc.VAR_SPEED, tc.VAR_DISTANCE)
+SIM_VARS = (tc.VAR_TIME, tc.VAR_MIN_EXPECTED_VEHICLES, tc.VAR_DEPARTED_VEHICLES_IDS)
+TLS_VARS = (tc.TL_RED_YELLOW_GREEN_STATE, tc.TL_CURRENT_PHASE)
+
+
+class Frame:
+    """Estado de um passo da simulação em formato colunar (arrays por atributo)."""
+    __slots__ = ("time", "ids", "xy", "lonlat", "angle", "speed", "distance", "tls")
+
+    def __init__(self, time, ids, xy, angle, speed, distance, tls, lonlat=None):
+        self.time = time
+        self.ids = ids
+        self.xy = xy
+        self.angle = angle
+        self.speed = speed
+        self.distance = distance
+        self.tls = tls
+        self.lonlat = lonlat
+
+    def __len__(self):
+        return len(self.ids)
+
+    def subset(self, index, tls=None):
+        """Frame só com os veículos de index (array de posições); tls substitui os semáforos."""
+        ids = self.ids
+        return Frame(self.time, [ids[i] for i in index.tolist()], self.xy[index], self.angle[index],
+                     self.speed[index], self.distance[index], self.tls if tls is None else tls,
+                     None if self.lonlat is None else self.lonlat[index])
+
+    def to_json(self):
+        """Payload legado do /ws (lista de dicts por veículo)."""
+        lonlat = self.lonlat.tolist()
+        angle, speed, distance = self.angle.tolist(), self.speed.tolist(), self.distance.tolist()
+        vehicles = [
+            {"id": vid, "lat": lonlat[i][1], "lon": lonlat[i][0],
+             "angle": angle[i], "speed": speed[i], "distance": distance[i]}
+            for i, vid in enumerate(self.ids)
+        ]
+        return {"time": self.time, "vehicles": vehicles, "traffic_lights": self.tls, "status": "running"}
+
+
+class SimulationSnapshot:
+    """
+    Lê o estado da simulação usando subscriptions em vez de getters por veículo.
+    Cada veículo é inscrito uma única vez quando parte (lista de partidas também é
+    uma subscription), e os semáforos são inscritos no início. Depois disso o
+    único round-trip por passo é o próprio simulationStep.
+    """
+
+    def __init__(self, conn=traci, geo=None):
+        self.conn = conn
+        # geo(xy: ndarray Nx2) -> ndarray Nx2 (lon, lat). Padrão: convertGeo por veículo.
+        self.geo = geo or self._convert_geo_rpc
+        self.time = 0.0
+        self.min_expected = 1
+
+    def start(self):
+        self.conn.simulation.subscribe(SIM_VARS)
+        for tls_id in self.conn.trafficlight.getIDList():
+            self.conn.trafficlight.subscribe(tls_id, TLS_VARS)
+        # Veículos que já estavam na rede antes da subscription
+        for veh_id in self.conn.vehicle.getIDList():
+            self.conn.vehicle.subscribe(veh_id, VEHICLE_VARS)
+        self._read_sim()
+
+    def running(self):
+        return self.min_expected > 0
+
+    def _read_sim(self):
+        sim = self.conn.simulation.getSubscriptionResults()
+        self.time = sim[tc.VAR_TIME]
+        self.min_expected = sim[tc.VAR_MIN_EXPECTED_VEHICLES]
+        return sim
+
+    def advance(self):
+        """Só o passo (e a inscrição de quem partiu); frame() monta o retrato depois."""
+        self.conn.simulationStep()
+        sim = self._read_sim()
+        for veh_id in sim[tc.VAR_DEPARTED_VEHICLES_IDS]:
+            self.conn.vehicle.subscribe(veh_id, VEHICLE_VARS)
+
+    def step(self):
+        self.advance()
+        return self.frame()
+
+    def frame(self):
+        results = self.conn.vehicle.getAllSubscriptionResults()
+        n = len(results)
+        ids = list(results)
+        xy = np.empty((n, 2))
+        angle, speed, distance = np.empty(n), np.empty(n), np.empty(n)
+        for i, values in enumerate(results.values()):
+            xy[i] = values[tc.VAR_POSITION]
+            angle[i] = values[tc.VAR_ANGLE]
+            speed[i] = values[tc.VAR_SPEED]
+            distance[i] = values[tc.VAR_DISTANCE]
+
+        tls = {tls_id: v[tc.TL_RED_YELLOW_GREEN_STATE]
+               for tls_id, v in self.conn.trafficlight.getAllSubscriptionResults().items()}
+        return Frame(self.time, ids, xy, angle, speed, distance, tls, lonlat=self.geo(xy))
+
+    def _convert_geo_rpc(self, xy):
+        out = np.empty_like(xy)
+        for i, (x, y) in enumerate(xy):
+            out[i] = self.conn.simulation.convertGeo(x, y)
+        return out
@@ -0,0 +1,104 @@
+"""
+Índice espacial em grade para recortar o stream pelo viewport do cliente.
+
+Os pontos (lon, lat) são ordenados pela célula da grade; cada célula vira um
+intervalo contíguo do array ordenado. Uma consulta percorre só as linhas de
+células que o bbox cobre e filtra os candidatos pelo bbox exato. O índice dos
+veículos é refeito a cada passo (um argsort), o dos semáforos uma vez por sessão.
+"""
+import math
+import numpy as np
+
+CELL_DEG = 0.005  # ~550 m
+# Abaixo deste zoom o cliente recebe células de densidade em vez de veículos
+DENSITY_ZOOM = 14
+DENSITY_CELL_PX = 32
+MAX_CELLS = 1_000_000
+
+
+def parse_bbox(value):
+    """[s, w, n, e] ou "s,w,n,e" -> tupla de floats; None se ausente ou inválido."""
+    if not value: return None
+    try:
+        parts = value.split(",") if isinstance(value, str) else list(value)
+        s, w, n, e = (float(v) for v in parts)
+    except (TypeError, ValueError): return None
+    if not (s < n and w < e): return None
+    return s, w, n, e
+
+
+class GridIndex:
+    def __init__(self, lonlat, cell_deg=CELL_DEG):
+        self.lonlat = np.asarray(lonlat, dtype=float).reshape(-1, 2)
+        self.cell = cell_deg
+        if not len(self.lonlat):
+            self.order = np.zeros(0, dtype=np.int64)
+            return
+        self.origin = self.lonlat.min(axis=0)
+        span = self.lonlat.max(axis=0) - self.origin
+        # Ponto muito fora da área (ex.: projeção errada) não pode explodir a grade
+        if (span[0] / cell_deg + 1) * (span[1] / cell_deg + 1) > MAX_CELLS:
+            self.cell = cell_deg = max(cell_deg, math.sqrt((span[0] + cell_deg) * (span[1] + cell_deg) / MAX_CELLS) * 1.01)
+        cij = np.floor((self.lonlat - self.origin) / cell_deg).astype(np.int64)
+        self.cols, self.rows = (cij.max(axis=0) + 1).tolist()
+        keys = cij[:, 1] * self.cols + cij[:, 0]
+        self.order = np.argsort(keys, kind="stable")
+        # starts[k]..starts[k+1] = posições (em order) dos pontos da célula k
+        self.starts = np.searchsorted(keys[self.order], np.arange(self.rows * self.cols + 1))
+
+    def query(self, bbox):
+        """Índices dos pontos dentro de bbox = (s, w, n, e)."""
+        if not len(self.order): return self.order
+        s, w, n, e = bbox
+        (x0, y0), (x1, y1) = np.floor((np.array([[w, s], [e, n]]) - self.origin) / self.cell).astype(np.int64)
+        x0, x1 = max(x0, 0), min(x1, self.cols - 1)
+        y0, y1 = max(y0, 0), min(y1, self.rows - 1)
+        if x0 > x1 or y0 > y1: return np.zeros(0, dtype=np.int64)
+        parts = [self.order[self.starts[row * self.cols + x0]:self.starts[row * self.cols + x1 + 1]]
+                 for row in range(y0, y1 + 1)]
+        cand = np.concatenate(parts)
+        pts = self.lonlat[cand]
+        inside = (pts[:, 0] >= w) & (pts[:, 0] <= e) & (pts[:, 1] >= s) & (pts[:, 1] <= n)
+        return np.sort(cand[inside])
+
+
+def load_tls_positions(net_file):
+    """(ids, lonlat Nx2) dos semáforos do net, na mesma posição dos dispositivos."""
+    from net_stream import iter_elements
+    proj, ids, xy = None, [], []
+    for kind, item in iter_elements(net_file):
+        if kind == "location": proj = item
+        elif kind == "tls":
+            ids.append(item[0])
+            xy.append(item[1])
+    return ids, (proj.to_lonlat(xy) if xy else np.zeros((0, 2)))
+
+
+def density_cell_deg(zoom):
+    return DENSITY_CELL_PX * 360.0 / (256 * 2 ** zoom)
+
+
+def density(lonlat, zoom):
+    """
+    Contagem de pontos por célula de DENSITY_CELL_PX pixels no zoom. A grade é
+    alinhada em múltiplos do tamanho da célula (não muda ao arrastar o mapa).
+    """
+    cell = density_cell_deg(zoom)
+    if not len(lonlat): return {"cell": cell, "cells": []}
+    ij = np.floor(np.asarray(lonlat)[:, ::-1] / cell).astype(np.int64)  # (linha lat, coluna lon)
+    cells, counts = np.unique(ij, axis=0, return_counts=True)
+    # Centro da célula em lat/lon + contagem
+    centers = (cells + 0.5) * cell
+    return {"cell": cell, "cells": [[round(lat, 6), round(lon, 6), int(c)]
+                                    for (lat, lon), c in zip(centers.tolist(), counts.tolist())]}
+
+
+def parse_zoom(value):
+    try: zoom = float(value)
+    except (TypeError, ValueError): return None
+    return min(max(zoom, 0.0), 24.0) if math.isfinite(zoom) else None
+
+
+def visible_zoom(zoom):
+    """True se o zoom mostra veículos individuais (ou se o cliente não informou zoom)."""
+    return zoom is None or zoom >= DENSITY_ZOOM
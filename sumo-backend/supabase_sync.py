@@ -0,0 +1,204 @@
+"""
+Sincronização incremental de tabelas do Supabase (rede_viaria, dispositivos).
+
+Em vez de apagar a tabela e reinserir tudo, compara o que vai ser enviado com
+o que já está lá:
+  - cada linha tem um hash do conteúdo; o manifesto local (id -> hash) guarda
+    o último estado confirmado pelo servidor;
+  - os ids remotos são listados (só a coluna chave) no início: o que existe lá
+    e não veio na geração nova é apagado; o que não existe é inserido;
+  - linha com hash igual ao do manifesto e presente no servidor não é enviada.
+
+O manifesto é salvo periodicamente com o que já foi confirmado, então uma
+sincronização interrompida recomeça de onde parou. Os lotes se ajustam ao tempo
+de resposta e vários pedidos ficam em voo ao mesmo tempo, no mesmo client.
+"""
+import os
+import json
+import time
+import fcntl
+import random
+import hashlib
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+SYNC_DIR = Path(os.getenv("SUPABASE_SYNC_DIR", "/app/scenarios/sync"))
+WORKERS = int(os.getenv("SUPABASE_SYNC_WORKERS", "4"))
+PAGE_SIZE = 1000  # limite padrão de linhas por select do PostgREST
+DELETE_BATCH = 200  # ids vão na URL (in.(...))
+CHECKPOINT_S = 2.0
+
+
+def row_hash(row):
+    raw = json.dumps(row, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+class AdaptiveBatch:
+    """Tamanho do lote guiado pela duração dos pedidos: dobra se rápido, divide se lento ou com erro."""
+
+    def __init__(self, size=100, min_size=10, max_size=1000, target_s=1.0):
+        self.size = size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_s = target_s
+        self._lock = threading.Lock()
+
+    def record(self, count, elapsed):
+        with self._lock:
+            if count < self.size: return  # lote parcial (fim do stream) não diz nada
+            if elapsed < self.target_s / 2: self.size = min(self.size * 2, self.max_size)
+            elif elapsed > self.target_s: self.size = max(self.size // 2, self.min_size)
+
+    def shrink(self):
+        with self._lock:
+            self.size = max(self.size // 2, self.min_size)
+
+
+class TableSync:
+    """
+    Uso: begin() -> feed(linhas) quantas vezes precisar -> finish() -> estatísticas.
+    key é a coluna única usada no upsert (on_conflict) e no delete.
+    """
+
+    def __init__(self, client, table, key="id", state_dir=SYNC_DIR, workers=WORKERS,
+                 max_retries=4, full=False):
+        self.client = client
+        self.table = table
+        self.key = key
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.full = full  # ignora o manifesto (reenvia tudo que veio)
+        self.batch = AdaptiveBatch()
+        project = hashlib.sha1(str(getattr(client, "supabase_url", "")).encode()).hexdigest()[:8]
+        self.state_dir = Path(state_dir)
+        self.manifest_file = self.state_dir / f"{table}-{project}.json"
+        self.manifest = {}
+        self.remote = set()
+        self.seen = set()
+        self.stats = {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0, "requests": 0}
+        self.errors = []
+        self._buffer = []
+        self._lock = threading.RLock()
+        self._slots = threading.BoundedSemaphore(self.workers * 2)
+        self._pool = None
+        self._lock_file = None
+        self._saved_at = 0.0
+        self._started = 0.0
+
+    # --- ciclo ---
+    def begin(self):
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        # Um sync por tabela por vez (jobs de geração rodam em processos separados)
+        self._lock_file = open(self.manifest_file.with_suffix(".lock"), "w")
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        self._started = time.perf_counter()
+        if not self.full:
+            try: self.manifest = json.loads(self.manifest_file.read_text())
+            except (OSError, ValueError): self.manifest = {}
+        self.remote = self._remote_ids()
+        # Manifesto só vale para o que ainda existe no servidor
+        self.manifest = {k: h for k, h in self.manifest.items() if k in self.remote}
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"sync-{self.table}")
+        return self
+
+    def feed(self, rows):
+        for row in rows:
+            key = str(row[self.key])
+            digest = row_hash(row)
+            self.seen.add(key)
+            if self.manifest.get(key) == digest:
+                self.stats["unchanged"] += 1
+                continue
+            self.stats["updated" if key in self.remote else "inserted"] += 1
+            self._buffer.append((key, digest, row))
+            if len(self._buffer) >= self.batch.size:
+                self._submit("upsert", self._buffer)
+                self._buffer = []
+
+    def finish(self, delete_stale=True):
+        """Espera os lotes em voo. Sem delete_stale (leitura incompleta) não apaga nada."""
+        try:
+            if self._buffer: self._submit("upsert", self._buffer)
+            self._buffer = []
+            stale = sorted(self.remote - self.seen) if delete_stale else []
+            for i in range(0, len(stale), DELETE_BATCH):
+                self._submit("delete", [(key, None, None) for key in stale[i:i + DELETE_BATCH]])
+            self.stats["deleted"] = len(stale)
+            self._pool.shutdown(wait=True)
+        finally:
+            self._save()
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+        self.stats["elapsed_s"] = round(time.perf_counter() - self._started, 3)
+        self.stats["batch_size"] = self.batch.size
+        if self.errors:
+            raise RuntimeError(f"{self.table}: {len(self.errors)} lote(s) falharam: {self.errors[0]}")
+        return self.stats
+
+    # --- remoto ---
+    def _remote_ids(self):
+        ids, start = set(), 0
+        while True:
+            res = (self.client.table(self.table).select(self.key).order(self.key)
+                   .range(start, start + PAGE_SIZE - 1).execute())
+            ids.update(str(r[self.key]) for r in res.data)
+            if len(res.data) < PAGE_SIZE: return ids
+            start += PAGE_SIZE
+
+    def _request(self, op, items):
+        if op == "upsert":
+            rows = [row for _, _, row in items]
+            self.client.table(self.table).upsert(rows, on_conflict=self.key).execute()
+        else:
+            self.client.table(self.table).delete().in_(self.key, [key for key, _, _ in items]).execute()
+
+    def _submit(self, op, items):
+        self._slots.acquire()  # contrapressão: no máximo 2 lotes por worker esperando
+        future = self._pool.submit(self._send, op, items)
+        future.add_done_callback(lambda f: self._slots.release())
+
+    def _send(self, op, items):
+        """Envia o lote; em erro divide ao meio (payload grande/timeout) e tenta de novo com backoff."""
+        if self.errors:
+            # Um lote já falhou de vez (servidor fora?): não insiste; o checkpoint retoma depois
+            with self._lock: self.errors.append("abortado")
+            return
+        delay = 0.5
+        for attempt in range(self.max_retries + 1):
+            t0 = time.perf_counter()
+            try:
+                self._request(op, items)
+            except Exception as e:
+                with self._lock: self.stats["requests"] += 1
+                self.batch.shrink()
+                if len(items) > self.batch.min_size:
+                    half = len(items) // 2
+                    self._send(op, items[:half])
+                    self._send(op, items[half:])
+                    return
+                if attempt == self.max_retries:
+                    with self._lock: self.errors.append(str(e))
+                    return
+                time.sleep(delay + random.uniform(0, delay / 2))
+                delay = min(delay * 2, 10.0)
+                continue
+            self.batch.record(len(items), time.perf_counter() - t0)
+            self._confirm(op, items)
+            return
+
+    def _confirm(self, op, items):
+        with self._lock:
+            self.stats["requests"] += 1
+            for key, digest, _ in items:
+                if op == "upsert": self.manifest[key] = digest
+                else: self.manifest.pop(key, None)
+            if time.monotonic() - self._saved_at > CHECKPOINT_S: self._save()
+
+    def _save(self):
+        with self._lock:
+            tmp = self.manifest_file.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.manifest))
+            os.replace(tmp, self.manifest_file)
+            self._saved_at = time.monotonic()
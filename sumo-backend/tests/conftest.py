@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Os módulos do backend são importados pelo nome (rodando de dentro de sumo-backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
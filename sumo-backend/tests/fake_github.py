@@ -0,0 +1,162 @@
+"""
+Servidor local que imita a Git Data API do GitHub (o suficiente para o github_sync).
+
+Guarda blobs, árvores e commits em memória; o SHA do blob é o mesmo do git, as
+árvores e commits têm SHAs próprios (só precisam ser únicos). Atualizar a ref
+sem fast-forward devolve 422 como o GitHub. Cada pedido fica em `calls`.
+"""
+import re
+import json
+import base64
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+OWNER, NAME, BRANCH = "RoHenPe", "sumo-docker", "main"
+
+
+class FakeGitHub:
+    def __init__(self):
+        self.objects = {}  # sha -> (tipo, conteúdo)
+        self.refs = {}
+        self.calls = []
+        self.before_update = None  # callback(fake) chamado antes de um PATCH da ref
+        self.lock = threading.RLock()
+        root = self._commit(self._tree({}), [], "init")
+        self.refs[BRANCH] = root
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(self))
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.repo_url = f"{self.url}/repos/{OWNER}/{NAME}"
+        self._thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # --- objetos ---
+    def _put(self, kind, payload, raw):
+        sha = hashlib.sha1(b"%s %d\0" % (kind.encode(), len(raw)) + raw).hexdigest()
+        self.objects[sha] = (kind, payload)
+        return sha
+
+    def _tree(self, entries):
+        return self._put("tree", entries, json.dumps(sorted(entries.items())).encode())
+
+    def _commit(self, tree, parents, message):
+        raw = json.dumps({"tree": tree, "parents": parents, "message": message, "n": len(self.objects)})
+        return self._put("commit", {"tree": tree, "parents": parents, "message": message}, raw.encode())
+
+    def _apply(self, base, path, sha):
+        entries = dict(self.objects[base][1]) if base else {}
+        head, _, rest = path.partition("/")
+        if rest:
+            child = self._apply(entries[head][2] if head in entries else None, rest, sha)
+            if self.objects[child][1]: entries[head] = ("040000", "tree", child)
+            else: entries.pop(head, None)
+        elif sha is None: entries.pop(head, None)
+        else: entries[head] = ("100644", "blob", sha)
+        return self._tree(entries)
+
+    # --- consultas dos testes ---
+    def head(self):
+        return self.refs[BRANCH]
+
+    def files(self, commit=None):
+        """{caminho: bytes} da árvore do commit (padrão: ponta da branch)."""
+        out = {}
+        def walk(tree, prefix):
+            for name, (_, kind, sha) in self.objects[tree][1].items():
+                if kind == "tree": walk(sha, f"{prefix}{name}/")
+                else: out[prefix + name] = self.objects[sha][1]
+        walk(self.objects[commit or self.head()][1]["tree"], "")
+        return out
+
+    def commit_file(self, path, data, message="concorrente"):
+        """Commit direto na branch (simula outro job publicando)."""
+        with self.lock:
+            head = self.head()
+            tree = self._apply(self.objects[head][1]["tree"], path, self._put("blob", data, data))
+            self.refs[BRANCH] = self._commit(tree, [head], message)
+
+    def writes(self):
+        return [(m, p) for m, p in self.calls if m != "GET"]
+
+    # --- respostas ---
+    def ref_json(self, name):
+        return {"ref": f"refs/heads/{name}", "url": f"{self.repo_url}/git/refs/heads/{name}",
+                "object": {"sha": self.refs[name], "type": "commit", "url": ""}}
+
+    def tree_json(self, sha):
+        return {"sha": sha, "url": f"{self.repo_url}/git/trees/{sha}", "truncated": False, "tree": [
+            {"path": n, "mode": m, "type": t, "sha": s} for n, (m, t, s) in self.objects[sha][1].items()]}
+
+    def commit_json(self, sha):
+        c = self.objects[sha][1]
+        return {"sha": sha, "url": f"{self.repo_url}/git/commits/{sha}", "message": c["message"],
+                "tree": {"sha": c["tree"], "url": f"{self.repo_url}/git/trees/{c['tree']}"},
+                "parents": [{"sha": p, "url": f"{self.repo_url}/git/commits/{p}"} for p in c["parents"]]}
+
+    def handle(self, method, path, body):
+        path = path.split("?")[0]
+        prefix = f"/repos/{OWNER}/{NAME}"
+        if not path.startswith(prefix): return 404, {"message": "Not Found"}
+        path = path[len(prefix):]
+        with self.lock:
+            self.calls.append((method, path))
+            if path == "":
+                return 200, {"id": 1, "name": NAME, "full_name": f"{OWNER}/{NAME}", "default_branch": BRANCH,
+                             "url": self.repo_url, "owner": {"login": OWNER}}
+            m = re.fullmatch(r"/git/refs?/heads/(.+)", path)
+            if m and method == "GET": return 200, self.ref_json(m[1])
+            if m and method == "PATCH":
+                if self.before_update:
+                    callback, self.before_update = self.before_update, None
+                    callback(self)
+                if self.refs[m[1]] not in self.objects[body["sha"]][1]["parents"] and not body.get("force"):
+                    return 422, {"message": "Update is not a fast forward"}
+                self.refs[m[1]] = body["sha"]
+                return 200, self.ref_json(m[1])
+            m = re.fullmatch(r"/git/commits/(\w+)", path)
+            if m: return 200, self.commit_json(m[1])
+            m = re.fullmatch(r"/git/trees/(\w+)", path)
+            if m: return 200, self.tree_json(m[1])
+            if path == "/git/blobs":
+                data = base64.b64decode(body["content"])
+                sha = self._put("blob", data, data)
+                return 201, {"sha": sha, "url": f"{self.repo_url}/git/blobs/{sha}"}
+            if path == "/git/trees":
+                sha = body.get("base_tree")
+                for entry in body["tree"]: sha = self._apply(sha, entry["path"], entry["sha"])
+                return 201, self.tree_json(sha)
+            if path == "/git/commits":
+                return 201, self.commit_json(self._commit(body["tree"], body["parents"], body["message"]))
+        return 404, {"message": "Not Found"}
+
+
+def _handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive: o PyGithub reusa a conexão
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args): pass
+
+        def _respond(self, method):
+            size = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(size)) if size else {}
+            status, payload = fake.handle(method, self.path, body)
+            raw = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_GET(self): self._respond("GET")
+        def do_POST(self): self._respond("POST")
+        def do_PATCH(self): self._respond("PATCH")
+
+    return Handler
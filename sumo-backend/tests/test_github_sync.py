@@ -0,0 +1,132 @@
+import gzip
+
+import pytest
+
+github = pytest.importorskip("github")
+
+import github_sync
+from fake_github import FakeGitHub
+
+CITY = "osasco"
+
+
+def quiet(*args): pass
+
+
+@pytest.fixture
+def fake():
+    with FakeGitHub() as server: yield server
+
+
+@pytest.fixture
+def repo(fake):
+    # Sem os intervalos que o PyGithub impõe entre pedidos (0,25 s) e escritas (1 s)
+    g = github.Github(auth=github.Auth.Token("token"), base_url=fake.url,
+                      seconds_between_requests=0, seconds_between_writes=0)
+    return g.get_repo("RoHenPe/sumo-docker")
+
+
+def test_connect(fake):
+    assert github_sync.connect("token", api_url=fake.url).full_name == "RoHenPe/sumo-docker"
+
+
+@pytest.fixture
+def scenario(tmp_path):
+    files = {"osm.net.xml": b"<net/>\n" * 100, "osm.rou.xml": b"<routes/>\n", "osm.sumocfg": b"<configuration/>\n"}
+    for name, data in files.items(): (tmp_path / name).write_bytes(data)
+    return [(str(tmp_path / name), name) for name in files], files
+
+
+def upload(repo, files):
+    return github_sync.upload_scenario(repo, CITY, files, log=quiet)
+
+
+def test_blob_sha_matches_git():
+    # git hash-object de "hello\n"
+    assert github_sync.blob_sha(b"hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+
+def test_one_commit_per_scenario(fake, repo, scenario):
+    files, contents = scenario
+    before = fake.head()
+    summary = upload(repo, files)
+
+    writes = fake.writes()
+    assert writes.count(("POST", "/git/blobs")) == 3
+    assert writes.count(("POST", "/git/trees")) == 1
+    assert writes.count(("POST", "/git/commits")) == 1
+    assert sum(method == "PATCH" for method, _ in writes) == 1
+    assert summary["commit"] == fake.head()
+    assert fake.objects[fake.head()][1]["parents"] == [before]
+    assert fake.files() == {f"scenarios/{CITY}/{name}": data for name, data in contents.items()}
+
+
+def test_unchanged_files_are_skipped(fake, repo, scenario):
+    files, _ = scenario
+    upload(repo, files)
+    head = fake.head()
+    fake.calls.clear()
+
+    summary = upload(repo, files)
+    assert fake.writes() == []
+    assert fake.head() == head
+    assert summary["commit"] is None and summary["skipped"] == 3 and summary["uploaded"] == 0
+
+    # Só o arquivo alterado sobe de novo
+    with open(files[1][0], "ab") as f: f.write(b"<!-- novo -->\n")
+    summary = upload(repo, files)
+    assert fake.writes().count(("POST", "/git/blobs")) == 1
+    assert summary["uploaded"] == 1 and summary["skipped"] == 2
+
+
+def test_large_net_switches_to_gzip(fake, repo, scenario, monkeypatch):
+    files, contents = scenario
+    upload(repo, files)
+    assert f"scenarios/{CITY}/osm.net.xml" in fake.files()
+
+    monkeypatch.setattr(github_sync, "GZIP_MIN_BYTES", 256)
+    fake.calls.clear()
+    summary = upload(repo, files)
+
+    tree = fake.files()
+    assert f"scenarios/{CITY}/osm.net.xml" not in tree
+    assert gzip.decompress(tree[f"scenarios/{CITY}/osm.net.xml.gz"]) == contents["osm.net.xml"]
+    assert summary["uploaded"] == 1 and summary["deleted"] == 1
+    assert fake.writes().count(("POST", "/git/commits")) == 1
+
+    # Voltando abaixo do limite, o .gz é que sai
+    monkeypatch.setattr(github_sync, "GZIP_MIN_BYTES", 1 << 30)
+    upload(repo, files)
+    tree = fake.files()
+    assert f"scenarios/{CITY}/osm.net.xml.gz" not in tree
+    assert tree[f"scenarios/{CITY}/osm.net.xml"] == contents["osm.net.xml"]
+
+
+def test_ref_conflict_is_retried(fake, repo, scenario):
+    files, contents = scenario
+    fake.before_update = lambda server: server.commit_file("scenarios/barueri/osm.sumocfg", b"<outro/>\n")
+    summary = upload(repo, files)
+
+    writes = fake.writes()
+    assert sum(method == "PATCH" for method, _ in writes) == 2
+    assert writes.count(("POST", "/git/commits")) == 2
+    assert writes.count(("POST", "/git/blobs")) == 3  # os blobs da primeira tentativa são reaproveitados
+    assert summary["commit"] == fake.head()
+    tree = fake.files()
+    assert tree["scenarios/barueri/osm.sumocfg"] == b"<outro/>\n"
+    assert all(tree[f"scenarios/{CITY}/{name}"] == data for name, data in contents.items())
+
+
+def test_ref_conflict_gives_up_after_retries(fake, repo, scenario):
+    files, _ = scenario
+    count = [0]
+
+    def race(server):
+        count[0] += 1
+        server.commit_file(f"scenarios/barueri/{count[0]}.txt", b"x")
+        server.before_update = race
+    fake.before_update = race
+
+    with pytest.raises(github_sync.GithubException) as e: upload(repo, files)
+    assert e.value.status == 422
+    assert count[0] == github_sync.COMMIT_RETRIES
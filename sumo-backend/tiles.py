@@ -0,0 +1,163 @@
+"""
+Tiles da malha viária (z/x/y, Web Mercator) gerados junto com o cenário.
+
+Para cada zoom de MIN_ZOOM a MAX_ZOOM:
+  - Douglas–Peucker na forma XY do net (metros) com tolerância de ~1 pixel do zoom;
+  - abaixo de DETAIL_ZOOM só vias principais (rodovia/primaria);
+  - coordenadas quantizadas (10^-precisão graus) e codificadas em delta;
+  - cada via vai para todos os tiles que a caixa dela toca (o cliente deduplica pelo id).
+
+Saída: <cenário>/tiles/{z}/{x}/{y}.json.gz e tiles/index.json. Formato de um tile:
+    {"z", "x", "y", "precision": p,
+     "roads": [{"id", "name", "type", "coords": [lat0, lon0, dlat1, dlon1, ...]}]}
+com lat_i = (lat0 + dlat1 + ... + dlat_i) / 10^p (ver decode_coords).
+"""
+import os
+import math
+import gzip
+import json
+from pathlib import Path
+
+import numpy as np
+
+from net_stream import iter_elements, road_type
+
+MIN_ZOOM = 11
+MAX_ZOOM = 16
+DETAIL_ZOOM = 13
+# Casas decimais por zoom (1e-4 grau ~ 11 m; 1e-5 ~ 1,1 m)
+PRECISION = {11: 4, 12: 4, 13: 5, 14: 5, 15: 5, 16: 5}
+MAIN_TYPES = ("rodovia", "primaria")
+EARTH_M_PER_PX = 156543.03392  # metros por pixel no zoom 0 (tile de 256 px) no equador
+BATCH_SIZE = 500
+
+
+def lonlat_to_tile(lon, lat, z):
+    n = 2 ** z
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tolerance_m(z, lat):
+    return EARTH_M_PER_PX * math.cos(math.radians(lat)) / 2 ** z
+
+
+def simplify(xy, tolerance):
+    """Douglas–Peucker: índices dos pontos mantidos (sempre inclui as pontas)."""
+    n = len(xy)
+    if n <= 2: return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2: continue
+        p, q = xy[a], xy[b]
+        seg = q - p
+        pts = xy[a + 1:b] - p
+        length = math.hypot(seg[0], seg[1])
+        if length == 0: dist = np.hypot(pts[:, 0], pts[:, 1])
+        else: dist = np.abs(seg[0] * pts[:, 1] - seg[1] * pts[:, 0]) / length
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            mid = a + 1 + i
+            keep[mid] = True
+            stack.append((a, mid))
+            stack.append((mid, b))
+    return np.flatnonzero(keep)
+
+
+def encode_coords(latlon, precision):
+    """[(lat, lon)] -> [lat0, lon0, dlat1, dlon1, ...] em inteiros; pontos repetidos após quantizar somem."""
+    q = np.round(np.asarray(latlon) * 10 ** precision).astype(np.int64)
+    if len(q) > 1:
+        q = q[np.concatenate(([True], np.any(np.diff(q, axis=0) != 0, axis=1)))]
+    return np.concatenate((q[:1], np.diff(q, axis=0))).ravel().tolist()
+
+
+def decode_coords(coords, precision):
+    q = np.cumsum(np.asarray(coords, dtype=np.int64).reshape(-1, 2), axis=0)
+    return (q / 10 ** precision).tolist()
+
+
+class TileBuilder:
+    """Acumula as vias simplificadas por tile; write() grava tudo comprimido."""
+
+    def __init__(self, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+        self.zooms = range(min_zoom, max_zoom + 1)
+        self.tiles = {}  # (z, x, y) -> [vias]
+        self.ref_lat = None
+        self.bounds = [math.inf, math.inf, -math.inf, -math.inf]  # s, w, n, e
+        self.points_in = 0
+        self.points_out = {z: 0 for z in self.zooms}
+
+    def add_batch(self, proj, edges):
+        shapes = [np.asarray(shape, dtype=float).reshape(-1, 2) for _, _, _, shape in edges]
+        lonlat = proj.to_lonlat(np.concatenate(shapes)) if shapes else np.empty((0, 2))
+        if self.ref_lat is None and len(lonlat): self.ref_lat = float(lonlat[0, 1])
+        start = 0
+        for (edge_id, name, speed, _), xy in zip(edges, shapes):
+            latlon = lonlat[start:start + len(xy), ::-1]
+            start += len(xy)
+            if not len(xy): continue
+            self._add_edge(edge_id, name or edge_id, road_type(speed), xy, latlon)
+
+    def _add_edge(self, edge_id, name, rtype, xy, latlon):
+        self.points_in += len(xy)
+        s, w = latlon.min(axis=0).tolist()
+        n, e = latlon.max(axis=0).tolist()
+        self.bounds = [min(self.bounds[0], s), min(self.bounds[1], w), max(self.bounds[2], n), max(self.bounds[3], e)]
+        for z in self.zooms:
+            if z < DETAIL_ZOOM and rtype not in MAIN_TYPES: continue
+            kept = simplify(xy, tolerance_m(z, self.ref_lat))
+            coords = encode_coords(latlon[kept], PRECISION[z])
+            self.points_out[z] += len(coords) // 2
+            road = {"id": edge_id, "name": name, "type": rtype, "coords": coords}
+            x0, y0 = lonlat_to_tile(w, n, z)
+            x1, y1 = lonlat_to_tile(e, s, z)
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    self.tiles.setdefault((z, x, y), []).append(road)
+
+    def write(self, out_dir):
+        out_dir = Path(out_dir)
+        size = 0
+        for (z, x, y), roads in self.tiles.items():
+            path = out_dir / str(z) / str(x) / f"{y}.json.gz"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            data = json.dumps({"z": z, "x": x, "y": y, "precision": PRECISION[z], "roads": roads},
+                              separators=(",", ":")).encode()
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_bytes(gzip.compress(data, compresslevel=6))
+            os.replace(tmp, path)
+            size += path.stat().st_size
+        index = {"min_zoom": self.zooms[0], "max_zoom": self.zooms[-1], "bounds": self.bounds,
+                 "tiles": len(self.tiles), "bytes": size, "points_in": self.points_in,
+                 "points_out": self.points_out}
+        (out_dir / "index.json").write_text(json.dumps(index))
+        return index
+
+
+def build_tiles(net_file, out_dir, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM, elements=None):
+    """Lê o net em streaming (ou o ramo de um ElementTee em elements) e grava o tile store em out_dir."""
+    builder = TileBuilder(min_zoom, max_zoom)
+    proj, edges = None, []
+    for kind, item in iter_elements(net_file) if elements is None else elements:
+        if kind == "location": proj = item
+        elif kind == "edge":
+            edges.append(item)
+            if len(edges) >= BATCH_SIZE:
+                builder.add_batch(proj, edges)
+                edges = []
+    if edges: builder.add_batch(proj, edges)
+    return builder.write(out_dir)
+
+
+def tile_path(tiles_dir, z, x, y):
+    """Arquivo do tile pedido; zoom acima do máximo usa o tile pai do zoom máximo. None se fora da faixa."""
+    if z < MIN_ZOOM: return None
+    if z > MAX_ZOOM:
+        x, y, z = x >> (z - MAX_ZOOM), y >> (z - MAX_ZOOM), MAX_ZOOM
+    return Path(tiles_dir) / str(z) / str(x) / f"{y}.json.gz"
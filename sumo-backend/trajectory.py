@@ -0,0 +1,366 @@
+"""
+Gravação dos frames de uma sessão e replay sem SUMO.
+
+Formato (.traj): blocos por tempo (RECORD_CHUNK_S segundos simulados), cada
+coluna um array NumPy comprimido com zlib; no fim um índice JSON e o offset
+dele (u64). Colunas por bloco:
+
+    time      f8[passos]         tempo de cada passo
+    offsets   i8[passos + 1]     linhas de cada passo (veículos em ordem)
+    vid       i4[linhas]         índice em "ids" (tabela de nomes do bloco)
+    lonlat    i4[linhas, 2]      micrograus (mesma escala do protocolo delta)
+    xy        f4[linhas, 2]      coordenadas da rede
+    angle, speed, distance  f4[linhas]
+    tls       bytes              estados dos semáforos por passo, na ordem de tls_ids
+
+O leitor abre o arquivo com mmap e descomprime só o bloco pedido; blocos
+decodificados ficam num LRU compartilhado, então N replays do mesmo arquivo
+custam um mmap e os blocos quentes uma vez só. Os leitores também ficam num LRU
+(REPLAY_CACHE_READERS): o mmap de um leitor sem replay é fechado ao sair dele,
+e o de um arquivo apagado no prune sai do cache na hora.
+"""
+import os
+import json
+import mmap
+import time
+import zlib
+import asyncio
+import struct
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from snapshot import Frame
+from simulation_worker import FrameBuffer, parse_speed
+
+MAGIC = b"FXTRJ\x00\x01\x00"
+FOOTER = struct.Struct("<Q")
+CHUNK_S = float(os.getenv("RECORD_CHUNK_S", "30"))
+RECORD_RUNS = os.getenv("RECORD_RUNS", "1").lower() not in ("0", "false", "no")
+KEEP_RUNS = int(os.getenv("RECORD_KEEP_RUNS", "10"))  # por cenário
+CACHE_CHUNKS = int(os.getenv("REPLAY_CACHE_CHUNKS", "16"))
+CACHE_READERS = int(os.getenv("REPLAY_CACHE_READERS", "8"))
+LONLAT_SCALE = 1e6
+ZLIB_LEVEL = 6
+
+
+def runs_dir(scenario_dir):
+    return Path(scenario_dir) / "runs"
+
+
+def list_runs(scenario_dir):
+    """Gravações concluídas do cenário, da mais recente para a mais antiga."""
+    folder = runs_dir(scenario_dir)
+    if not folder.is_dir(): return []
+    runs = sorted(folder.glob("*.traj"), key=lambda p: p.stat().st_mtime, reverse=True)
+    out = []
+    for path in runs:
+        # Só o índice do fim do arquivo: listar não abre mmap nem entra no cache de leitores
+        try: index = read_index(path)
+        except (OSError, ValueError): continue
+        chunks = index["chunks"]
+        out.append({"run_id": path.stem, "start": chunks[0]["t0"] if chunks else 0.0,
+                    "end": chunks[-1]["t1"] if chunks else 0.0, "steps": sum(c["steps"] for c in chunks),
+                    "bytes": path.stat().st_size, "created": index["meta"].get("created")})
+    return out
+
+
+def _parse_index(path, size, read):
+    """Índice JSON do fim do arquivo; read(offset, n) lê do arquivo ou do mmap."""
+    if size < len(MAGIC) + FOOTER.size or read(0, len(MAGIC)) != MAGIC:
+        raise ValueError(f"Arquivo de trajetória inválido: {path}")
+    (offset,) = FOOTER.unpack(read(size - FOOTER.size, FOOTER.size))
+    if not len(MAGIC) <= offset < size - FOOTER.size: raise ValueError(f"Arquivo de trajetória inválido: {path}")
+    return json.loads(read(offset, size - FOOTER.size - offset))
+
+
+def read_index(path):
+    with open(path, "rb") as f:
+        def read(offset, n):
+            f.seek(offset)
+            return f.read(n)
+        return _parse_index(path, os.fstat(f.fileno()).st_size, read)
+
+
+class TrajectoryRecorder:
+    """
+    Acumula frames e grava um bloco a cada chunk_s segundos simulados. O arquivo
+    só aparece com o nome final no close() (gravação pela metade não vira replay).
+    """
+
+    def __init__(self, path, chunk_s=CHUNK_S, meta=None, keep=KEEP_RUNS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp = self.path.with_suffix(".part")
+        self.chunk_s = chunk_s
+        self.keep = keep
+        self.meta = dict(meta or {}, created=time.time())
+        self.tls_ids = None
+        self.chunks = []
+        self.steps = 0
+        self.last_time = None
+        self.closed = False
+        self._file = open(self.tmp, "wb")
+        self._file.write(MAGIC)
+        self._reset()
+
+    def _reset(self):
+        self._times, self._frames = [], []
+
+    def add(self, frame):
+        if self.closed: return
+        # Linha do tempo precisa ser crescente (seek para trás encerra a gravação antes)
+        if self.last_time is not None and frame.time <= self.last_time: return
+        if self.tls_ids is None: self.tls_ids = list(frame.tls)
+        self._times.append(frame.time)
+        self._frames.append(frame)
+        self.last_time = frame.time
+        self.steps += 1
+        if frame.time - self._times[0] >= self.chunk_s: self._flush()
+
+    def _flush(self):
+        if not self._frames: return
+        frames = self._frames
+        counts = np.fromiter((len(f) for f in frames), dtype=np.int64, count=len(frames))
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        names, vid = {}, []
+        for f in frames:
+            vid.extend(names.setdefault(v, len(names)) for v in f.ids)
+        cat = lambda attr: np.concatenate([getattr(f, attr) for f in frames])
+        lonlat = np.rint(cat("lonlat") * LONLAT_SCALE).astype("<i4")
+        tls = "\n".join("\t".join(f.tls.get(t, "") for t in self.tls_ids) for f in frames).encode()
+        columns = {
+            "time": np.asarray(self._times, dtype="<f8"), "offsets": offsets.astype("<i8"),
+            "vid": np.asarray(vid, dtype="<i4"), "lonlat": lonlat, "xy": cat("xy").astype("<f4"),
+            "angle": cat("angle").astype("<f4"), "speed": cat("speed").astype("<f4"),
+            "distance": cat("distance").astype("<f4"),
+        }
+        index = {"t0": self._times[0], "t1": self._times[-1], "steps": len(frames), "rows": int(offsets[-1]),
+                 "ids": list(names), "columns": {}}
+        for name, array in columns.items():
+            index["columns"][name] = self._write(array.tobytes(), str(array.dtype), array.shape)
+        index["columns"]["tls"] = self._write(tls, "bytes", [len(tls)])
+        self.chunks.append(index)
+        self._reset()
+
+    def _write(self, raw, dtype, shape):
+        data = zlib.compress(raw, ZLIB_LEVEL)
+        offset = self._file.tell()
+        self._file.write(data)
+        return [offset, len(data), dtype, list(shape)]
+
+    def close(self):
+        """Grava o último bloco e o índice; sem nenhum passo, descarta o arquivo."""
+        if self.closed: return
+        self.closed = True
+        try:
+            self._flush()
+            footer = json.dumps({"meta": self.meta, "tls_ids": self.tls_ids or [], "chunks": self.chunks}).encode()
+            offset = self._file.tell()
+            self._file.write(footer)
+            self._file.write(FOOTER.pack(offset))
+        finally:
+            self._file.close()
+        if not self.steps:
+            self.tmp.unlink(missing_ok=True)
+            return
+        os.replace(self.tmp, self.path)
+        self._prune()
+
+    def _prune(self):
+        runs = sorted(self.path.parent.glob("*.traj"), key=lambda p: p.stat().st_mtime)
+        for path in runs[:-self.keep] if self.keep else []:
+            forget_trajectories(path)
+            try: path.unlink()
+            except OSError: pass
+
+
+class TrajectoryReader:
+    """Leitura por mmap; frame_at(t) devolve o último frame com tempo <= t."""
+
+    def __init__(self, path, cache_chunks=CACHE_CHUNKS):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        try: index = _parse_index(path, len(mm), lambda offset, n: mm[offset:offset + n])
+        except ValueError:
+            mm.close()
+            raise
+        self.meta = index["meta"]
+        self.tls_ids = index["tls_ids"]
+        self.chunks = index["chunks"]
+        self.chunk_start = np.asarray([c["t0"] for c in self.chunks])
+        self.start = self.chunks[0]["t0"] if self.chunks else 0.0
+        self.end = self.chunks[-1]["t1"] if self.chunks else 0.0
+        self.steps = sum(c["steps"] for c in self.chunks)
+        self.mtime = self.path.stat().st_mtime
+        self.cache_chunks = max(1, cache_chunks)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.refs = 0  # replays usando (open_trajectory/release_trajectory)
+
+    def _column(self, spec):
+        offset, length, dtype, shape = spec
+        raw = zlib.decompress(self._mm[offset:offset + length])
+        if dtype == "bytes": return raw
+        return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+    def chunk(self, i):
+        with self._lock:
+            cached = self._cache.get(i)
+            if cached is not None:
+                self._cache.move_to_end(i)
+                return cached
+        info = self.chunks[i]
+        data = {name: self._column(spec) for name, spec in info["columns"].items()}
+        data["lonlat"] = data["lonlat"] / LONLAT_SCALE
+        data["ids"] = info["ids"]
+        data["tls"] = [line.split("\t") for line in data["tls"].decode().split("\n")]
+        with self._lock:
+            self._cache[i] = data
+            while len(self._cache) > self.cache_chunks: self._cache.popitem(last=False)
+        return data
+
+    def locate(self, sim_time):
+        """(bloco, passo) do último frame com tempo <= sim_time (o primeiro, se antes do início)."""
+        if not self.chunks: return None
+        i = max(int(np.searchsorted(self.chunk_start, sim_time, side="right")) - 1, 0)
+        step = max(int(np.searchsorted(self.chunk(i)["time"], sim_time, side="right")) - 1, 0)
+        return i, step
+
+    def frame(self, i, step):
+        data = self.chunk(i)
+        a, b = data["offsets"][step], data["offsets"][step + 1]
+        ids = data["ids"]
+        return Frame(float(data["time"][step]), [ids[v] for v in data["vid"][a:b].tolist()], data["xy"][a:b],
+                     data["angle"][a:b], data["speed"][a:b], data["distance"][a:b],
+                     dict(zip(self.tls_ids, data["tls"][step])), lonlat=data["lonlat"][a:b])
+
+    def frame_at(self, sim_time):
+        pos = self.locate(sim_time)
+        return self.frame(*pos) if pos else None
+
+    def close(self):
+        self._mm.close()
+
+
+_readers = OrderedDict()  # caminho -> leitor, do menos para o mais usado
+_readers_lock = threading.Lock()
+
+
+def _drop(key):
+    """Tira o leitor do cache; o mmap fecha agora ou no último release_trajectory."""
+    reader = _readers.pop(key, None)
+    if reader is not None and reader.refs <= 0: reader.close()
+
+
+def open_trajectory(path):
+    """
+    Leitor compartilhado por arquivo (um mmap e um LRU para todos os replays).
+    Cada chamada precisa de um release_trajectory quando o replay termina.
+    """
+    key = str(path)
+    with _readers_lock:
+        reader = _readers.get(key)
+        if reader is not None and reader.mtime != Path(path).stat().st_mtime:
+            _drop(key)
+            reader = None
+        if reader is None: reader = _readers[key] = TrajectoryReader(path)
+        _readers.move_to_end(key)
+        reader.refs += 1
+        # Acima do limite fecha os menos usados que não estão em replay
+        idle = [k for k, r in _readers.items() if r.refs <= 0]
+        for k in idle[:max(0, len(_readers) - CACHE_READERS)]: _drop(k)
+        return reader
+
+
+def release_trajectory(reader):
+    with _readers_lock:
+        reader.refs -= 1
+        if reader.refs <= 0 and _readers.get(str(reader.path)) is not reader: reader.close()
+
+
+def forget_trajectories(path):
+    """Tira do cache os leitores do arquivo ou de tudo abaixo da pasta (antes de apagar)."""
+    path = Path(path)
+    with _readers_lock:
+        for key in [k for k in _readers if Path(k) == path or path in Path(k).parents]: _drop(key)
+
+
+class ReplayWorker:
+    """
+    Faz o papel do SimulationWorker para o FrameBroadcaster, lendo da gravação:
+    o tempo simulado anda com o relógio x speed e o frame daquele tempo vai para
+    o FrameBuffer. Sem SUMO e sem vaga no ConnectionManager. No fim da gravação
+    fica parado no último frame (o cliente ainda pode voltar com seek).
+    """
+
+    def __init__(self, reader, speed=1.0, fps=20.0, start=None):
+        self.reader = reader
+        self.speed = parse_speed(speed)
+        self.interval = 1.0 / max(fps, 0.1)
+        self.buffer = FrameBuffer()
+        self.stop_requested = False
+        self.paused = False
+        self.sim_time = reader.start if start is None else min(max(float(start), reader.start), reader.end)
+        self._finished = False
+        self._jumped = False
+        self._wake = asyncio.Event()
+
+    def is_alive(self):
+        return not self._finished
+
+    def stop(self):
+        self.stop_requested = True
+        self._wake.set()
+
+    def seek(self, sim_time):
+        self.sim_time = min(max(float(sim_time), self.reader.start), self.reader.end)
+        self._jumped = True
+        self._wake.set()
+
+    def set_speed(self, speed):
+        self.speed = parse_speed(speed)
+        self._wake.set()
+
+    def control(self, msg):
+        """Mensagens do cliente: {"seek": t}, {"speed": "4x"}, {"pause": true|false}."""
+        if "seek" in msg: self.seek(msg["seek"])
+        if "speed" in msg: self.set_speed(msg["speed"])
+        if "pause" in msg:
+            self.paused = bool(msg["pause"])
+            self._wake.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        last = None
+        last_wall = loop.time()
+        try:
+            while not self.stop_requested:
+                now = loop.time()
+                # speed 0 ("max") no replay = o mais rápido que o cliente recebe: um passo por intervalo
+                if self._jumped: self._jumped = False
+                elif not self.paused:
+                    if self.speed: self.sim_time += (now - last_wall) * self.speed
+                    elif last is not None: self.sim_time = self._next_time(last)
+                    self.sim_time = min(self.sim_time, self.reader.end)
+                last_wall = now
+                pos = await asyncio.to_thread(self.reader.locate, self.sim_time)
+                if pos is None: break
+                if pos != last:
+                    self.buffer.push(await asyncio.to_thread(self.reader.frame, *pos))
+                    last = pos
+                self._wake.clear()
+                try: await asyncio.wait_for(self._wake.wait(), self.interval)
+                except asyncio.TimeoutError: pass
+        finally:
+            self._finished = True
+
+    def _next_time(self, pos):
+        i, step = pos
+        times = self.reader.chunk(i)["time"]
+        if step + 1 < len(times): return float(times[step + 1])
+        return self.reader.chunks[i + 1]["t0"] if i + 1 < len(self.reader.chunks) else self.reader.end